@@ -5,6 +5,13 @@ Claude Resume - A web-based viewer for Claude chat history
 __version__ = "1.0.0"
 __author__ = "Nik"
 
-from .server import ChatHistoryHandler, main
+__all__ = ["ChatHistoryHandler", "main"]
 
-__all__ = ["ChatHistoryHandler", "main"]
\ No newline at end of file
+
+def __getattr__(name):
+    # The server pulls in http.server and the rest of the web stack, so it is only
+    # imported once one of its names is used; command-line subcommands never need it
+    if name in __all__:
+        from . import server
+        return getattr(server, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
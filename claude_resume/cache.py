@@ -0,0 +1,71 @@
+"""
+Query-result cache for Claude Resume
+A size-bounded LRU of search result sets, valid for a single index generation
+"""
+import threading
+from collections import OrderedDict
+
+from . import metrics
+
+# Result sets kept before the least recently used one is dropped
+QUERY_CACHE_SIZE = 128
+
+
+class QueryCache:
+    """LRU of result sets keyed by normalized query; everything is dropped when the index generation moves on"""
+
+    def __init__(self, size=QUERY_CACHE_SIZE):
+        self.size = size
+        self.generation = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_generation(self, generation):
+        """Whether generation is current, dropping everything when it is newer
+
+        A request that read an older generation before a refresh must not wipe
+        the entries of the current one.
+        """
+        if self.generation is not None and generation < self.generation:
+            return False
+        if generation != self.generation:
+            self._entries.clear()
+            self.generation = generation
+        return True
+
+    def get(self, generation, key, record=True):
+        """The value cached for key at this generation, or None
+
+        With record False the lookup is left out of the hit/miss metrics, for
+        callers that record their own outcome once they know it.
+        """
+        with self._lock:
+            value = self._entries.get(key) if self._check_generation(generation) else None
+            if value is not None:
+                self._entries.move_to_end(key)
+            if record:
+                metrics.QUERY_CACHE_LOOKUPS.inc(result='miss' if value is None else 'hit')
+            return value
+
+    def put(self, generation, key, value):
+        with self._lock:
+            if not self._check_generation(generation):
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def find(self, generation, predicate):
+        """The most recently used (key, value) at this generation for which predicate(key, value) holds, or None"""
+        with self._lock:
+            if not self._check_generation(generation):
+                return None
+            for key in reversed(self._entries):
+                if predicate(key, self._entries[key]):
+                    self._entries.move_to_end(key)
+                    return key, self._entries[key]
+        return None
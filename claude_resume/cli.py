@@ -4,9 +4,339 @@ Claude Resume CLI - Command line interface for Claude chat history viewer
 """
 
 import argparse
+import json
+import os
+import re
+import shlex
 import sys
+import time
 from pathlib import Path
-from .server import main as server_main
+
+from .search import SEARCH_MODES
+
+# ANSI styles for terminal output; only used when stdout is a terminal and NO_COLOR is unset
+BOLD = '\033[1m'
+DIM = '\033[2m'
+MATCH = '\033[1;33m'
+RESET = '\033[0m'
+
+# Snippets are cropped to about this many characters, around their first match
+SNIPPET_WIDTH = 160
+
+# Titles in `list` output are cut to this many characters
+LIST_TITLE_WIDTH = 120
+
+# `list` writes its lines in batches of this many, flushing after each
+LIST_BATCH_SIZE = 500
+
+# Relative --since values: a number and one of these units, e.g. 90m, 12h, 7d, 2w
+SINCE_RE = re.compile(r'^(\d+)([mhdw])$')
+SINCE_UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def use_color():
+    return sys.stdout.isatty() and not os.environ.get('NO_COLOR')
+
+
+def style(text, code, color):
+    return f'{code}{text}{RESET}' if color else text
+
+
+def resume_command(chat):
+    """Shell command that resumes a chat in its working directory"""
+    if chat['cwd'] and chat['cwd'] != 'Unknown':
+        return f"cd {shlex.quote(chat['cwd'])} && claude --resume {chat['id']}"
+    return f"claude --resume {chat['id']}"
+
+
+def format_age(ts):
+    """Rough age of an epoch-ms timestamp, like the web page shows"""
+    if ts is None:
+        return 'unknown time'
+    seconds = max(time.time() - ts / 1000, 0)
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size:
+            return f'{int(seconds // size)}{unit} ago'
+    return 'just now'
+
+
+def format_snippet(snippet, color):
+    """One line of a snippet, cropped around its first match, with matches highlighted and newlines folded"""
+    text = snippet['text']
+    first = snippet['matches'][0][0] if snippet['matches'] else 0
+    crop_start = max(0, min(first - SNIPPET_WIDTH // 4, len(text) - SNIPPET_WIDTH))
+    crop_end = min(len(text), crop_start + SNIPPET_WIDTH)
+    parts = []
+    last = crop_start
+    for start, end in snippet['matches']:
+        if start < crop_start or end > crop_end:
+            continue
+        parts.append(text[last:start])
+        parts.append(style(text[start:end], MATCH, color))
+        last = end
+    parts.append(text[last:crop_end])
+    line = re.sub(r'\s+', ' ', ''.join(parts)).strip()
+    before = snippet['offset'] > 0 or crop_start > 0
+    after = snippet['more'] or crop_end < len(text)
+    return ('…' if before else '') + line + ('…' if after else '')
+
+
+def attach(args, sections):
+    """The running daemon's index if there is one, else the on-disk snapshot loaded with the given sections"""
+    from .daemon import RemoteIndex, connect
+
+    client = None if args.no_daemon else connect()
+    if client is not None:
+        return RemoteIndex(client)
+    from .store import open_index
+    return open_index(args.index, sections=sections)
+
+
+def run_search(args):
+    """claude-resume search: rank sessions from the daemon or the on-disk index and print how to resume them"""
+    from .store import SEARCH_SECTIONS
+    from .utils import chat_metadata
+
+    index = attach(args, SEARCH_SECTIONS)
+    scope = os.getcwd() if args.here else None
+    try:
+        response = index.search(' '.join(args.query), args.mode, args.project, args.limit,
+                                snippets=args.snippets, scope=scope)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        index.close()
+
+    found = response['snippets']
+    color = use_color()
+    for rank, (chat, score) in enumerate(response['results'], 1):
+        chat_snippets = found.get(chat['id'], {'hits': 0, 'snippets': []})
+        if args.json:
+            print(json.dumps(dict(chat_metadata(chat), score=round(score, 4), resumeCommand=resume_command(chat),
+                                 **chat_snippets)))
+            continue
+        title = chat['summary'] or re.sub(r'\s+', ' ', chat['firstMessage'])[:100]
+        details = [chat['project'], f"{chat['messageCount']} messages", format_age(chat['endTs'])]
+        if chat_snippets['hits']:
+            details.append(f"{chat_snippets['hits']} match{'es' if chat_snippets['hits'] > 1 else ''}")
+        print(f"{rank}. {style(title, BOLD, color)}")
+        print(f"   {style(' · '.join(details), DIM, color)}")
+        for snippet in chat_snippets['snippets']:
+            print(f"   {format_snippet(snippet, color)}")
+        print(f"   {resume_command(chat)}")
+        print()
+    if not args.json:
+        shown = len(response['results'])
+        total = response['total']
+        if total is None:
+            # A regex scan stopped at --limit or its time budget before reaching every session
+            summary = (f"{shown}+ matching sessions (more available)" if response.get('cursor')
+                       else f"{shown} matching sessions before the scan timed out")
+        elif total > shown:
+            summary = f"{shown} of {total} matching sessions"
+        else:
+            summary = f"{shown} matching session{'s' if shown != 1 else ''}"
+        print(style(summary, DIM, color))
+    return 0 if response['results'] else 1
+
+
+def non_negative_int(value):
+    """argparse type for counts such as --limit, rejecting negatives the way the server's int_param does"""
+    if not value.strip().isdigit():
+        raise argparse.ArgumentTypeError(f"must be a non-negative integer, got '{value}'")
+    return int(value)
+
+
+def parse_since(value):
+    """Epoch-ms cutoff for --since: a relative age (90m, 12h, 7d, 2w) or an ISO date or timestamp"""
+    from .utils import parse_timestamp
+
+    match = SINCE_RE.match(value.strip())
+    if match:
+        return int((time.time() - int(match.group(1)) * SINCE_UNITS[match.group(2)]) * 1000)
+    ts = parse_timestamp(value.strip())
+    if ts is None:
+        raise argparse.ArgumentTypeError(f"expected an age like 7d or an ISO date, got '{value}'")
+    return ts
+
+
+def list_line(chat):
+    """Tab-separated id, project, end time, title and working directory, for cut/fzf/awk"""
+    title = chat['summary'] or chat['firstMessage']
+    title = re.sub(r'\s+', ' ', title).strip()[:LIST_TITLE_WIDTH]
+    fields = (chat['id'], chat['project'], chat['endTime'], title, chat['cwd'])
+    return '\t'.join(field.replace('\t', ' ') for field in fields)
+
+
+def run_list(args):
+    """claude-resume list: every session, newest first, one line each"""
+    from .utils import chat_metadata
+
+    # Listing needs only chat metadata; transcripts and the search index stay on disk
+    index = attach(args, ('filters',) if args.here else ())
+    chats, _ = index.chats('recent', os.getcwd() if args.here else None, transcripts=False)
+    if args.since is not None:
+        chats = [chat for chat in chats if chat['endTs'] is not None and chat['endTs'] >= args.since]
+
+    format_line = (lambda chat: json.dumps(dict(chat_metadata(chat), resumeCommand=resume_command(chat)))) \
+        if args.json else list_line
+    for start in range(0, len(chats), LIST_BATCH_SIZE):
+        sys.stdout.write(''.join(format_line(chat) + '\n' for chat in chats[start:start + LIST_BATCH_SIZE]))
+        sys.stdout.flush()
+    return 0 if chats else 1
+
+
+def export_progress(done, total):
+    """Progress line on a terminal's stderr, redrawn in place"""
+    if done == total or done % 50 == 0:
+        print(f"\rExported {done}/{total} sessions", end='\n' if done == total else '', file=sys.stderr, flush=True)
+
+
+def run_export(args):
+    """claude-resume export: write matching sessions out as JSONL, Markdown or Parquet"""
+    from . import export
+    from .store import SEARCH_SECTIONS, open_index
+
+    output = args.output or ('-' if args.format == 'jsonl' else None)
+    if output is None:
+        print(f"Error: --output DIRECTORY is required for {args.format} export", file=sys.stderr)
+        return 2
+    query = ' '.join(args.query)
+    sections = SEARCH_SECTIONS if query else ('filters',) if args.here else ()
+    index = open_index(args.index, sections=sections)
+    scope = os.getcwd() if args.here else None
+    try:
+        sessions = export.select_sessions(index, query, args.project, args.since, scope)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    # Recorded in the checkpoint: resuming is only allowed for the same selection
+    selection = {'query': query, 'project': args.project, 'since': args.since, 'scope': scope}
+    progress = export_progress if sys.stderr.isatty() and output != '-' else None
+    try:
+        stats = export.run_export(sessions, args.format, output, selection, args.jobs, args.restart, progress)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        if output != '-':
+            print("\nInterrupted; run the same command again to resume", file=sys.stderr)
+        return 130
+    for error in stats['errors']:
+        print(f"Skipped {error}", file=sys.stderr)
+    summary = f"Exported {stats['sessions']} sessions in {stats['seconds']:.2f}s"
+    if stats['skipped']:
+        summary += f" ({stats['skipped']} already exported before the interruption)"
+    print(summary + ('' if output == '-' else f" to {output}"), file=sys.stderr)
+    return 0 if sessions else 1
+
+
+def format_size(size):
+    """Byte count in the largest unit that keeps it above 1"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+def format_build(build):
+    """One line of build throughput: files and bytes parsed, time taken and rates"""
+    if not build:
+        return 'no build recorded'
+    seconds = max(build['seconds'], 1e-6)
+    return (f"{build['files']} files ({format_size(build['bytes'])}) parsed in {build['seconds']:.2f}s, "
+            f"{build['files'] / seconds:.0f} files/s, {format_size(build['bytes'] / seconds)}/s")
+
+
+def print_stats(stats):
+    print(f"Snapshot:  {stats['path']} ({format_size(stats['size'])}, saved {format_age(stats['savedAt'] * 1000)})")
+    print(f"Projects:  {stats['projectsDir']}")
+    print(f"Sessions:  {stats['sessions']} in {stats['files']} files, {format_size(stats['bytes'])} of chat history")
+    print(f"Sections:  {', '.join(f'{name} {format_size(size)}' for name, size in stats['sections'].items())}")
+    print(f"Build:     {format_build(stats['build'])}")
+    if stats['changed']:
+        print(f"Changes:   {stats['changed']} files changed on disk since; run 'claude-resume index update'")
+
+
+def run_index(args):
+    """claude-resume index: build, refresh, inspect, verify or compact the on-disk index"""
+    from .store import default_path, snapshot_stats, update_snapshot, vacuum_snapshot, verify_snapshot
+
+    path = args.index or default_path()
+    if args.action in ('build', 'update'):
+        build = update_snapshot(path, rebuild=args.action == 'build')
+        print(f"Indexed {format_build(build)}" if build['files'] else 'Index is up to date')
+        print_stats(snapshot_stats(path))
+        return 0
+
+    if args.action == 'stats':
+        stats = snapshot_stats(path)
+        if stats is None:
+            print(f"No usable index snapshot at {path}; run 'claude-resume index build'", file=sys.stderr)
+            return 1
+        if args.json:
+            print(json.dumps(stats))
+        else:
+            print_stats(stats)
+        return 0
+
+    if args.action == 'verify':
+        report = verify_snapshot(path, deep=not args.quick)
+        for problem in report['problems']:
+            print(f"Problem: {problem}")
+        for label in ('new', 'modified', 'missing'):
+            for key in report[label]:
+                print(f"Out of date ({label}): {key}")
+        stale = sum(len(report[label]) for label in ('new', 'modified', 'missing'))
+        summary = f"{len(report['problems'])} problems"
+        if report['checked']:
+            summary += f", {report['checked']} sessions re-parsed and compared"
+        if stale:
+            summary += f", {stale} files changed since the snapshot (run 'claude-resume index update')"
+        print(summary)
+        return 1 if report['problems'] else 0
+
+    try:
+        before, after, stray = vacuum_snapshot(path)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Compacted {path}: {format_size(before)} -> {format_size(after)}"
+          + (f", removed {stray} leftover temporary files" if stray else ''))
+    return 0
+
+
+def run_daemon(args):
+    """claude-resume daemon: serve the index from memory, or report on or stop a running daemon"""
+    from .daemon import connect, default_socket_path, run_daemon
+
+    if args.action == 'start':
+        return run_daemon(args.index, watch_interval=args.interval)
+    client = connect()
+    if client is None:
+        print(f"No daemon is running at {default_socket_path()}", file=sys.stderr)
+        return 1
+    if args.action == 'stop':
+        print(f"Stopped the daemon (pid {client.call('stop')['result']['pid']})")
+        return 0
+    status = client.call('status')['result']
+    print(f"Daemon:    pid {status['pid']}, listening on {client.path}, "
+          f"up {format_age(status['startedAt'] * 1000).replace(' ago', '')}")
+    print(f"Projects:  {status['projectsDir']}")
+    print(f"Sessions:  {status['sessions']} in {status['files']} files")
+    print(f"Snapshot:  {status['snapshot']}")
+    return 0
+
+
+def run_command(command, args):
+    """Run a subcommand, exiting quietly if the reader of its output goes away (e.g. | head)"""
+    try:
+        return command(args)
+    except BrokenPipeError:
+        # Point stdout at devnull so the interpreter's final flush does not fail again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
 
 
 def main():
@@ -19,6 +349,15 @@ Examples:
   claude-resume                    # Start the server on default port 8888
   claude-resume --port 9000        # Start on custom port
   claude-resume --no-browser       # Don't auto-open browser
+  claude-resume --trace            # Log per-request phase timings
+  claude-resume search "connection reset" project:api
+                                   # Search from the terminal, no server needed
+  claude-resume list --since 7d | fzf | cut -f1
+                                   # Pick a recent session id
+  claude-resume index stats        # Show what the on-disk index holds
+  claude-resume daemon &           # Keep the index in memory; other commands attach to it
+  claude-resume export -f markdown -o ~/chat-archive project:api
+                                   # Archive sessions as Markdown files
   claude-resume --help             # Show this help message
 
 The viewer will read chat history from ~/.claude/projects/
@@ -45,12 +384,80 @@ and provide a web interface to browse, search, and resume conversations.
         help='Host to bind the server to (default: localhost)'
     )
     
+    parser.add_argument(
+        '--trace',
+        action='store_true',
+        help='Log per-request phase timings and the slowest files'
+    )
+    
     parser.add_argument(
         '--version', '-v',
         action='version',
         version='%(prog)s 1.0.0'
     )
     
+    parser.add_argument(
+        '--index',
+        default=None,
+        help='Index snapshot file used by subcommands (default: $CLAUDE_RESUME_INDEX or ~/.cache/claude-resume/index.bin)'
+    )
+    
+    parser.add_argument(
+        '--no-daemon',
+        action='store_true',
+        help="Don't attach to a running claude-resume daemon; read the chat files or snapshot directly"
+    )
+    
+    subcommands = parser.add_subparsers(dest='command', metavar='command')
+    
+    search = subcommands.add_parser('search', help='Search chat history and print resume commands')
+    search.add_argument('query', nargs='+', help='Search query; accepts the same filters as the web page')
+    search.add_argument('--mode', '-m', choices=SEARCH_MODES, default='ranked', help='Search mode (default: ranked)')
+    search.add_argument('--limit', '-n', type=non_negative_int, default=10, help='Sessions to show (default: 10)')
+    search.add_argument('--project', default=None, help='Only sessions in this project')
+    search.add_argument('--here', action='store_true', help='Only sessions started in this directory or below it')
+    search.add_argument('--snippets', type=non_negative_int, default=1, help='Snippets to show per session (default: 1)')
+    search.add_argument('--json', action='store_true', help='Print one JSON object per session')
+    
+    listing = subcommands.add_parser('list', help='Print every session, newest first, one line each')
+    listing.add_argument('--since', type=parse_since, default=None,
+                         help='Only sessions active since an age (90m, 12h, 7d, 2w) or an ISO date')
+    listing.add_argument('--here', action='store_true', help='Only sessions started in this directory or below it')
+    listing.add_argument('--json', action='store_true', help='Print one JSON object per session')
+    
+    export = subcommands.add_parser('export', help='Write sessions out as JSONL, Markdown or Parquet')
+    export.add_argument('query', nargs='*', help='Only sessions matching this search query (default: all)')
+    export.add_argument('--format', '-f', choices=('jsonl', 'markdown', 'parquet'), default='jsonl',
+                        help='jsonl: one session per line; markdown: a file per session; '
+                             'parquet: a row per message, needs pyarrow (default: jsonl)')
+    export.add_argument('--output', '-o', default=None,
+                        help="JSONL file ('-' for stdout, the default), or a directory for markdown and parquet")
+    export.add_argument('--project', default=None, help='Only sessions in this project')
+    export.add_argument('--since', type=parse_since, default=None,
+                        help='Only sessions active since an age (90m, 12h, 7d, 2w) or an ISO date')
+    export.add_argument('--here', action='store_true', help='Only sessions started in this directory or below it')
+    export.add_argument('--jobs', '-j', type=int, default=min(os.cpu_count() or 1, 4),
+                        help='Worker processes parsing sessions (default: up to 4)')
+    export.add_argument('--restart', action='store_true',
+                        help='Start over instead of resuming an interrupted export to the same output')
+    
+    index = subcommands.add_parser('index', help='Build, refresh, inspect, verify or compact the on-disk index')
+    actions = index.add_subparsers(dest='action', metavar='action', required=True)
+    actions.add_parser('build', help='Build the index from scratch, re-parsing every chat file')
+    actions.add_parser('update', help='Re-parse chat files that changed since the last build')
+    stats = actions.add_parser('stats', help='Show files, bytes, sessions, index size and build throughput')
+    stats.add_argument('--json', action='store_true', help='Print the stats as a JSON object')
+    verify = actions.add_parser('verify', help='Check the index for damage and compare it with the chat files')
+    verify.add_argument('--quick', action='store_true',
+                        help='Only check the index itself and file sizes and times, without re-parsing')
+    actions.add_parser('vacuum', help='Rewrite the index without accumulated garbage')
+    
+    daemon = subcommands.add_parser('daemon', help='Keep the index in memory and serve it to other commands')
+    daemon.add_argument('action', nargs='?', choices=('start', 'status', 'stop'), default='start',
+                        help='start (the default) runs in the foreground until stopped')
+    daemon.add_argument('--interval', type=float, default=2.0,
+                        help='Seconds between checks for changed chat files (default: 2)')
+    
     args = parser.parse_args()
     
     # Check if Claude projects directory exists
@@ -60,12 +467,25 @@ and provide a web interface to browse, search, and resume conversations.
         print("Please ensure Claude Code is installed and has been used to create projects.")
         sys.exit(1)
     
+    if args.command == 'search':
+        sys.exit(run_command(run_search, args))
+    if args.command == 'list':
+        sys.exit(run_command(run_list, args))
+    if args.command == 'index':
+        sys.exit(run_command(run_index, args))
+    if args.command == 'export':
+        sys.exit(run_command(run_export, args))
+    if args.command == 'daemon':
+        sys.exit(run_command(run_daemon, args))
+    
     # Run the server with options
     try:
-        import os
+        from .server import main as server_main
         os.environ['CLAUDE_RESUME_PORT'] = str(args.port)
         os.environ['CLAUDE_RESUME_HOST'] = args.host
         os.environ['CLAUDE_RESUME_NO_BROWSER'] = '1' if args.no_browser else '0'
+        os.environ['CLAUDE_RESUME_TRACE'] = '1' if args.trace else '0'
+        os.environ['CLAUDE_RESUME_NO_DAEMON'] = '1' if args.no_daemon else '0'
         
         server_main()
     except KeyboardInterrupt:
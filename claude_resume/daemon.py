@@ -0,0 +1,384 @@
+"""
+Resident index daemon for Claude Resume
+Keeps the chat index in memory, refreshes it as chat files change, and answers list, search
+and transcript queries from the command line and the web server over a Unix domain socket.
+Each message is a JSON object preceded by its length as a 4-byte big-endian integer.
+"""
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Bumped when requests or replies change incompatibly; clients ignore a daemon speaking another version
+PROTOCOL_VERSION = 1
+
+FRAME_HEADER = struct.Struct('>I')
+
+# Larger frames are refused rather than buffered
+MAX_FRAME_BYTES = 1024 * 1024 * 1024
+
+# Chats sent per frame when a reply is streamed
+STREAM_BATCH_SIZE = 200
+
+# How long a client waits to connect, and then for each reply frame (a regex search may take its budget)
+CONNECT_TIMEOUT = 0.5
+REPLY_TIMEOUT = 30
+
+# Seconds between checks of the projects directory for changed chat files
+DEFAULT_WATCH_INTERVAL = 2.0
+
+# A changed index is written back to the snapshot at most this often, and on shutdown
+SAVE_INTERVAL = 300
+
+
+class DaemonError(ValueError):
+    """A request the daemon rejected; carries the daemon's message"""
+
+
+def default_socket_path():
+    """Socket location: $CLAUDE_RESUME_SOCKET, or daemon.sock in the claude-resume cache directory
+
+    The cache directory is the one holding the default index snapshot (see store.default_path).
+    """
+    if os.environ.get('CLAUDE_RESUME_SOCKET'):
+        return Path(os.environ['CLAUDE_RESUME_SOCKET']).expanduser()
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_dir) / 'claude-resume' / 'daemon.sock'
+
+
+def write_frame(stream, message):
+    data = json.dumps(message).encode()
+    stream.write(FRAME_HEADER.pack(len(data)))
+    stream.write(data)
+    stream.flush()
+
+
+def read_frame(stream):
+    """Next message from a stream, or None at a clean end of stream"""
+    header = stream.read(FRAME_HEADER.size)
+    if not header:
+        return None
+    if len(header) != FRAME_HEADER.size:
+        raise ConnectionError("Connection closed inside a frame header")
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_BYTES:
+        raise ConnectionError(f"Frame of {size} bytes exceeds the {MAX_FRAME_BYTES} byte limit")
+    data = stream.read(size)
+    if len(data) != size:
+        raise ConnectionError("Connection closed inside a frame")
+    return json.loads(data)
+
+
+class DaemonClient:
+    """Sends requests to a running daemon, one connection per request so it is safe to share between threads"""
+
+    def __init__(self, path=None):
+        self.path = str(path or default_socket_path())
+
+    def stream(self, op, **args):
+        """Send a request and yield the result of each reply frame; the last one is the final reply
+
+        Raises DaemonError if the daemon rejects the request and OSError if it
+        cannot be reached.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(self.path)
+            sock.settimeout(REPLY_TIMEOUT)
+            with sock.makefile('rwb') as stream:
+                write_frame(stream, {'op': op, 'args': args})
+                while True:
+                    reply = read_frame(stream)
+                    if reply is None:
+                        raise ConnectionError("Daemon closed the connection before replying")
+                    if not reply['ok']:
+                        raise DaemonError(reply['error'])
+                    yield reply
+                    if not reply.get('more'):
+                        return
+
+    def call(self, op, **args):
+        """Send a request and return its final reply {'ok', 'result', 'generation', 'indexId'}"""
+        for reply in self.stream(op, **args):
+            pass
+        return reply
+
+
+def connect(path=None):
+    """A client for the daemon listening at path, or None if none is running there"""
+    client = DaemonClient(path)
+    try:
+        status = client.call('status')['result']
+    except (OSError, ValueError):
+        return None
+    return client if status.get('protocol') == PROTOCOL_VERSION else None
+
+
+class RemoteIndex:
+    """Stands in for a ChatIndex, forwarding each call to the daemon
+
+    Calls are scoped to the given directory unless they pass their own scope,
+    as a local index built with current_dir would be. generation and index_id
+    follow the latest reply.
+    """
+
+    def __init__(self, client, scope=None):
+        self.client = client
+        self.scope = scope
+        self.ready = threading.Event()
+        self.ready.set()
+        self.generation = 0
+        self.index_id = None
+
+    def _update(self, reply):
+        self.generation = reply['generation']
+        self.index_id = reply['indexId']
+        return reply['result']
+
+    def _call(self, op, **args):
+        return self._update(self.client.call(op, **args))
+
+    def _scope(self, scope):
+        return self.scope if scope is None else scope
+
+    def close(self):
+        pass
+
+    def wait_ready(self, timeout=None):
+        # The daemon only listens once its index is loaded
+        return True
+
+    def refresh(self, trace=None):
+        return self._call('refresh')['changed']
+
+    def _chats(self, scope, **args):
+        chats = []
+        for reply in self.client.stream('chats', scope=self._scope(scope), **args):
+            if reply.get('more'):
+                chats.extend(reply['result'])
+            else:
+                return chats, self._update(reply)
+
+    def chats(self, sort='start', scope=None, transcripts=True):
+        chats, result = self._chats(scope, sort=sort, transcripts=transcripts)
+        return chats, set(result['projects'])
+
+    def changes_since(self, generation, sort='start', scope=None, transcripts=True):
+        chats, result = self._chats(scope, sort=sort, since=generation, transcripts=transcripts)
+        return chats, result['removed']
+
+    def chat_page(self, sort='start', offset=0, limit=None, scope=None):
+        # Only the page crosses the socket
+        result = self._call('page', sort=sort, offset=offset, limit=limit, scope=self._scope(scope))
+        return result['chats'], result['total'], set(result['projects'])
+
+    def get_chat(self, chat_id, scope=None):
+        return self._call('chat', id=chat_id, scope=self._scope(scope))
+
+    def related(self, chat_id, limit=10, scope=None):
+        return [tuple(item) for item in self._call('related', id=chat_id, limit=limit, scope=self._scope(scope))]
+
+    def suggest(self, prefix, limit=10):
+        return self._call('suggest', prefix=prefix, limit=limit)
+
+    def duplicate_clusters(self, scope=None):
+        return self._call('duplicates', scope=self._scope(scope))
+
+    def search(self, query, mode='ranked', project=None, limit=50, offset=0, cursor=None, budget_ms=None,
+               snippets=None, scope=None):
+        response = self._call('search', query=query, mode=mode, project=project, limit=limit, offset=offset,
+                              cursor=cursor, budgetMs=budget_ms, snippets=snippets, scope=self._scope(scope))
+        response['results'] = [tuple(item) for item in response['results']]
+        return response
+
+    def facet_summary(self, scope=None):
+        return self._call('facets', scope=self._scope(scope))
+
+    def progress(self):
+        return self._call('progress')
+
+
+class Daemon:
+    """Owns the resident index: answers requests, watches for changed files, saves the snapshot"""
+
+    def __init__(self, index, snapshot_path, watch_interval=DEFAULT_WATCH_INTERVAL):
+        self.index = index
+        self.snapshot_path = snapshot_path
+        self.watch_interval = watch_interval
+        self.started = time.time()
+        self.stopping = threading.Event()
+        self.server = None
+        # Set when the index changed since the snapshot was last written
+        self.dirty = False
+        self.saved_at = time.monotonic()
+
+    def status(self):
+        return {'protocol': PROTOCOL_VERSION, 'pid': os.getpid(), 'projectsDir': str(self.index.projects_dir),
+                'snapshot': str(self.snapshot_path), 'startedAt': self.started,
+                'sessions': len(self.index.ids), 'files': len(self.index.entries)}
+
+    def refresh(self):
+        changed = self.index.refresh()
+        if changed:
+            self.dirty = True
+        return changed
+
+    def save(self):
+        """Write the index back to the snapshot, keeping the build stats recorded there"""
+        from .store import read_header, save_index
+        header = read_header(self.snapshot_path)
+        save_index(self.index, self.snapshot_path, header and header['build'])
+        self.dirty = False
+        self.saved_at = time.monotonic()
+
+    def watch(self):
+        """Watcher thread: refresh when chat files change, save now and then"""
+        from .store import file_table
+        while not self.stopping.wait(self.watch_interval):
+            try:
+                with self.index._lock:
+                    known = {key: (entry['mtime'], entry['size']) for key, entry in self.index.entries.items()}
+                # A stat of every file is much cheaper than refresh()'s walk when nothing changed
+                if file_table(self.index.projects_dir) != known:
+                    self.refresh()
+                if self.dirty and time.monotonic() - self.saved_at >= SAVE_INTERVAL:
+                    self.save()
+            except Exception as e:
+                print(f"Error refreshing the index: {e}", file=sys.stderr)
+
+    def handle(self, request):
+        """Yield reply frames for one request; every frame but the last has 'more' set"""
+        op = request.get('op')
+        args = request.get('args') or {}
+        from .utils import chat_metadata
+
+        index = self.index
+        if op == 'chats':
+            if args.get('since') is not None:
+                chats, removed = index.changes_since(args['since'], args.get('sort', 'start'), args.get('scope'),
+                                                     args.get('transcripts', True))
+                projects = None
+            else:
+                chats, projects = index.chats(args.get('sort', 'start'), args.get('scope'),
+                                              args.get('transcripts', True))
+                projects, removed = sorted(projects), None
+            for start in range(0, len(chats), STREAM_BATCH_SIZE):
+                yield {'ok': True, 'more': True, 'result': chats[start:start + STREAM_BATCH_SIZE]}
+            result = {'projects': projects, 'removed': removed}
+        elif op == 'page':
+            chats, total, projects = index.chat_page(args.get('sort', 'start'), args.get('offset', 0),
+                                                     args.get('limit'), args.get('scope'))
+            result = {'chats': chats, 'total': total, 'projects': sorted(projects)}
+        elif op == 'status':
+            result = self.status()
+        elif op == 'chat':
+            result = index.get_chat(args['id'], args.get('scope'))
+        elif op == 'search':
+            options = {name: args[key] for name, key in (('budget_ms', 'budgetMs'), ('snippets', 'snippets'))
+                       if args.get(key) is not None}
+            result = index.search(args['query'], args.get('mode', 'ranked'), args.get('project'),
+                                  args.get('limit', 50), args.get('offset', 0), args.get('cursor'),
+                                  scope=args.get('scope'), **options)
+            # Callers get metadata; transcripts are fetched one chat at a time
+            result['results'] = [(chat_metadata(chat), score) for chat, score in result['results']]
+        elif op == 'related':
+            result = [(chat_metadata(chat), score)
+                      for chat, score in index.related(args['id'], args.get('limit', 10), args.get('scope'))]
+        elif op == 'suggest':
+            result = index.suggest(args.get('prefix', ''), args.get('limit', 10))
+        elif op == 'duplicates':
+            result = index.duplicate_clusters(args.get('scope'))
+        elif op == 'facets':
+            result = index.facet_summary(args.get('scope'))
+        elif op == 'progress':
+            result = index.progress()
+        elif op == 'refresh':
+            result = {'changed': self.refresh()}
+        elif op == 'stop':
+            result = {'pid': os.getpid()}
+            self.stopping.set()
+            # shutdown() waits for serve_forever to return, so it cannot run on a request thread
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        else:
+            raise ValueError(f"Unknown request '{op}'")
+        yield {'ok': True, 'result': result, 'generation': index.generation, 'indexId': index.index_id}
+
+    def serve(self, socket_path):
+        """Listen on socket_path until stopped by a 'stop' request, SIGTERM or Ctrl-C"""
+        import signal
+        import socketserver
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        request = read_frame(self.rfile)
+                    except (ConnectionError, ValueError):
+                        return
+                    if request is None:
+                        return
+                    try:
+                        for reply in daemon.handle(request):
+                            write_frame(self.wfile, reply)
+                    except (BrokenPipeError, ConnectionResetError):
+                        return
+                    except Exception as e:
+                        write_frame(self.wfile, {'ok': False, 'error': str(e) or repr(e)})
+
+        socket_path = Path(socket_path)
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if socket_path.exists() or socket_path.is_symlink():
+            socket_path.unlink()
+        # Transcripts are private: only the owner may connect
+        old_umask = os.umask(0o077)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(str(socket_path), Handler)
+        finally:
+            os.umask(old_umask)
+        self.server.daemon_threads = True
+        watcher = threading.Thread(target=self.watch, name='claude-resume-watch', daemon=True)
+        watcher.start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=self.server.shutdown).start())
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stopping.set()
+            self.server.server_close()
+            if socket_path.exists():
+                socket_path.unlink()
+            self.index.close()
+            if self.dirty:
+                self.save()
+
+
+def run_daemon(snapshot_path=None, socket_path=None, watch_interval=DEFAULT_WATCH_INTERVAL):
+    """Load the index and serve it until stopped; returns an exit status"""
+    from .store import SECTIONS, default_path, open_index, read_header
+
+    socket_path = Path(socket_path or default_socket_path())
+    client = connect(socket_path)
+    if client is not None:
+        print(f"A daemon is already running at {socket_path} (pid {client.call('status')['result']['pid']})",
+              file=sys.stderr)
+        return 1
+    snapshot_path = Path(snapshot_path or default_path())
+    start = time.perf_counter()
+    index = open_index(snapshot_path, sections=SECTIONS)
+    daemon = Daemon(index, snapshot_path, watch_interval)
+    # open_index may have patched in a few changed files without saving them
+    header = read_header(snapshot_path)
+    daemon.dirty = header is None or header['files'] != {
+        key: (entry['mtime'], entry['size']) for key, entry in index.entries.items()}
+    print(f"Loaded {len(index.ids)} sessions in {time.perf_counter() - start:.2f}s; "
+          f"listening on {socket_path} (pid {os.getpid()})")
+    daemon.serve(socket_path)
+    print("Daemon stopped")
+    return 0
@@ -0,0 +1,327 @@
+"""
+Bulk export of chat history
+Re-parses each selected chat file in a pool of worker processes, one file at a time, and
+streams the sessions out as normalized JSONL, per-session Markdown files, or Parquet parts;
+a checkpoint lets an interrupted export pick up where it stopped
+"""
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .index import parse_chat_file
+from .tracing import RequestTrace
+from .utils import BLOCK_FLAGS
+
+# Progress is checkpointed every this many sessions; each Parquet part holds this many
+CHECKPOINT_EVERY = 200
+
+# Sessions handed to a worker at a time
+TASK_CHUNK = 8
+
+# Checkpoint files: next to a JSONL export, or inside a Markdown/Parquet export directory
+CHECKPOINT_SUFFIX = '.checkpoint'
+CHECKPOINT_NAME = '.export-checkpoint'
+
+# Characters kept in Markdown file and directory names
+UNSAFE_NAME_RE = re.compile(r'[^\w.-]+')
+
+
+def select_sessions(index, query=None, project=None, since=None, scope=None):
+    """[(path, project)] of chat files whose sessions match, oldest first
+
+    query takes the same syntax as search (filters, phrases, free text); scope
+    is a directory whose sessions are kept, as for the server's current directory.
+    """
+    if query:
+        response = index.search(query, 'ranked', project, limit=len(index.ids), snippets=0, scope=scope)
+        chats = [chat for chat, _ in response['results']]
+    else:
+        chats, _ = index.chats('start')
+        if project:
+            chats = [chat for chat in chats if chat['project'] == project]
+        if scope is not None:
+            visible = index.filter_index.scope(scope)
+            chats = [chat for chat in chats if chat['id'] in visible]
+    if since is not None:
+        chats = [chat for chat in chats if chat['endTs'] is not None and chat['endTs'] >= since]
+    chats.sort(key=lambda chat: (chat['startTs'] or 0, chat['id']))
+    return [(index.ids[chat['id']], chat['project']) for chat in chats if chat['id'] in index.ids]
+
+
+def session_record(chat):
+    """Normalized export record: session metadata plus its messages, block flags spelled out"""
+    record = {name: value for name, value in chat.items() if name != 'messages'}
+    record['messages'] = [{'role': msg['role'], 'ts': msg['ts'], 'text': msg['text'],
+                           'blocks': [name for name, flag in BLOCK_FLAGS.items() if msg['flags'] & flag]}
+                          for msg in chat['messages']]
+    return record
+
+
+def format_ts(ts):
+    return datetime.fromtimestamp(ts / 1000, timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC') if ts else 'unknown time'
+
+
+def session_markdown(record):
+    """A session as a Markdown document: title, details, then one section per message"""
+    title = record['summary'] or re.sub(r'\s+', ' ', record['firstMessage'])[:100]
+    lines = [f"# {title}", '',
+             f"- Session: `{record['id']}`",
+             f"- Project: {record['project']}",
+             f"- Directory: `{record['cwd']}`",
+             f"- Time: {format_ts(record['startTs'])} to {format_ts(record['endTs'])}",
+             f"- Messages: {record['messageCount']}",
+             '']
+    for msg in record['messages']:
+        blocks = [name for name in msg['blocks'] if name != 'text']
+        heading = f"## {msg['role'].capitalize() or 'Message'} · {format_ts(msg['ts'])}"
+        lines += [heading + (f" · {', '.join(blocks)}" if blocks else ''), '', msg['text'] or '_(no text)_', '']
+    return '\n'.join(lines)
+
+
+def markdown_path(directory, record):
+    """Where a session's Markdown file goes: <directory>/<project>/<session id>.md"""
+    project = UNSAFE_NAME_RE.sub('-', record['project']) or 'unknown'
+    return Path(directory) / project / f"{UNSAFE_NAME_RE.sub('-', record['id'])}.md"
+
+
+def parquet_columns(record):
+    """One row per message, as {column: [values]}"""
+    messages = record['messages']
+    return {
+        'session_id': [record['id']] * len(messages),
+        'project': [record['project']] * len(messages),
+        'cwd': [record['cwd']] * len(messages),
+        'summary': [record['summary']] * len(messages),
+        'message_index': list(range(len(messages))),
+        'role': [msg['role'] for msg in messages],
+        'timestamp': [msg['ts'] for msg in messages],
+        'text': [msg['text'] for msg in messages],
+        'blocks': [msg['blocks'] for msg in messages],
+    }
+
+
+def ignore_interrupts():
+    """Worker initializer: Ctrl-C reaches the whole process group, but only the parent acts on it"""
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def export_session(task):
+    """Worker entry point: parse one chat file and render it for the given format
+
+    Returns (path, payload, error). payload is None when the file holds no
+    usable chat; otherwise it is a JSONL line, the Markdown file written, or
+    Parquet columns.
+    """
+    path, project, fmt, directory = task
+    try:
+        chat = parse_chat_file(Path(path), project, RequestTrace())
+    except Exception as e:
+        return path, None, str(e)
+    if chat is None:
+        return path, None, None
+    chat.pop('toolText', None)
+    record = session_record(chat)
+    if fmt == 'jsonl':
+        return path, json.dumps(record, ensure_ascii=False) + '\n', None
+    if fmt == 'parquet':
+        return path, parquet_columns(record), None
+    target = markdown_path(directory, record)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f'{target.name}.{os.getpid()}.tmp')
+    tmp.write_text(session_markdown(record), encoding='utf-8')
+    os.replace(tmp, target)
+    return path, str(target), None
+
+
+def parquet_schema():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ValueError("Parquet export needs pyarrow: pip install 'claude-resume[parquet]'")
+    return pa.schema([
+        ('session_id', pa.string()),
+        ('project', pa.string()),
+        ('cwd', pa.string()),
+        ('summary', pa.string()),
+        ('message_index', pa.int32()),
+        ('role', pa.string()),
+        ('timestamp', pa.timestamp('ms', tz='UTC')),
+        ('text', pa.string()),
+        ('blocks', pa.list_(pa.string())),
+    ])
+
+
+class Exporter:
+    """Writes worker output for one format and tracks what a checkpoint needs to resume it
+
+    output is a JSONL file ('-' for stdout, which cannot be resumed) or, for
+    Markdown and Parquet, a directory.
+    """
+
+    def __init__(self, fmt, output):
+        self.fmt = fmt
+        self.output = output
+        self.stream = None
+        self.columns = {}
+        self.parts = 0
+        if fmt == 'parquet':
+            self.schema = parquet_schema()
+        if output == '-':
+            self.checkpoint_path = None
+        elif fmt == 'jsonl':
+            self.checkpoint_path = Path(f'{output}{CHECKPOINT_SUFFIX}')
+        else:
+            self.checkpoint_path = Path(output) / CHECKPOINT_NAME
+
+    def open(self, state):
+        """Prepare the output, continuing from a checkpoint's state if there is one"""
+        if self.fmt == 'jsonl':
+            if self.output == '-':
+                self.stream = sys.stdout
+            elif state:
+                # Anything written after the checkpoint was saved is written again
+                self.stream = open(self.output, 'r+', encoding='utf-8')
+                self.stream.seek(state.get('offset', 0))
+                self.stream.truncate()
+            else:
+                Path(self.output).parent.mkdir(parents=True, exist_ok=True)
+                self.stream = open(self.output, 'w', encoding='utf-8')
+            return
+        Path(self.output).mkdir(parents=True, exist_ok=True)
+        if self.fmt == 'parquet':
+            self.parts = state.get('parts', 0) if state else 0
+            if not state:
+                for stale in Path(self.output).glob('part-*.parquet'):
+                    stale.unlink()
+
+    def write(self, payload):
+        if self.fmt == 'jsonl':
+            self.stream.write(payload)
+        elif self.fmt == 'parquet':
+            for name, values in payload.items():
+                self.columns.setdefault(name, []).extend(values)
+
+    def flush(self):
+        """Make everything written so far durable; returns the state a checkpoint records"""
+        if self.fmt == 'jsonl':
+            self.stream.flush()
+            return {'offset': self.stream.tell() if self.stream is not sys.stdout else None}
+        if self.fmt == 'parquet' and self.columns:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            # Each flush closes a complete part, so an interruption never leaves a half-written file
+            target = Path(self.output) / f'part-{self.parts:05d}.parquet'
+            tmp = target.with_name(f'{target.name}.tmp')
+            pq.write_table(pa.Table.from_pydict(self.columns, schema=self.schema), tmp)
+            os.replace(tmp, target)
+            self.parts += 1
+            self.columns = {}
+        return {'parts': self.parts}
+
+    def close(self):
+        if self.stream is not None and self.stream is not sys.stdout:
+            self.stream.close()
+
+
+def load_checkpoint(path, selection):
+    """Saved export state for this selection, or None; raises ValueError if it belongs to another export
+
+    A checkpoint is a JSON line naming the selection, followed by one line per
+    save with the sessions finished since the previous one and the output state
+    at that point. Returns {'done': set of paths, plus the last output state}.
+    """
+    if path is None or not path.exists():
+        return None
+    data = path.read_bytes()
+    # An interruption while appending can leave a partial last line; drop it before appending more
+    complete = data[:data.rfind(b'\n') + 1]
+    if len(complete) != len(data):
+        with open(path, 'r+b') as f:
+            f.truncate(len(complete))
+    lines = complete.decode('utf-8').splitlines()
+    if not lines or json.loads(lines[0]).get('selection') != selection:
+        raise ValueError(f"{path} belongs to a different export; pass --restart to start over")
+    state = {'done': set()}
+    for line in lines[1:]:
+        saved = json.loads(line)
+        state['done'].update(saved.pop('done'))
+        state.update(saved)
+    return state
+
+
+def append_checkpoint(path, selection, fmt, written, done):
+    """Record sessions finished since the last save, with the output state that includes them"""
+    new = not path.exists()
+    with open(path, 'a', encoding='utf-8') as f:
+        if new:
+            f.write(json.dumps({'selection': selection, 'format': fmt}) + '\n')
+        f.write(json.dumps(dict(written, done=done)) + '\n')
+
+
+def run_export(sessions, fmt, output, selection, jobs=1, restart=False, progress=None):
+    """Export sessions [(path, project)] and return {'sessions', 'skipped', 'errors', 'seconds'}
+
+    selection is a JSON-able description of the filter used, stored in the
+    checkpoint so that resuming with different arguments is refused. Sessions
+    are written in the order given; with jobs > 1 they are parsed by a spawn
+    pool. progress(done, total) is called as sessions complete.
+    """
+    exporter = Exporter(fmt, output)
+    checkpoint = exporter.checkpoint_path
+    if restart and checkpoint is not None and checkpoint.exists():
+        checkpoint.unlink()
+    state = load_checkpoint(checkpoint, selection)
+    done = state['done'] if state else set()
+    exporter.open(state)
+    directory = output if fmt == 'markdown' else None
+    tasks = [(path, project, fmt, directory) for path, project in sessions if path not in done]
+    stats = {'sessions': 0, 'skipped': len(sessions) - len(tasks), 'errors': [], 'seconds': 0.0}
+    start = time.perf_counter()
+
+    finished = []
+
+    def save():
+        written = exporter.flush()
+        if checkpoint is not None and finished:
+            append_checkpoint(checkpoint, selection, fmt, written, finished)
+        finished.clear()
+
+    pool = None
+    if jobs > 1 and len(tasks) > 1:
+        import multiprocessing
+        # spawn, not fork, as for the regex scanner
+        pool = multiprocessing.get_context('spawn').Pool(jobs, ignore_interrupts)
+        results = pool.imap(export_session, tasks, chunksize=TASK_CHUNK)
+    else:
+        results = map(export_session, tasks)
+    try:
+        for path, payload, error in results:
+            if error:
+                stats['errors'].append(f"{path}: {error}")
+            elif payload is not None:
+                exporter.write(payload)
+                stats['sessions'] += 1
+            done.add(path)
+            finished.append(path)
+            if progress:
+                progress(len(done), len(sessions))
+            if len(finished) >= CHECKPOINT_EVERY:
+                save()
+        exporter.flush()
+    except BaseException:
+        # Keep what was finished so a rerun of the same command resumes after it
+        save()
+        raise
+    finally:
+        if pool is not None:
+            pool.terminate()
+        exporter.close()
+    if checkpoint is not None and checkpoint.exists():
+        checkpoint.unlink()
+    stats['seconds'] = time.perf_counter() - start
+    return stats
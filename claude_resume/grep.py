@@ -0,0 +1,200 @@
+"""
+Regular-expression search over chat transcripts
+Scans flattened chat text in a pool of worker processes under a per-query time budget
+"""
+import os
+import re
+import threading
+import time
+
+from .snippets import MAX_SNIPPETS, build_snippets
+
+# Per-query wall-time budget in milliseconds, and the most a client may ask for
+DEFAULT_BUDGET_MS = 1500
+MAX_BUDGET_MS = 10000
+
+# Longer patterns are rejected outright
+MAX_PATTERN_LENGTH = 500
+
+# Matches counted per chat before the scanner moves on
+MAX_HITS_PER_CHAT = 100
+
+# How long past the budget a worker may stay inside a single match before the pool is killed
+KILL_GRACE_SECONDS = 0.25
+
+# Work is shipped to the pool in chunks of roughly this many characters
+CHUNK_CHARS = 512 * 1024
+
+# Case-insensitive like the other modes; ^ and $ anchor at line boundaries
+PATTERN_FLAGS = re.IGNORECASE | re.MULTILINE
+
+# Characters that give a pattern regex meaning; patterns without them match literally
+REGEX_SYNTAX_RE = re.compile(r'[\\.^$*+?{}\[\]|()]')
+
+
+def compile_pattern(pattern):
+    """Compile a user-supplied pattern, raising ValueError if it is unusable"""
+    if not pattern:
+        raise ValueError("Empty regular expression")
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        raise ValueError(f"Regular expression longer than {MAX_PATTERN_LENGTH} characters")
+    try:
+        return re.compile(pattern, PATTERN_FLAGS)
+    except re.error as e:
+        raise ValueError(f"Invalid regular expression: {e}")
+
+
+def literal_text(pattern):
+    """Lowercase text an ASCII pattern without regex syntax matches literally, or None
+
+    A chat matching such a pattern also matches any literal it contains, which
+    lets a search narrow a cached scan for a shorter literal instead of rescanning.
+    """
+    if not pattern.isascii() or REGEX_SYNTAX_RE.search(pattern):
+        return None
+    return pattern.lower()
+
+
+def encode_cursor(generation, position):
+    """Continuation token for resuming a scan at a document position"""
+    return f'{generation}.{position}'
+
+
+def decode_cursor(cursor, generation, size):
+    """Position encoded in a continuation token for a scan over size documents
+
+    Raises ValueError for a token that is malformed, points outside the
+    documents, or is stale because it comes from another generation.
+    """
+    try:
+        token_generation, position = (int(part) for part in cursor.split('.'))
+    except ValueError:
+        raise ValueError(f"Malformed cursor '{cursor}'")
+    if token_generation != generation:
+        raise ValueError("Cursor is stale: the index changed since it was issued, restart the search")
+    if position < 0 or position > size:
+        raise ValueError(f"Malformed cursor '{cursor}': position out of range")
+    return position
+
+
+def scan_chunk(pattern, docs, deadline, snippets=MAX_SNIPPETS):
+    """Worker entry point: scan docs [(position, chat_id, text)] until done or past deadline
+
+    Returns ([(position, chat_id, hits, snippets)], stopped_at) where stopped_at
+    is the first unscanned position, or None if the whole chunk was scanned.
+    Snippets are cut here, in the worker, so that a slow pattern never runs in
+    a server thread.
+    """
+    compiled = re.compile(pattern, PATTERN_FLAGS)
+    matches = []
+    for position, chat_id, text in docs:
+        if time.time() > deadline:
+            return matches, position
+        hits, found = build_snippets([('text', text)], compiled, snippets, MAX_HITS_PER_CHAT)
+        if hits:
+            matches.append((position, chat_id, hits, found))
+    return matches, None
+
+
+class RegexScanner:
+    """Process pool that scans documents for a pattern without letting it wedge the server
+
+    Python's re module cannot be interrupted mid-match, so a catastrophically
+    backtracking pattern is contained by terminating the pool once its budget
+    runs out; a fresh pool is started for the next query.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or min(os.cpu_count() or 1, 4)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # Imported here: multiprocessing is slow to import and most commands never scan
+                import multiprocessing
+                # spawn, not fork: the server is multi-threaded
+                self._pool = multiprocessing.get_context('spawn').Pool(self.workers)
+            return self._pool
+
+    def _discard_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.terminate()
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+
+    def scan(self, pattern, docs, start=0, limit=50, budget_ms=DEFAULT_BUDGET_MS, snippets=MAX_SNIPPETS,
+             skip=None):
+        """Scan docs [(chat_id, text)] from position start, in order
+
+        skip(position) may rule documents out without scanning them.
+        Returns (matches [(position, chat_id, hits, snippets)], next_position, timed_out);
+        next_position is None when every document was scanned, otherwise the
+        scan stopped on the time budget or after limit matches and can be
+        resumed there. A scan whose workers had to be killed before it got past
+        a single document is abandoned (next_position None, timed_out True), so
+        a pathological pattern cannot be resumed forever.
+        """
+        compile_pattern(pattern)
+        budget = min(max(budget_ms, 1), MAX_BUDGET_MS) / 1000
+        # Workers stop themselves between documents at the deadline; the pool is
+        # only killed if one is still stuck inside a single match after a grace period
+        deadline = time.time() + budget
+        wait_until = time.monotonic() + budget + KILL_GRACE_SECONDS
+
+        chunks = []
+        chunk = []
+        size = 0
+        for position in range(start, len(docs)):
+            if skip and skip(position):
+                continue
+            chat_id, text = docs[position]
+            chunk.append((position, chat_id, text))
+            size += len(text)
+            if size >= CHUNK_CHARS:
+                chunks.append(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            chunks.append(chunk)
+
+        pool = self._get_pool()
+        from multiprocessing import TimeoutError as PoolTimeout
+        # Keep a few chunks in flight per worker, collect them in document order
+        pending = []
+        queued = iter(chunks)
+        for chunk in queued:
+            pending.append((chunk, pool.apply_async(scan_chunk, (pattern, chunk, deadline, snippets))))
+            if len(pending) >= self.workers * 2:
+                break
+
+        matches = []
+        next_position = start
+        while pending:
+            chunk, result = pending.pop(0)
+            try:
+                found, stopped_at = result.get(max(wait_until - time.monotonic(), 0))
+            except PoolTimeout:
+                # A worker is stuck inside one match; kill the pool to free it.
+                # Resuming would hit the same match again unless this call got somewhere.
+                self._discard_pool(pool)
+                return matches, next_position if next_position > start else None, True
+            for match in found:
+                matches.append(match)
+                position = match[0]
+                if len(matches) >= limit:
+                    return matches, position + 1 if position + 1 < len(docs) else None, False
+            if stopped_at is not None:
+                return matches, stopped_at, True
+            next_position = chunk[-1][0] + 1
+            for chunk in queued:
+                pending.append((chunk, pool.apply_async(scan_chunk, (pattern, chunk, deadline, snippets))))
+                break
+        return matches, None, False
@@ -0,0 +1,808 @@
+"""
+In-memory index of Claude chat history
+Parses JSONL chat files once and re-parses only files whose mtime or size changed
+"""
+import json
+import marshal
+import os
+import threading
+import time
+from pathlib import Path
+
+from . import metrics
+from .cache import QueryCache
+from .grep import RegexScanner, DEFAULT_BUDGET_MS, encode_cursor, decode_cursor, literal_text
+from .search import SearchIndex, SEARCH_MODES, FIELDS, document_fields, tokenize
+from .similarity import SimilarityIndex, minhash
+from .snippets import MAX_SNIPPETS, build_snippets, terms_pattern
+from .suggest import SuggestIndex, DEFAULT_SUGGESTIONS, file_names
+from .tracing import RequestTrace
+from .query import FilterIndex, parse_query, phrase_pattern, intersect, query_key
+from .utils import (chat_metadata, clean_message_content, should_show_chat, filter_messages, extract_summary,
+                    extract_tool_names, extract_tool_text, normalize_message, parse_timestamp)
+
+CLAUDE_PROJECTS_DIR = Path.home() / '.claude' / 'projects'
+
+# Integer sort keys for chat lists, newest/longest first; unknown times sort last
+SORT_KEYS = {
+    'start': lambda chat: chat['startTs'] or 0,
+    'recent': lambda chat: chat['endTs'] or 0,
+    'duration': lambda chat: chat['durationMs'] or 0,
+}
+
+
+def project_name_from_dir(dir_name):
+    """Extract project name from a projects directory name"""
+    # Directory format: -Users-username-Projects-project-name
+
+    # Remove leading dash if present
+    if dir_name.startswith('-'):
+        dir_name = dir_name[1:]
+
+    # Split by -Projects- to get the project part
+    if 'Projects-' in dir_name:
+        # Everything after 'Projects-' is the project name
+        return dir_name.split('Projects-', 1)[-1]
+
+    # Fallback: take everything after the username
+    parts = dir_name.split('-')
+    if len(parts) > 2 and parts[0] == 'Users':
+        return '-'.join(parts[2:])
+    return dir_name
+
+def find_chat_files(projects_dir):
+    """List (jsonl_file, project_name) pairs for every chat file"""
+    files = []
+    for project_dir in projects_dir.iterdir():
+        if project_dir.is_dir():
+            project_name = project_name_from_dir(project_dir.name)
+            for jsonl_file in project_dir.glob('*.jsonl'):
+                files.append((jsonl_file, project_name))
+    return files
+
+def parse_chat_file(jsonl_file, project_name, trace):
+    """Parse one JSONL chat file into chat data, or None if it has no usable messages"""
+    with open(jsonl_file, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+        metrics.FILES_PARSED.inc()
+        metrics.BYTES_PARSED.inc(os.fstat(f.fileno()).st_size)
+    if not lines:
+        return None
+
+    start = time.perf_counter()
+    messages = []
+    for line in lines:
+        try:
+            msg = json.loads(line.strip())
+            messages.append(msg)
+        except json.JSONDecodeError:
+            metrics.DECODE_ERRORS.inc()
+            continue
+    trace.add('parse', time.perf_counter() - start)
+
+    if not messages:
+        return None
+
+    # Try to extract summary BEFORE filtering
+    with trace.phase('summary'):
+        summary = extract_summary(messages)
+    with trace.phase('tools'):
+        tools = extract_tool_names(messages)
+        tool_text = extract_tool_text(messages)
+
+    # Filter out empty messages
+    with trace.phase('filter'):
+        messages = filter_messages(messages)
+    if not messages:
+        return None
+
+    first_msg = messages[0]
+    last_msg = messages[-1]
+
+    # Try to find first sensible message (user or assistant)
+    first_user_msg = ''
+    for msg in messages[:20]:  # Look at first 20 messages
+        if msg.get('message'):
+            role = msg['message'].get('role', '')
+            content = msg['message'].get('content', '')
+            if role in ['user', 'assistant'] and content:
+                cleaned_content = clean_message_content(content)
+                if cleaned_content and len(cleaned_content) > 5:  # Lower threshold for technical messages
+                    first_user_msg = cleaned_content
+                    break
+
+    # If still no sensible message found, default to empty
+    if not first_user_msg:
+        first_user_msg = 'No message content'
+
+    cwd = first_msg.get('cwd', 'Unknown')
+
+    # Parse timestamps once so sorting and range filters compare integers
+    start_ts = parse_timestamp(first_msg.get('timestamp'))
+    end_ts = parse_timestamp(last_msg.get('timestamp'))
+    duration_ms = end_ts - start_ts if start_ts is not None and end_ts is not None else None
+
+    return {
+        'id': first_msg.get('sessionId', jsonl_file.stem),
+        'fileName': jsonl_file.name,
+        'project': project_name,
+        'startTime': first_msg.get('timestamp', 'Unknown'),
+        'endTime': last_msg.get('timestamp', 'Unknown'),
+        'startTs': start_ts,
+        'endTs': end_ts,
+        'durationMs': duration_ms,
+        'messageCount': len(messages),
+        'firstMessage': first_user_msg or 'No user message',
+        'summary': summary,
+        'tools': tools,
+        'toolText': tool_text,
+        'messages': [normalize_message(msg) for msg in messages],
+        'cwd': cwd
+    }
+
+
+def new_index_id():
+    """Random id telling clients that an index's generations start over"""
+    # Not uuid.uuid4(): uuid imports platform, a few milliseconds on every quick command
+    return os.urandom(16).hex()
+
+
+def derived_fields(chat, tool_text):
+    """(MinHash signature, file names) of a visible chat, for the similarity and completion indexes"""
+    signature = minhash('\n'.join(msg['text'] for msg in chat['messages']))
+    # File names come from tool arguments and from what the user typed
+    names = file_names((tool_text or {}).get('tool_use', ''))
+    names.update(*(file_names(msg['text']) for msg in chat['messages'] if msg['role'] == 'user'))
+    return signature, names
+
+
+def add_facet(facets, chat):
+    """Fold a chat into {project: aggregates}"""
+    facet = facets.setdefault(chat['project'], {
+        'sessions': 0, 'messages': 0, 'firstStart': None, 'lastEnd': None, 'cwds': {}})
+    facet['sessions'] += 1
+    facet['messages'] += chat['messageCount']
+    facet['cwds'][chat['cwd']] = facet['cwds'].get(chat['cwd'], 0) + 1
+    if chat['startTs'] is not None and (facet['firstStart'] is None or chat['startTs'] < facet['firstStart']):
+        facet['firstStart'] = chat['startTs']
+    if chat['endTs'] is not None and (facet['lastEnd'] is None or chat['endTs'] > facet['lastEnd']):
+        facet['lastEnd'] = chat['endTs']
+
+
+class ChatIndex:
+    """Parsed chat files keyed by path, refreshed incrementally by mtime and size"""
+
+    def __init__(self, projects_dir=None, current_dir=None):
+        self.projects_dir = Path(projects_dir or CLAUDE_PROJECTS_DIR)
+        self.current_dir = current_dir
+        # path -> {'mtime', 'size', 'project', 'chat', 'toolText', 'signature', 'fileNames', 'visible', 'generation'}
+        self.entries = {}
+        # visible chat id -> path of the file it is listed and searched from
+        self.ids = {}
+        # chat id -> paths of other visible files holding the same session (resumed or copied
+        # sessions); one of them takes over if the listed file goes away
+        self.shadowed = {}
+        # path -> marshalled (messages, toolText) for entries restored from a snapshot
+        # whose transcript has not been needed yet (see store.load_index)
+        self.encoded_texts = {}
+        # Bumped whenever a refresh adds, changes or removes a chat
+        self.generation = 0
+        # Identifies this index's generation sequence; clients must not mix generations across ids
+        self.index_id = new_index_id()
+        # chat id -> generation at which it disappeared, for delta sync
+        self.removed = {}
+        # project -> aggregate stats over visible chats, kept up to date as entries change
+        self.facets = {}
+        # Full-text index over visible chats, keyed by chat id
+        self.search_index = SearchIndex()
+        # Project, tool and date-range lookups for structured query filters
+        self.filter_index = FilterIndex()
+        # MinHash signatures of visible chats, plus (generation, clusters) of near-duplicates
+        self.similarity_index = SimilarityIndex()
+        self._duplicates = (None, [])
+        # Sorted vocabulary with document frequencies, for search-box suggestions
+        self.suggest_index = SuggestIndex()
+        # Process pool for regex search, plus (generation, [(chat_id, text)]) in recency order
+        self.regex_scanner = RegexScanner()
+        self._regex_docs = (None, [])
+        # Recent search result sets, reused until the generation changes
+        self.query_cache = QueryCache()
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._progress = {'phase': 'idle', 'filesDone': 0, 'filesTotal': 0,
+                          'bytesDone': 0, 'bytesTotal': 0, 'started': None, 'finished': None}
+
+    def refresh(self, trace=None):
+        """Re-scan the projects directory, parsing only new or modified files"""
+        trace = trace or RequestTrace()
+        with self._refresh_lock:
+            started = time.perf_counter()
+            self._set_progress(phase='walking', started=time.time(), finished=None,
+                               filesDone=0, bytesDone=0)
+
+            with trace.phase('walk'):
+                chat_files = []
+                for jsonl_file, project_name in find_chat_files(self.projects_dir):
+                    try:
+                        stat = jsonl_file.stat()
+                    except OSError:
+                        continue
+                    chat_files.append((str(jsonl_file), jsonl_file, project_name, stat))
+
+            self._set_progress(phase='parsing', filesTotal=len(chat_files),
+                               bytesTotal=sum(item[3].st_size for item in chat_files))
+
+            # Entries (re)indexed in this pass are tagged with the generation it will publish
+            pending_generation = self.generation + 1
+            changed = False
+            seen = set()
+            for key, jsonl_file, project_name, stat in chat_files:
+                seen.add(key)
+                entry = self.entries.get(key)
+                if entry and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                    metrics.INDEX_CACHE_HITS.inc()
+                else:
+                    metrics.INDEX_CACHE_MISSES.inc()
+                    self._index_file(key, jsonl_file, project_name, stat, trace, pending_generation)
+                    changed = True
+                self._advance_progress(stat.st_size)
+
+            with self._lock:
+                for key in [key for key in self.entries if key not in seen]:
+                    self._remove_entry(key, pending_generation)
+                    changed = True
+                if changed:
+                    self.generation = pending_generation
+
+            metrics.INGEST_DURATION.observe(time.perf_counter() - started)
+            self._update_size_metrics()
+            self._set_progress(phase='ready', finished=time.time())
+            self.ready.set()
+            return changed
+
+    def _index_file(self, key, jsonl_file, project_name, stat, trace, generation):
+        """Parse a single file and store (or drop) its entry"""
+        file_start = time.perf_counter()
+        chat = None
+        try:
+            chat = parse_chat_file(jsonl_file, project_name, trace)
+        except Exception as e:
+            metrics.FILE_ERRORS.inc()
+            print(f"Error processing {jsonl_file}: {e}")
+
+        # Tool text is only needed for search; keep it on the entry, out of chat payloads
+        tool_text = chat.pop('toolText', None) if chat else None
+        visible = False
+        signature = None
+        names = ()
+        if chat:
+            with trace.phase('scope'):
+                visible = should_show_chat(chat, self.current_dir)
+        if visible:
+            with trace.phase('derive'):
+                signature, names = derived_fields(chat, tool_text)
+
+        entry = {
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'project': project_name,
+            'chat': chat,
+            'toolText': tool_text,
+            'signature': signature,
+            'fileNames': names,
+            'visible': visible,
+            'generation': generation,
+        }
+        with self._lock:
+            if key in self.entries:
+                self._remove_entry(key, generation)
+            self._add_entry(key, entry)
+        trace.record_file(jsonl_file, time.perf_counter() - file_start, stat.st_size)
+
+    def _preference(self, key):
+        """Sort key choosing which of several files holding one session is listed: the most recently active"""
+        return SORT_KEYS['recent'](self.entries[key]['chat']), key
+
+    def _add_entry(self, key, entry):
+        """Store an entry and update derived structures (caller holds the lock)"""
+        self.entries[key] = entry
+        if not entry['visible']:
+            return
+        chat_id = entry['chat']['id']
+        self.removed.pop(chat_id, None)
+        listed = self.ids.get(chat_id)
+        if listed is None:
+            self._index_chat(key)
+        elif self._preference(key) > self._preference(listed):
+            self._unindex_chat(self.entries[listed])
+            self.shadowed.setdefault(chat_id, set()).add(listed)
+            self._index_chat(key)
+        else:
+            self.shadowed.setdefault(chat_id, set()).add(key)
+
+    def _remove_entry(self, key, generation):
+        """Drop an entry, leaving a tombstone for its chat once no other file holds it (caller holds the lock)"""
+        entry = self.entries.pop(key)
+        self.encoded_texts.pop(key, None)
+        if not entry['visible']:
+            return
+        chat_id = entry['chat']['id']
+        others = self.shadowed.get(chat_id, set())
+        if self.ids.get(chat_id) != key:
+            others.discard(key)
+        else:
+            self._unindex_chat(entry)
+            if not others:
+                self.removed[chat_id] = generation
+            else:
+                # Another copy of the session takes over; delta-sync clients fetch it again
+                successor = max(others, key=self._preference)
+                others.discard(successor)
+                self.entries[successor]['generation'] = generation
+                self._index_chat(successor)
+        if not others:
+            self.shadowed.pop(chat_id, None)
+
+    def _index_chat(self, key):
+        """List and search a visible entry's chat under its session id (caller holds the lock)"""
+        entry = self._entry(key)
+        chat_id = entry['chat']['id']
+        if entry['signature'] is None and 'messages' in entry['chat']:
+            # Restored from a snapshot, which keeps derived fields only in the indexes built from them
+            entry['signature'], entry['fileNames'] = derived_fields(entry['chat'], entry['toolText'])
+        self.ids[chat_id] = key
+        self._add_facets(entry)
+        self.search_index.add(chat_id, document_fields(entry['chat'], entry['toolText']))
+        self.filter_index.add(entry['chat'])
+        self.similarity_index.add(chat_id, entry['signature'])
+        self.suggest_index.add(chat_id, self.search_index.doc_terms[chat_id], entry['fileNames'])
+
+    def _unindex_chat(self, entry):
+        """Take a listed entry's chat out of the id table and derived structures (caller holds the lock)"""
+        chat_id = entry['chat']['id']
+        del self.ids[chat_id]
+        self.search_index.remove(chat_id)
+        self.filter_index.remove(entry['chat'])
+        self.similarity_index.remove(chat_id)
+        self.suggest_index.remove(chat_id)
+        self._remove_facets(entry)
+
+    def _entry(self, key):
+        """An entry with its transcript decoded, if it was restored from a snapshot (caller holds the lock)"""
+        entry = self.entries[key]
+        encoded = self.encoded_texts.pop(key, None)
+        if encoded is not None:
+            entry['chat']['messages'], entry['toolText'] = marshal.loads(encoded)
+        return entry
+
+    def close(self):
+        """Stop the regex scanner's worker processes"""
+        self.regex_scanner.close()
+
+    def _in_scope(self, scope):
+        """Predicate on chat ids visible from a directory, or None when scope is None (caller holds the lock)
+
+        An index built without a current directory (as the daemon's is) serves
+        clients running in different directories by scoping each call.
+        """
+        if scope is None:
+            return None
+        return self.filter_index.scope(scope).__contains__
+
+    def _visible_keys(self, scope=None):
+        """Keys of listed entries visible from current_dir and, if given, from scope (caller holds the lock)"""
+        in_scope = self._in_scope(scope)
+        return [key for chat_id, key in self.ids.items() if in_scope is None or in_scope(chat_id)]
+
+    def get_chat(self, chat_id, scope=None):
+        """Return a visible chat by session id, or None"""
+        with self._lock:
+            key = self.ids.get(chat_id)
+            if key is None or (scope is not None and not self._in_scope(scope)(chat_id)):
+                return None
+            return self._entry(key)['chat']
+
+    def changes_since(self, generation, sort='start', scope=None, transcripts=True):
+        """Return (chats, removed_ids) that changed after the given generation; see chats() for transcripts"""
+        with self._lock:
+            keys = [key for key in self._visible_keys(scope) if self.entries[key]['generation'] > generation]
+            if transcripts:
+                chats = [self._entry(key)['chat'] for key in keys]
+            else:
+                chats = [chat_metadata(self.entries[key]['chat']) for key in keys]
+            removed = [chat_id for chat_id, gen in self.removed.items() if gen > generation]
+        chats.sort(key=SORT_KEYS[sort], reverse=True)
+        return chats, removed
+
+    def search(self, query, mode='ranked', project=None, limit=50, offset=0,
+               cursor=None, budget_ms=DEFAULT_BUDGET_MS, snippets=MAX_SNIPPETS, scope=None):
+        """Rank visible chats against a query
+
+        Ranked and fuzzy queries may carry project:, role:, after:, before: and
+        tool: clauses and "quoted phrases" (see query.parse_query). Filters are
+        intersected cheapest first, and the free text is ranked within them;
+        with no free text, matching chats come back newest first. scope limits
+        results to chats visible from a directory, as for the server. Result sets
+        are cached per index generation under the normalized query, so paging
+        and retyping a query does not rank it again.
+
+        Returns {'results': [(chat, score)], 'total': n, 'snippets': {chat id:
+        {'hits', 'snippets'}}} for the returned page, plus mode-specific details.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}', expected one of {list(SEARCH_MODES)}")
+        if mode == 'regex':
+            return self.search_regex(query, project, limit, cursor, budget_ms, snippets, scope)
+        parsed = parse_query(query)
+        key = (mode, query_key(parsed), project, scope)
+        with self._lock:
+            cached = self.query_cache.get(self.generation, key)
+            if cached is None:
+                cached = self._rank(parsed, mode, project, scope)
+                self.query_cache.put(self.generation, key, cached)
+
+            # A refresh in progress may already have dropped chats it will publish as removed
+            page = [(chat_id, score) for chat_id, score in cached['ranked'][offset:offset + limit] if chat_id in self.ids]
+            response = {'results': [(self.entries[self.ids[chat_id]]['chat'], score) for chat_id, score in page],
+                        'total': len(cached['ranked']), 'snippets': {}}
+            if mode == 'fuzzy':
+                response['expansions'] = cached['expansions']
+            # Snippets are cut as pages are requested, and kept with the result set
+            for chat_id, _ in page if cached['pattern'] and snippets else ():
+                found = cached['snippets'].get((chat_id, snippets))
+                if found is None:
+                    hits, chat_snippets = build_snippets(self._snippet_sources(chat_id, parsed['fields']),
+                                                         cached['pattern'], snippets)
+                    found = cached['snippets'][chat_id, snippets] = {'hits': hits, 'snippets': chat_snippets}
+                response['snippets'][chat_id] = found
+        return response
+
+    def _rank(self, parsed, mode, project=None, scope=None):
+        """Rank a parsed query into a cacheable result set (caller holds the lock)
+
+        Returns {'ranked': [(chat_id, score)], 'expansions', 'pattern', 'snippets'},
+        where pattern highlights the matched words and snippets is filled in as
+        pages are served.
+        """
+        patterns = [phrase_pattern(phrase) for phrase in parsed['phrases']]
+        clauses = self.filter_index.clauses(parsed, self.search_index)
+        if project:
+            ids = self.filter_index.projects.get(project, set())
+            clauses.append((len(ids), ids))
+        if scope:
+            ids = self.filter_index.scope(scope)
+            clauses.append((len(ids), ids))
+        candidates = intersect(clauses)
+        if candidates and patterns:
+            candidates = {chat_id for chat_id in candidates
+                          if self._matches_phrases(chat_id, patterns, parsed['fields'])}
+
+        # Phrase words count towards relevance along with the free text
+        text = ' '.join([parsed['text']] + [' '.join(phrase) for phrase in parsed['phrases']])
+        expansions = None
+        if mode == 'fuzzy':
+            ranked, expansions = self.search_index.rank_fuzzy(text, candidates, fields=parsed['fields'])
+        else:
+            ranked = self.search_index.rank(text, candidates, fields=parsed['fields'])
+        if not tokenize(text) and candidates is not None:
+            chats = sorted((self.entries[self.ids[chat_id]]['chat'] for chat_id in candidates),
+                           key=SORT_KEYS['start'], reverse=True)
+            ranked = [(chat['id'], 0.0) for chat in chats]
+
+        # Highlight the words that actually matched: fuzzy variants rather than what was typed
+        if mode == 'fuzzy':
+            terms = [variant for variants in expansions.values() for variant in variants]
+        else:
+            terms = tokenize(parsed['text'])
+        return {'ranked': ranked, 'expansions': expansions, 'pattern': terms_pattern(terms, patterns), 'snippets': {}}
+
+    def _snippet_sources(self, chat_id, fields=None):
+        """[(label, text)] a chat's snippets are cut from: summary, message index, or tool field (caller holds the lock)"""
+        entry = self._entry(self.ids[chat_id])
+        fields = fields or FIELDS
+        sources = [('summary', entry['chat']['summary'])] if 'summary' in fields else []
+        sources.extend((i, msg['text']) for i, msg in enumerate(entry['chat']['messages']) if msg['role'] in fields)
+        for field in ('tool_use', 'tool_result'):
+            if field in fields and entry['toolText']:
+                sources.append((field, entry['toolText'][field]))
+        return sources
+
+    def _matches_phrases(self, chat_id, patterns, fields=None):
+        """Whether a chat contains every phrase pattern, within the given fields if any (caller holds the lock)"""
+        entry = self._entry(self.ids[chat_id])
+        texts = document_fields(entry['chat'], entry['toolText'])
+        texts = [texts[field] for field in fields or FIELDS]
+        return all(any(pattern.search(text) for text in texts) for pattern in patterns)
+
+    def search_regex(self, pattern, project=None, limit=50, cursor=None, budget_ms=DEFAULT_BUDGET_MS,
+                     snippets=MAX_SNIPPETS, scope=None):
+        """Scan transcripts for a regular expression, newest chats first
+
+        Results are scored by hit count. When the time budget runs out the
+        partial results come with a 'cursor' that resumes the scan; a pattern
+        too slow to get anywhere comes back with timedOut and no cursor.
+        'total' counts matching chats once the scan has covered every chat,
+        and is None while more may remain; 'scanned' is how many chats this
+        call got through.
+        Scanned pages are cached, and a literal pattern only rescans chats
+        that matched a cached literal it contains (e.g. "connection" within "conn").
+        """
+        generation, docs = self.regex_documents()
+        if project or scope:
+            with self._lock:
+                clauses = []
+                if project:
+                    ids = self.filter_index.projects.get(project, set())
+                    clauses.append((len(ids), ids))
+                if scope:
+                    ids = self.filter_index.scope(scope)
+                    clauses.append((len(ids), ids))
+                allowed = intersect(clauses)
+            docs = [doc for doc in docs if doc[0] in allowed]
+        # Positions count documents in this filtered list
+        start = decode_cursor(cursor, generation, len(docs)) if cursor else 0
+
+        # Scans are cached as {'matches': {position: match}, 'scanned': n}, n being how many
+        # leading documents have been scanned, and grow as later pages are requested
+        key = ('regex', pattern, project, scope, snippets)
+        scan = self.query_cache.get(generation, key, record=False)
+        with self._lock:
+            # Another request continuing the same scan extends it under the lock
+            cached = scan is not None and start < scan['scanned']
+            if cached:
+                resume = scan['scanned']
+                later = {position: match for position, match in scan['matches'].items() if position >= start}
+            else:
+                resume = start
+        positions = sorted(later)[:limit] if cached else []
+        matches = [later[position] for position in positions]
+        timed_out = False
+        if len(matches) == limit:
+            next_position = positions[-1] + 1 if positions[-1] + 1 < len(docs) else None
+        elif resume >= len(docs):
+            next_position = None
+        else:
+            # Scan on from where the cached prefix ends, or from the start
+            skip = None
+            literal = literal_text(pattern)
+            if literal:
+                # A cached scan for a literal this one contains rules out every chat it scanned without a match
+                broader = self.query_cache.find(generation, lambda other, value: (
+                    other != key and other[0] == 'regex' and other[2:4] == (project, scope) and value['scanned']
+                    and literal_text(other[1]) is not None and literal_text(other[1]) in literal))
+                if broader:
+                    broader = broader[1]
+                    with self._lock:
+                        broader_scanned = broader['scanned']
+                        broader_matches = set(broader['matches'])
+                    skip = lambda position: position < broader_scanned and position not in broader_matches
+            if not cached:
+                metrics.QUERY_CACHE_LOOKUPS.inc(result='refined' if skip else 'miss')
+            found, next_position, timed_out = self.regex_scanner.scan(pattern, docs, resume, limit - len(matches),
+                                                                       budget_ms, snippets, skip)
+            matches += found
+            if scan is None and start == 0:
+                scan = {'matches': {}, 'scanned': 0}
+                self.query_cache.put(generation, key, scan)
+            # Only a scan continuing the cached prefix extends it
+            with self._lock:
+                if scan is not None and resume == scan['scanned']:
+                    scan['matches'].update((match[0], match) for match in found)
+                    if next_position is not None:
+                        scan['scanned'] = next_position
+                    elif not timed_out:
+                        scan['scanned'] = len(docs)
+        if cached:
+            metrics.QUERY_CACHE_LOOKUPS.inc(result='hit')
+
+        # The total is only known once a cached scan has covered every document
+        with self._lock:
+            total = len(scan['matches']) if scan is not None and scan['scanned'] == len(docs) else None
+
+        results = []
+        found = {}
+        for _, chat_id, hits, chat_snippets in matches:
+            chat = self.get_chat(chat_id)
+            if chat:
+                results.append((chat, hits))
+                found[chat_id] = {'hits': hits, 'snippets': chat_snippets}
+        return {
+            'results': results,
+            'total': total,
+            'snippets': found,
+            'scanned': (next_position if next_position is not None else len(docs)) - start,
+            'cursor': encode_cursor(generation, next_position) if next_position is not None else None,
+            'timedOut': timed_out,
+        }
+
+    def regex_documents(self):
+        """(generation, [(chat_id, flattened text)]) for visible chats, newest first"""
+        with self._lock:
+            generation, docs = self._regex_docs
+            if generation == self.generation:
+                return generation, docs
+            entries = [self._entry(key) for key in self.ids.values()]
+            generation = self.generation
+        entries.sort(key=lambda entry: SORT_KEYS['start'](entry['chat']), reverse=True)
+        docs = [(entry['chat']['id'], '\n'.join(document_fields(entry['chat'], entry['toolText']).values()))
+                for entry in entries]
+        with self._lock:
+            self._regex_docs = (generation, docs)
+        return generation, docs
+
+    def related(self, chat_id, limit=10, scope=None):
+        """[(chat, similarity)] for visible chats whose transcripts resemble this one, most similar first"""
+        with self._lock:
+            in_scope = self._in_scope(scope)
+            # Candidates come from shared LSH buckets only, so ranking all of them before scoping is cheap
+            found = self.similarity_index.related(chat_id, limit if in_scope is None else len(self.ids))
+            return [(self.entries[self.ids[other]]['chat'], score)
+                    for other, score in found if in_scope is None or in_scope(other)][:limit]
+
+    def suggest(self, prefix, limit=DEFAULT_SUGGESTIONS):
+        """[{'text', 'count', 'kind'}] completing prefix, counted in chats
+
+        Project names (kind 'project', offered as project: clauses) come first,
+        then words and identifiers ('term') and file names ('file'), most
+        widely used first. A prefix starting with project: only completes projects.
+        """
+        scoped = prefix.lower().startswith('project:')
+        name = prefix[len('project:'):].lower() if scoped else prefix.lower()
+        if not name and not scoped:
+            return []
+        with self._lock:
+            projects = sorted(((project, len(ids)) for project, ids in self.filter_index.projects.items()
+                               if project.lower().startswith(name)), key=lambda item: -item[1])
+            suggestions = [{'text': f'project:{project}', 'count': count, 'kind': 'project'}
+                           for project, count in projects[:limit]]
+            if not scoped:
+                suggestions += [{'text': term, 'count': count, 'kind': 'file' if '.' in term else 'term'}
+                                for term, count in self.suggest_index.suggest(name, limit)]
+        return suggestions[:limit]
+
+    def duplicate_clusters(self, scope=None):
+        """Lists of near-duplicate chat ids, most recently active first; recomputed only when the index changes"""
+        with self._lock:
+            generation, clusters = self._duplicates
+            if generation != self.generation:
+                recent = SORT_KEYS['recent']
+                clusters = [sorted(ids, key=lambda chat_id: recent(self.entries[self.ids[chat_id]]['chat']),
+                                   reverse=True)
+                            for ids in self.similarity_index.clusters()]
+                clusters.sort(key=len, reverse=True)
+                self._duplicates = (self.generation, clusters)
+            in_scope = self._in_scope(scope)
+        if in_scope is None:
+            return clusters
+        clusters = [[chat_id for chat_id in cluster if in_scope(chat_id)] for cluster in clusters]
+        return [cluster for cluster in clusters if len(cluster) > 1]
+
+    def chats(self, sort='start', scope=None, transcripts=True):
+        """Return (chats, projects) for every chat visible from current_dir, ordered by a SORT_KEYS key
+
+        Without transcripts the chats are metadata only, and no stored transcript is decoded.
+        """
+        with self._lock:
+            if transcripts:
+                chats = [self._entry(key)['chat'] for key in self._visible_keys(scope)]
+            else:
+                chats = [chat_metadata(self.entries[key]['chat']) for key in self._visible_keys(scope)]
+        chats.sort(key=SORT_KEYS[sort], reverse=True)
+        projects = {chat['project'] for chat in chats}
+        return chats, projects
+
+    def chat_page(self, sort='start', offset=0, limit=None, scope=None):
+        """Return (chats, total, projects) for one page of the chat list, metadata only"""
+        chats, projects = self.chats(sort, scope, transcripts=False)
+        return chats[offset:offset + limit] if limit is not None else chats[offset:], len(chats), projects
+
+    def _add_facets(self, entry):
+        """Fold a listed chat into its project's aggregates (caller holds the lock)"""
+        add_facet(self.facets, entry['chat'])
+
+    def _remove_facets(self, entry):
+        """Take a chat back out of its project's aggregates, after it left the id table (caller holds the lock)"""
+        chat = entry['chat']
+        facet = self.facets.get(chat['project'])
+        if not facet:
+            return
+        facet['sessions'] -= 1
+        facet['messages'] -= chat['messageCount']
+        facet['cwds'][chat['cwd']] -= 1
+        if not facet['cwds'][chat['cwd']]:
+            del facet['cwds'][chat['cwd']]
+        if not facet['sessions']:
+            del self.facets[chat['project']]
+        elif chat['startTs'] == facet['firstStart'] or chat['endTs'] == facet['lastEnd']:
+            # A min/max cannot be decremented; recompute the range from the project's other chats
+            others = [self.entries[key]['chat'] for key in self.ids.values()
+                      if self.entries[key]['chat']['project'] == chat['project']]
+            starts = [c['startTs'] for c in others if c['startTs'] is not None]
+            ends = [c['endTs'] for c in others if c['endTs'] is not None]
+            facet['firstStart'] = min(starts) if starts else None
+            facet['lastEnd'] = max(ends) if ends else None
+
+    def facet_summary(self, scope=None):
+        """Per-project session counts, message totals, date ranges and cwd groupings"""
+        with self._lock:
+            facets = self.facets
+            if scope is not None:
+                # Maintained aggregates cover every visible chat; a scoped summary is folded on demand
+                facets = {}
+                for key in self._visible_keys(scope):
+                    add_facet(facets, self.entries[key]['chat'])
+            projects = [
+                {
+                    'name': name,
+                    'sessions': facet['sessions'],
+                    'messages': facet['messages'],
+                    'firstStart': facet['firstStart'],
+                    'lastEnd': facet['lastEnd'],
+                    'cwds': [{'cwd': cwd, 'sessions': count}
+                             for cwd, count in sorted(facet['cwds'].items(), key=lambda item: -item[1])],
+                }
+                for name, facet in sorted(facets.items())
+            ]
+            generation = self.generation
+        return {
+            'ready': self.ready.is_set(),
+            'indexId': self.index_id,
+            'generation': generation,
+            'totals': {
+                'sessions': sum(p['sessions'] for p in projects),
+                'messages': sum(p['messages'] for p in projects),
+                'projects': len(projects),
+            },
+            'projects': projects,
+        }
+
+    def start_warmup(self):
+        """Build the index in a background thread"""
+        thread = threading.Thread(target=self._warmup, name='claude-resume-warmup')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _warmup(self):
+        start = time.perf_counter()
+        try:
+            self.refresh()
+        finally:
+            self.ready.set()
+        progress = self.progress()
+        print(f"Indexed {progress['filesTotal']} chat files "
+              f"({progress['bytesTotal'] / 1024 / 1024:.1f} MB) in {time.perf_counter() - start:.1f}s")
+
+    def wait_ready(self, timeout=None):
+        return self.ready.wait(timeout)
+
+    def progress(self):
+        """Snapshot of indexing progress for /api/progress"""
+        with self._lock:
+            progress = dict(self._progress)
+            progress['sessions'] = len(self.ids)
+        progress['ready'] = self.ready.is_set()
+        progress['generation'] = self.generation
+        if progress['started']:
+            progress['elapsed'] = round((progress['finished'] or time.time()) - progress['started'], 3)
+        return progress
+
+    def _set_progress(self, **values):
+        with self._lock:
+            self._progress.update(values)
+
+    def _advance_progress(self, size):
+        with self._lock:
+            self._progress['filesDone'] += 1
+            self._progress['bytesDone'] += size
+
+    def _update_size_metrics(self):
+        with self._lock:
+            sessions = len(self.ids)
+            indexed_bytes = sum(entry['size'] for entry in self.entries.values())
+            files = len(self.entries)
+        metrics.INDEX_FILES.set(files)
+        metrics.INDEX_SESSIONS.set(sessions)
+        metrics.INDEX_BYTES.set(indexed_bytes)
+        metrics.INDEX_GENERATION.set(self.generation)
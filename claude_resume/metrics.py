@@ -0,0 +1,249 @@
+"""
+Prometheus-style metrics for Claude Resume
+Counters, gauges and histograms rendered in the text exposition format
+"""
+import os
+import sys
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape_label(value):
+    """Escape a label value for the exposition format"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    """Render a {name="value",...} label block"""
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    """Render a sample value the way Prometheus expects"""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """Base class for a named metric with optional labels"""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self):
+        """Yield (suffix, label_block, value) tuples"""
+        return []
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, labels, value in self.samples():
+            lines.append(f'{self.name}{suffix}{labels} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing value"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0)]
+        return [('', _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+class Gauge(Metric):
+    """Value that can go up and down, optionally computed on scrape"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self._function is not None:
+            value = self._function()
+            return [] if value is None else [('', '', value)]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [('', _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, dict(s, counts=list(s['counts']))) for key, s in self._series.items())
+        result = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                result.append(('_bucket', _format_labels(self.labelnames, key, le), cumulative))
+            labels = _format_labels(self.labelnames, key)
+            result.append(('_sum', labels, series['sum']))
+            result.append(('_count', labels, series['count']))
+        return result
+
+
+class Registry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+def process_rss_bytes():
+    """Return the resident set size of this process, or None if unavailable"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is the peak RSS: kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PROCESS_START = time.time()
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'claude_resume_http_requests_total',
+    'HTTP requests served, by endpoint, method and status code',
+    ('endpoint', 'method', 'status'))
+HTTP_LATENCY = REGISTRY.histogram(
+    'claude_resume_http_request_duration_seconds',
+    'Time spent serving HTTP requests, by endpoint',
+    ('endpoint',))
+INGEST_DURATION = REGISTRY.histogram(
+    'claude_resume_ingest_duration_seconds',
+    'Time spent walking and parsing the projects directory')
+FILES_PARSED = REGISTRY.counter(
+    'claude_resume_files_parsed_total',
+    'Chat history JSONL files parsed')
+BYTES_PARSED = REGISTRY.counter(
+    'claude_resume_bytes_parsed_total',
+    'Bytes of chat history JSONL parsed')
+DECODE_ERRORS = REGISTRY.counter(
+    'claude_resume_json_decode_errors_total',
+    'JSONL lines skipped because they failed to decode')
+FILE_ERRORS = REGISTRY.counter(
+    'claude_resume_file_errors_total',
+    'Chat history files that could not be processed')
+PROCESS_RSS = REGISTRY.gauge(
+    'process_resident_memory_bytes',
+    'Resident memory size in bytes',
+    function=process_rss_bytes)
+PROCESS_START_TIME = REGISTRY.gauge(
+    'process_start_time_seconds',
+    'Start time of the process since unix epoch in seconds',
+    function=lambda: PROCESS_START)
+INDEX_CACHE_HITS = REGISTRY.counter(
+    'claude_resume_index_cache_hits_total',
+    'Chat files served from the index without re-parsing')
+INDEX_CACHE_MISSES = REGISTRY.counter(
+    'claude_resume_index_cache_misses_total',
+    'Chat files (re-)parsed because they were new or modified')
+INDEX_CACHE_HIT_RATIO = REGISTRY.gauge(
+    'claude_resume_index_cache_hit_ratio',
+    'Fraction of chat file lookups served from the index',
+    function=lambda: INDEX_CACHE_HITS.get() / max(INDEX_CACHE_HITS.get() + INDEX_CACHE_MISSES.get(), 1))
+QUERY_CACHE_LOOKUPS = REGISTRY.counter(
+    'claude_resume_query_cache_lookups_total',
+    'Search result cache lookups, by result: hit, miss, or refined (a miss narrowed from a cached broader result)',
+    ('result',))
+INDEX_FILES = REGISTRY.gauge(
+    'claude_resume_index_files',
+    'Chat files tracked by the index')
+INDEX_SESSIONS = REGISTRY.gauge(
+    'claude_resume_index_sessions',
+    'Chat sessions held in the index')
+INDEX_BYTES = REGISTRY.gauge(
+    'claude_resume_index_source_bytes',
+    'Total size of the chat files held in the index')
+INDEX_GENERATION = REGISTRY.gauge(
+    'claude_resume_index_generation',
+    'Index generation, bumped whenever the indexed chats change')
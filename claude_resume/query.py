@@ -0,0 +1,191 @@
+"""
+Structured search queries for Claude Resume
+Parses clauses like `project:api role:user after:2025-06-01 tool:Bash "connection reset"`
+and resolves their filters against dedicated indexes, cheapest clause first
+"""
+import bisect
+import re
+
+from .search import FIELDS, tokenize
+from .utils import parse_timestamp, should_show_chat
+
+# key:value, key:"quoted value", "quoted phrase", or a bare word
+QUERY_TOKEN_RE = re.compile(r'(\w+):("[^"]*"|\S+)|"([^"]*)"|(\S+)')
+
+FILTER_KEYS = ('project', 'role', 'in', 'after', 'before', 'tool')
+
+# Search fields that role: scopes text matching to; in: names FIELDS directly
+ROLE_FIELDS = {'user': ('user',), 'assistant': ('assistant',)}
+
+
+def parse_query(text):
+    """Split a query string into free text, phrases and filter clauses
+
+    Returns {'text', 'phrases', 'projects', 'fields', 'after', 'before', 'tools'};
+    raises ValueError for a clause with an unusable value. Words with a colon
+    whose key is not a filter (e.g. URLs) are kept as free text.
+    """
+    parsed = {'text': [], 'phrases': [], 'projects': set(), 'fields': None,
+              'after': None, 'before': None, 'tools': []}
+    for match in QUERY_TOKEN_RE.finditer(text or ''):
+        key, value, phrase, word = match.groups()
+        if phrase is not None:
+            if tokenize(phrase):
+                parsed['phrases'].append(tokenize(phrase))
+            continue
+        if key is None or key.lower() not in FILTER_KEYS:
+            parsed['text'].append(match.group(0))
+            continue
+        key = key.lower()
+        value = value.strip('"')
+        if key == 'project':
+            parsed['projects'].add(value)
+        elif key == 'tool':
+            parsed['tools'].append(value.lower())
+        elif key == 'role':
+            if value.lower() not in ROLE_FIELDS:
+                raise ValueError(f"Unknown role '{value}', expected one of {list(ROLE_FIELDS)}")
+            parsed['fields'] = (parsed['fields'] or ()) + ROLE_FIELDS[value.lower()]
+        elif key == 'in':
+            if value.lower() not in FIELDS:
+                raise ValueError(f"Unknown field '{value}', expected one of {list(FIELDS)}")
+            parsed['fields'] = (parsed['fields'] or ()) + (value.lower(),)
+        else:
+            ts = parse_timestamp(value)
+            if ts is None:
+                raise ValueError(f"Invalid date for {key}: '{value}', expected YYYY-MM-DD")
+            parsed[key] = ts
+    parsed['text'] = ' '.join(parsed['text'])
+    return parsed
+
+
+def query_key(parsed):
+    """Hashable normal form of a parsed query, for caching: case, order and repeats of free-text words do not matter"""
+    return (tuple(sorted(set(tokenize(parsed['text'])))),
+            tuple(sorted(set(map(tuple, parsed['phrases'])))),
+            tuple(sorted(parsed['projects'])),
+            tuple(sorted(set(parsed['fields']))) if parsed['fields'] is not None else None,
+            parsed['after'], parsed['before'],
+            tuple(sorted(set(parsed['tools']))))
+
+
+def phrase_pattern(phrase):
+    """Compiled regex matching a phrase's tokens consecutively, separated by anything but word characters"""
+    return re.compile(r'(?<!\w)' + r'\W+'.join(re.escape(term) for term in phrase) + r'(?!\w)', re.IGNORECASE)
+
+
+class FilterIndex:
+    """Chat ids by project, working directory and tool, and ordered by start and end time, for query filters"""
+
+    def __init__(self):
+        self.projects = {}
+        self.cwds = {}
+        self.tools = {}
+        # Sorted (epoch ms, chat id) lists for date ranges, plus each chat's times for
+        # membership tests; chats without a time are left out
+        self.starts = []
+        self.ends = []
+        self.start_ts = {}
+        self.end_ts = {}
+
+    def add(self, chat):
+        chat_id = chat['id']
+        self.projects.setdefault(chat['project'], set()).add(chat_id)
+        self.cwds.setdefault(chat['cwd'], set()).add(chat_id)
+        for tool in chat.get('tools') or ():
+            self.tools.setdefault(tool.lower(), set()).add(chat_id)
+        if chat['startTs'] is not None:
+            bisect.insort(self.starts, (chat['startTs'], chat_id))
+            self.start_ts[chat_id] = chat['startTs']
+        if chat['endTs'] is not None:
+            bisect.insort(self.ends, (chat['endTs'], chat_id))
+            self.end_ts[chat_id] = chat['endTs']
+
+    def remove(self, chat):
+        chat_id = chat['id']
+        _discard(self.projects, chat['project'], chat_id)
+        _discard(self.cwds, chat['cwd'], chat_id)
+        for tool in chat.get('tools') or ():
+            _discard(self.tools, tool.lower(), chat_id)
+        for times, by_id in ((self.starts, self.start_ts), (self.ends, self.end_ts)):
+            ts = by_id.pop(chat_id, None)
+            if ts is not None:
+                i = bisect.bisect_left(times, (ts, chat_id))
+                if i < len(times) and times[i] == (ts, chat_id):
+                    del times[i]
+
+    def scope(self, current_dir):
+        """Ids of chats visible from a directory, by the same rule as the server's (see utils.should_show_chat)"""
+        ids = set()
+        for cwd, chat_ids in self.cwds.items():
+            if should_show_chat({'cwd': cwd}, current_dir):
+                ids |= chat_ids
+        return ids
+
+    def clauses(self, parsed, search_index):
+        """[(estimated size, ids)] for each filter in a parsed query
+
+        ids is a set, or a dict whose keys are the matching chat ids; either
+        supports the membership tests used when intersecting.
+        """
+        clauses = []
+        if parsed['projects']:
+            ids = set()
+            for project in parsed['projects']:
+                ids |= self.projects.get(project, set())
+            clauses.append((len(ids), ids))
+        for tool in parsed['tools']:
+            ids = self.tools.get(tool, set())
+            clauses.append((len(ids), ids))
+        # A session matches after:D if it was still active at D, and before:D if it started before D
+        if parsed['after'] is not None:
+            i = bisect.bisect_left(self.ends, (parsed['after'],))
+            clauses.append((len(self.ends) - i, _Range(self.ends, i, len(self.ends), self.end_ts, low=parsed['after'])))
+        if parsed['before'] is not None:
+            i = bisect.bisect_left(self.starts, (parsed['before'],))
+            clauses.append((i, _Range(self.starts, 0, i, self.start_ts, high=parsed['before'])))
+        for phrase in parsed['phrases']:
+            for term in phrase:
+                docs = search_index.postings.get(term, {})
+                clauses.append((len(docs), docs))
+        return clauses
+
+
+def intersect(clauses):
+    """Intersect clause id sets, materializing only the smallest and probing the rest"""
+    if not clauses:
+        return None
+    clauses = sorted(clauses, key=lambda clause: clause[0])
+    candidates = set(clauses[0][1])
+    for _, ids in clauses[1:]:
+        if not candidates:
+            break
+        candidates = {chat_id for chat_id in candidates if chat_id in ids}
+    return candidates
+
+
+class _Range:
+    """Chat ids in a slice of a sorted (ts, chat id) list; membership is a timestamp comparison"""
+
+    def __init__(self, times, start, stop, by_id, low=None, high=None):
+        self.times = times
+        self.start = start
+        self.stop = stop
+        self.by_id = by_id
+        self.low = low
+        self.high = high
+
+    def __iter__(self):
+        return (chat_id for _, chat_id in self.times[self.start:self.stop])
+
+    def __contains__(self, chat_id):
+        ts = self.by_id.get(chat_id)
+        return ts is not None and (self.low is None or ts >= self.low) and (self.high is None or ts < self.high)
+
+
+def _discard(mapping, key, chat_id):
+    ids = mapping.get(key)
+    if ids is not None:
+        ids.discard(chat_id)
+        if not ids:
+            del mapping[key]
@@ -0,0 +1,243 @@
+"""
+Full-text search over indexed chats
+An inverted index maintained incrementally alongside ChatIndex, ranked with BM25F
+"""
+import math
+import re
+from collections import Counter
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Searchable fields and their BM25F weights; summaries and user prompts count most,
+# tool calls and their (capped) output least
+FIELDS = ('summary', 'first', 'user', 'assistant', 'tool_use', 'tool_result')
+FIELD_WEIGHTS = {'summary': 3.0, 'first': 2.0, 'user': 1.5, 'assistant': 1.0, 'tool_use': 0.75, 'tool_result': 0.5}
+
+# Search modes accepted by ChatIndex.search and /api/search
+SEARCH_MODES = ('ranked', 'fuzzy', 'regex')
+
+# BM25 saturation and per-field length normalization
+K1 = 1.2
+FIELD_B = {'summary': 0.5, 'first': 0.5, 'user': 0.75, 'assistant': 0.75, 'tool_use': 0.75, 'tool_result': 0.75}
+
+# Terms up to this length are also indexed by their single-deletion variants:
+# trigrams cannot find misspellings of 3-letter words, because one edit can
+# destroy every trigram they have
+SHORT_TERM_LENGTH = 4
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def trigrams(term):
+    """Padded character trigrams of a term"""
+    padded = f'^{term}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def deletions(term):
+    """The term itself plus every variant with one character deleted"""
+    return {term} | {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def max_edits(term):
+    """Edits tolerated for a query term of this length"""
+    if len(term) <= 2:
+        return 0
+    if len(term) <= 7:
+        return 1
+    return 2
+
+
+def edit_distance_within(a, b, limit):
+    """Levenshtein distance between a and b, or None if it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        # Every path through this row already costs more than the limit
+        if min(current) > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+def document_fields(chat, tool_text=None):
+    """Extract the searchable text of each field from a chat and its tool text"""
+    user = []
+    assistant = []
+    for msg in chat.get('messages') or []:
+        if msg['role'] == 'user':
+            user.append(msg['text'])
+        elif msg['role'] == 'assistant':
+            assistant.append(msg['text'])
+    return {
+        'summary': chat.get('summary') or '',
+        'first': chat.get('firstMessage') or '',
+        'user': '\n'.join(user),
+        'assistant': '\n'.join(assistant),
+        'tool_use': (tool_text or {}).get('tool_use', ''),
+        'tool_result': (tool_text or {}).get('tool_result', ''),
+    }
+
+
+class SearchIndex:
+    """Inverted index with per-field term frequencies and length statistics"""
+
+    def __init__(self):
+        # term -> {doc_id: (tf per field, in FIELDS order)}
+        self.postings = {}
+        # doc_id -> (token count per field)
+        self.lengths = {}
+        # doc_id -> terms it contributed, so it can be removed again
+        self.doc_terms = {}
+        # Sum of field lengths over all documents, for average lengths
+        self.field_totals = [0] * len(FIELDS)
+        # Vocabulary lookups for fuzzy matching: trigram -> terms, and
+        # single-deletion variant -> short terms
+        self.grams = {}
+        self.short_deletes = {}
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, doc_id, fields):
+        """Index a document given {field: text}; replaces any previous version"""
+        if doc_id in self.lengths:
+            self.remove(doc_id)
+        counts = [Counter(tokenize(fields.get(field, ''))) for field in FIELDS]
+        lengths = tuple(sum(c.values()) for c in counts)
+        terms = set()
+        for c in counts:
+            terms.update(c)
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is None:
+                docs = self.postings[term] = {}
+                self._add_term(term)
+            docs[doc_id] = tuple(c.get(term, 0) for c in counts)
+        self.lengths[doc_id] = lengths
+        self.doc_terms[doc_id] = terms
+        for i, length in enumerate(lengths):
+            self.field_totals[i] += length
+
+    def remove(self, doc_id):
+        """Drop a document from the index"""
+        lengths = self.lengths.pop(doc_id, None)
+        if lengths is None:
+            return
+        for term in self.doc_terms.pop(doc_id):
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+                self._remove_term(term)
+        for i, length in enumerate(lengths):
+            self.field_totals[i] -= length
+
+    def _add_term(self, term):
+        """Register a new vocabulary term with the fuzzy lookups"""
+        for gram in trigrams(term):
+            self.grams.setdefault(gram, set()).add(term)
+        if len(term) <= SHORT_TERM_LENGTH:
+            for variant in deletions(term):
+                self.short_deletes.setdefault(variant, set()).add(term)
+
+    def _remove_term(self, term):
+        """Forget a term that no longer occurs in any document"""
+        for gram in trigrams(term):
+            terms = self.grams[gram]
+            terms.discard(term)
+            if not terms:
+                del self.grams[gram]
+        if len(term) <= SHORT_TERM_LENGTH:
+            for variant in deletions(term):
+                terms = self.short_deletes[variant]
+                terms.discard(term)
+                if not terms:
+                    del self.short_deletes[variant]
+
+    def fuzzy_terms(self, term, limit=None):
+        """Return {vocabulary term: edit distance} for terms within max_edits(term)"""
+        limit = max_edits(term) if limit is None else limit
+        if limit == 0:
+            return {term: 0} if term in self.postings else {}
+
+        # A term within k edits shares at least len(term) - 3k padded trigrams with it
+        needed = len(term) - 3 * limit
+        if needed >= 1:
+            shared = Counter()
+            for gram in trigrams(term):
+                shared.update(self.grams.get(gram, ()))
+            candidates = [t for t, count in shared.items() if count >= needed]
+        else:
+            # Two terms within one edit share a single-deletion variant
+            candidates = set()
+            for variant in deletions(term):
+                candidates.update(self.short_deletes.get(variant, ()))
+
+        matches = {}
+        for candidate in candidates:
+            distance = edit_distance_within(term, candidate, limit)
+            if distance is not None:
+                matches[candidate] = distance
+        return matches
+
+    def idf(self, term):
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.lengths) - df + 0.5) / (df + 0.5))
+
+    def rank(self, query, candidates=None, limit=None, fields=None):
+        """Return [(doc_id, score)] for documents matching any query term, best first"""
+        terms = [(term, 1.0) for term in dict.fromkeys(tokenize(query))]
+        return self.rank_terms(terms, candidates, limit, fields)
+
+    def rank_fuzzy(self, query, candidates=None, limit=None, fields=None):
+        """Rank with each query term expanded to vocabulary terms within a few edits
+
+        Returns (ranked, expansions); closer variants contribute more to the score.
+        """
+        terms = []
+        expansions = {}
+        for term in dict.fromkeys(tokenize(query)):
+            variants = self.fuzzy_terms(term)
+            expansions[term] = sorted(variants, key=lambda t: (variants[t], t))
+            terms.extend((variant, 1.0 / (1 + distance)) for variant, distance in variants.items())
+        return self.rank_terms(terms, candidates, limit, fields), expansions
+
+    def rank_terms(self, terms, candidates=None, limit=None, fields=None):
+        """BM25F over [(term, weight)] pairs, optionally counting only some FIELDS"""
+        if not terms or not self.lengths:
+            return []
+
+        count = len(self.lengths)
+        averages = [total / count or 1 for total in self.field_totals]
+        # Fields outside the requested ones get zero weight
+        weights = [FIELD_WEIGHTS[field] if fields is None or field in fields else 0.0 for field in FIELDS]
+        b = [FIELD_B[field] for field in FIELDS]
+
+        scores = {}
+        for term, term_weight in terms:
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf(term) * term_weight
+            for doc_id, tfs in docs.items():
+                if candidates is not None and doc_id not in candidates:
+                    continue
+                lengths = self.lengths[doc_id]
+                # BM25F: combine length-normalized field frequencies, then saturate once
+                tf = 0.0
+                for i, field_tf in enumerate(tfs):
+                    if field_tf and weights[i]:
+                        tf += weights[i] * field_tf / (1 - b[i] + b[i] * lengths[i] / averages[i])
+                if tf:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf / (K1 + tf)
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return ranked[:limit] if limit else ranked
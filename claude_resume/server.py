@@ -9,16 +9,40 @@ import os
 import glob
 from pathlib import Path
 from datetime import datetime
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 import urllib.parse
-import webbrowser
 import threading
 import time
 import socket
-from .utils import clean_message_content, should_show_chat, filter_messages, extract_summary
+from . import metrics
+from .daemon import RemoteIndex, connect as connect_daemon
+from .index import ChatIndex, CLAUDE_PROJECTS_DIR, SORT_KEYS, chat_metadata
+from .grep import DEFAULT_BUDGET_MS
+from .snippets import MAX_SNIPPETS
+from .suggest import DEFAULT_SUGGESTIONS
+from .tracing import RequestTrace
 
-# Configuration
-CLAUDE_PROJECTS_DIR = Path.home() / '.claude' / 'projects'
+# The page and its assets, shipped as package data
+STATIC_DIR = Path(__file__).parent / 'static'
+
+# Endpoints reported individually in metrics; anything else is grouped as 'other'
+METRIC_ENDPOINTS = ('/', '/api/chats', '/api/chats/:id', '/api/chats/:id/related', '/api/search', '/api/suggest',
+                    '/api/duplicates', '/api/facets', '/api/ready', '/api/progress', '/metrics')
+
+def endpoint_label(path):
+    """Map a request path to a bounded set of metric labels"""
+    if path.startswith('/api/chats/'):
+        path = '/api/chats/:id/related' if path.endswith('/related') else '/api/chats/:id'
+    return path if path in METRIC_ENDPOINTS else 'other'
+
+def int_param(query, name, default):
+    """A non-negative integer query parameter, or default if absent; raises ValueError naming a bad one"""
+    if name not in query:
+        return default
+    value = query[name][0]
+    if not value.isdigit():
+        raise ValueError(f"Parameter '{name}' must be a non-negative integer, got '{value}'")
+    return int(value)
 
 def find_free_port(start_port=8888, max_tries=100):
     """Find an available port starting from start_port"""
@@ -32,764 +56,264 @@ def find_free_port(start_port=8888, max_tries=100):
     raise RuntimeError(f"Could not find a free port in range {start_port}-{start_port + max_tries}")
 
 class ChatHistoryHandler(SimpleHTTPRequestHandler):
+    # Log per-request phase breakdowns (set by --trace)
+    trace_requests = False
+    # Shared chat index, warmed up in the background by main()
+    index = None
+    # Held while a lost daemon's index is replaced by a local one
+    fallback_lock = threading.Lock()
+    
     def do_GET(self):
         parsed_path = urllib.parse.urlparse(self.path)
+        endpoint = endpoint_label(parsed_path.path)
+        self._status = None
+        self._index = None
+        start = time.perf_counter()
         
-        if parsed_path.path == '/':
-            self.serve_html()
-        elif parsed_path.path == '/api/chats':
-            self.serve_chats()
-        else:
-            super().do_GET()
+        try:
+            if parsed_path.path == '/':
+                self.serve_html()
+            elif parsed_path.path == '/api/chats':
+                self.serve_chats()
+            elif parsed_path.path.startswith('/api/chats/') and parsed_path.path.endswith('/related'):
+                self.serve_related(urllib.parse.unquote(parsed_path.path[len('/api/chats/'):-len('/related')]))
+            elif parsed_path.path.startswith('/api/chats/'):
+                self.serve_chat(urllib.parse.unquote(parsed_path.path[len('/api/chats/'):]))
+            elif parsed_path.path == '/api/search':
+                self.serve_search()
+            elif parsed_path.path == '/api/suggest':
+                self.serve_suggest()
+            elif parsed_path.path == '/api/duplicates':
+                self.serve_duplicates()
+            elif parsed_path.path == '/api/facets':
+                self.serve_facets()
+            elif parsed_path.path == '/api/ready':
+                self.serve_ready()
+            elif parsed_path.path == '/api/progress':
+                self.serve_progress()
+            elif parsed_path.path == '/metrics':
+                self.serve_metrics()
+            else:
+                super().do_GET()
+        except OSError as e:
+            # A daemon-backed index fails this way once the daemon is gone
+            if not isinstance(self._index, RemoteIndex):
+                raise
+            self.daemon_lost(self._index, e)
+        finally:
+            metrics.HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+            metrics.HTTP_REQUESTS.inc(endpoint=endpoint, method='GET', status=self._status or 0)
     
-    def serve_html(self):
-        """Serve the main HTML interface"""
-        html_content = '''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Claude Chat History Viewer</title>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background: #f5f5f5; }
-        .container { max-width: 1400px; margin: 0 auto; padding: 20px; }
-        h1 { color: #333; margin-bottom: 20px; }
-        
-        .controls { background: white; padding: 20px; border-radius: 8px; margin-bottom: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
-        .search-box { width: 100%; padding: 12px; font-size: 16px; border: 2px solid #ddd; border-radius: 6px; margin-bottom: 15px; }
-        .search-box:focus { outline: none; border-color: #4CAF50; }
-        
-        .stats { display: flex; gap: 20px; margin-bottom: 15px; }
-        .stat-card { background: #f8f9fa; padding: 10px 15px; border-radius: 6px; }
-        .stat-label { font-size: 12px; color: #666; }
-        .stat-value { font-size: 24px; font-weight: bold; color: #333; }
-        
-        .filters { display: flex; gap: 10px; flex-wrap: wrap; }
-        .filter-btn { padding: 8px 16px; background: #e0e0e0; border: none; border-radius: 4px; cursor: pointer; transition: all 0.3s; }
-        .filter-btn:hover { background: #d0d0d0; }
-        .filter-btn.active { background: #4CAF50; color: white; }
-        
-        .chat-list { background: white; border-radius: 8px; padding: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
-        .chat-item { border-bottom: 1px solid #eee; padding: 15px; cursor: pointer; transition: background 0.2s; position: relative; }
-        .chat-item:hover { background: #f8f9fa; }
-        .chat-item:last-child { border-bottom: none; }
-        
-        mark { background-color: yellow; padding: 0 2px; border-radius: 2px; }
-        mark.current { background-color: #ff9800; color: white; }
-        .search-snippet { background: #fffde7; padding: 8px; border-radius: 4px; margin-top: 8px; border-left: 3px solid #ffc107; }
-        
-        .chat-header { display: flex; align-items: start; margin-bottom: 10px; }
-        .chat-id { font-family: monospace; color: #666; font-size: 12px; }
-        .chat-heading { color: #333; font-weight: 500; margin-bottom: 5px; font-size: 15px; }
-        .no-summary { color: #999; font-style: italic; font-weight: 400; font-size: 13px; }
-        .chat-preview { color: #666; line-height: 1.4; font-size: 13px; display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical; overflow: hidden; }
-        .chat-stats { margin-top: 8px; font-size: 11px; color: #999; }
-        
-        .copy-icon { display: inline-block; margin-left: 8px; padding: 4px 6px; background: #e0e0e0; color: #666; border: none; border-radius: 3px; font-size: 14px; cursor: pointer; transition: all 0.2s; vertical-align: middle; }
-        .copy-icon:hover { background: #4CAF50; color: white; transform: scale(1.1); }
-        .copy-icon.copied { background: #2196F3; color: white; }
-        
-        .modal { display: none; position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.5); z-index: 1000; }
-        .modal.active { display: flex; align-items: center; justify-content: center; }
-        .modal-content { background: white; width: 90%; max-width: 900px; max-height: 80vh; border-radius: 12px; overflow: hidden; display: flex; flex-direction: column; }
-        .modal-header { padding: 20px; border-bottom: 1px solid #eee; display: flex; justify-content: space-between; align-items: center; }
-        .modal-body { padding: 20px; overflow-y: auto; flex: 1; }
-        .modal-close { background: none; border: none; font-size: 24px; cursor: pointer; color: #999; }
-        
-        .modal-search-bar { display: flex; align-items: center; gap: 10px; margin-bottom: 10px; }
-        .modal-search-input { flex: 1; padding: 8px; border: 2px solid #ddd; border-radius: 4px; font-size: 14px; }
-        .modal-search-input:focus { outline: none; border-color: #4CAF50; }
-        .search-nav-btn { padding: 6px 10px; background: #f0f0f0; border: 1px solid #ddd; border-radius: 4px; cursor: pointer; transition: all 0.2s; }
-        .search-nav-btn:hover:not(:disabled) { background: #e0e0e0; }
-        .search-nav-btn:disabled { opacity: 0.5; cursor: not-allowed; }
-        .match-counter { font-size: 13px; color: #666; min-width: 80px; text-align: center; }
-        
-        .message { margin-bottom: 20px; padding: 15px; border-radius: 8px; }
-        .message.user { background: #e3f2fd; border-left: 4px solid #2196F3; }
-        .message.assistant { background: #f3e5f5; border-left: 4px solid #9C27B0; }
-        .message-role { font-weight: bold; margin-bottom: 8px; color: #666; }
-        .message-content { white-space: pre-wrap; word-wrap: break-word; font-family: monospace; font-size: 13px; }
-        .message-time { font-size: 11px; color: #999; margin-top: 8px; }
-        
-        .loading { text-align: center; padding: 40px; color: #666; }
-        .error { background: #fee; color: #c00; padding: 15px; border-radius: 6px; margin: 20px 0; }
-        
-        .notification { position: fixed; bottom: 20px; right: 20px; background: #4CAF50; color: white; padding: 15px 20px; border-radius: 8px; box-shadow: 0 4px 6px rgba(0,0,0,0.2); z-index: 2000; animation: slideIn 0.3s ease-out; }
-        @keyframes slideIn { from { transform: translateX(400px); opacity: 0; } to { transform: translateX(0); opacity: 1; } }
-        @keyframes slideOut { from { transform: translateX(0); opacity: 1; } to { transform: translateX(400px); opacity: 0; } }
-        .notification.hiding { animation: slideOut 0.3s ease-out; }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>Claude Chat History Viewer</h1>
-        
-        <div class="controls">
-            <input type="text" class="search-box" id="search" placeholder="Search chats by content, ID, or project name...">
-            
-            <div class="stats" id="stats">
-                <div class="stat-card">
-                    <div class="stat-label">Total Chats</div>
-                    <div class="stat-value" id="total-chats">0</div>
-                </div>
-                <div class="stat-card">
-                    <div class="stat-label">Projects</div>
-                    <div class="stat-value" id="total-projects">0</div>
-                </div>
-                <div class="stat-card">
-                    <div class="stat-label">Messages</div>
-                    <div class="stat-value" id="total-messages">0</div>
-                </div>
-            </div>
-            
-            <div class="filters" id="project-filters">
-                <button class="filter-btn active" data-project="all" onclick="setProjectFilter('all')">All Projects</button>
-            </div>
-        </div>
-        
-        <div class="chat-list" id="chat-list">
-            <div class="loading">Loading chats...</div>
-        </div>
-    </div>
+    def send_response(self, code, message=None):
+        """Record the status code for request metrics"""
+        self._status = code
+        super().send_response(code, message)
     
-    <div class="modal" id="chat-modal">
-        <div class="modal-content">
-            <div class="modal-header">
-                <div>
-                    <h2 id="modal-title">Chat Details</h2>
-                    <div class="chat-id" id="modal-chat-id"></div>
-                </div>
-                <button class="modal-close" onclick="closeModal()">×</button>
-            </div>
-            <div class="modal-body" id="modal-body"></div>
-        </div>
-    </div>
+    def get_index(self):
+        """Return the shared chat index, creating it on first use"""
+        if ChatHistoryHandler.index is None:
+            ChatHistoryHandler.index = ChatIndex(CLAUDE_PROJECTS_DIR, os.getcwd())
+        self._index = ChatHistoryHandler.index
+        return self._index
     
-    <script>
-        let allChats = [];
-        let filteredChats = [];
-        let activeProject = 'all';
-        let projects = new Set();
-        let currentSearchTerm = '';
-        let modalSearchMatches = [];
-        let currentMatchIndex = -1;
-        
-        // Load chats on page load
-        loadChats();
-        
-        document.getElementById('search').addEventListener('input', filterChats);
-        
-        async function loadChats() {
-            try {
-                const response = await fetch('/api/chats');
-                const data = await response.json();
-                
-                allChats = data.chats;
-                projects = new Set(data.projects);
-                
-                updateStats();
-                updateProjectFilters();
-                filterChats();
-            } catch (error) {
-                document.getElementById('chat-list').innerHTML = 
-                    '<div class="error">Error loading chats: ' + error.message + '</div>';
-            }
-        }
-        
-        function updateStats() {
-            document.getElementById('total-chats').textContent = allChats.length;
-            document.getElementById('total-projects').textContent = projects.size;
-            const totalMessages = allChats.reduce((sum, chat) => sum + chat.messageCount, 0);
-            document.getElementById('total-messages').textContent = totalMessages.toLocaleString();
-        }
-        
-        function updateProjectFilters() {
-            const filtersDiv = document.getElementById('project-filters');
-            filtersDiv.innerHTML = '';
-            
-            // Create All Projects button with onclick
-            const allBtn = document.createElement('button');
-            allBtn.className = 'filter-btn active';
-            allBtn.dataset.project = 'all';
-            allBtn.textContent = 'All Projects';
-            allBtn.onclick = () => setProjectFilter('all');
-            filtersDiv.appendChild(allBtn);
-            
-            Array.from(projects).sort().forEach(project => {
-                const btn = document.createElement('button');
-                btn.className = 'filter-btn';
-                btn.dataset.project = project;
-                btn.textContent = project;
-                btn.onclick = () => setProjectFilter(project);
-                filtersDiv.appendChild(btn);
-            });
-        }
-        
-        function setProjectFilter(project) {
-            activeProject = project;
-            document.querySelectorAll('.filter-btn').forEach(btn => {
-                btn.classList.toggle('active', btn.dataset.project === project);
-            });
-            filterChats();
-        }
-        
-        // Utility function to extract context around search term
-        function extractSearchContext(text, searchTerm, maxWords = 50) {
-            if (!text || !searchTerm) return '';
-            
-            const lowerText = text.toLowerCase();
-            const index = lowerText.indexOf(searchTerm.toLowerCase());
-            
-            if (index === -1) return '';
-            
-            // If the message is short enough, return the whole thing
-            const words = text.split(/\\s+/);
-            if (words.length <= maxWords) {
-                return text;
-            }
-            
-            // Find word boundaries around the match
-            const before = text.substring(0, index).split(/\\s+/);
-            const after = text.substring(index + searchTerm.length).split(/\\s+/);
-            
-            const wordsBeforeCount = Math.floor(maxWords / 2);
-            const wordsAfterCount = Math.floor(maxWords / 2);
-            
-            const startWords = before.slice(-wordsBeforeCount);
-            const endWords = after.slice(0, wordsAfterCount);
-            
-            let result = '';
-            if (before.length > wordsBeforeCount) result = '...';
-            result += startWords.join(' ') + ' ' + text.substring(index, index + searchTerm.length) + ' ' + endWords.join(' ');
-            if (after.length > wordsAfterCount) result += '...';
-            
-            return result.trim();
-        }
-        
-        // Utility function to highlight search terms
-        function highlightText(text, searchTerm, isCurrent = false) {
-            if (!text || !searchTerm) return escapeHtml(text);
-            
-            const escaped = escapeHtml(text);
-            const regex = new RegExp('(' + escapeRegex(searchTerm) + ')', 'gi');
-            return escaped.replace(regex, isCurrent ? '<mark class="current">$1</mark>' : '<mark>$1</mark>');
-        }
-        
-        function escapeRegex(str) {
-            return str.replace(/[.*+?^${}()|[\\]\\\\]/g, '\\\\$&');
-        }
-        
-        function filterChats() {
-            const searchTerm = document.getElementById('search').value.toLowerCase();
-            currentSearchTerm = searchTerm;
-            
-            filteredChats = allChats.filter(chat => {
-                const projectMatch = activeProject === 'all' || chat.project === activeProject;
-                
-                // First check basic fields for quick matches
-                let searchMatch = !searchTerm || 
-                    chat.id.toLowerCase().includes(searchTerm) ||
-                    chat.project.toLowerCase().includes(searchTerm) ||
-                    chat.firstMessage.toLowerCase().includes(searchTerm) ||
-                    (chat.summary && chat.summary.toLowerCase().includes(searchTerm)) ||
-                    chat.cwd.toLowerCase().includes(searchTerm);
-                
-                // If not found in basic fields and we have a search term, search through all messages
-                if (!searchMatch && searchTerm && chat.messages) {
-                    for (let i = 0; i < chat.messages.length; i++) {
-                        const msg = chat.messages[i];
-                        if (msg.message && msg.message.content) {
-                            let content = '';
-                            
-                            // Handle different content formats
-                            if (typeof msg.message.content === 'string') {
-                                content = msg.message.content;
-                            } else if (Array.isArray(msg.message.content)) {
-                                content = msg.message.content
-                                    .map(c => c.text || '')
-                                    .join(' ');
-                            }
-                            
-                            if (content.toLowerCase().includes(searchTerm)) {
-                                // Store the matched content and index for preview
-                                chat.searchMatch = {
-                                    content: content,
-                                    messageIndex: i,
-                                    snippet: extractSearchContext(content, searchTerm)
-                                };
-                                searchMatch = true;
-                                break;
-                            }
-                        }
-                    }
-                }
-                
-                return projectMatch && searchMatch;
-            });
-            
-            filteredChats.sort((a, b) => new Date(b.startTime) - new Date(a.startTime));
-            displayChats();
-        }
-        
-        function displayChats() {
-            const listDiv = document.getElementById('chat-list');
-            
-            if (filteredChats.length === 0) {
-                listDiv.innerHTML = '<div class="loading">No chats found</div>';
-                return;
-            }
-            
-            listDiv.innerHTML = filteredChats.map(chat => {
-                let previewContent = '';
-                
-                // If there's a search match in messages, show that snippet
-                if (currentSearchTerm && chat.searchMatch && chat.searchMatch.snippet) {
-                    previewContent = `<div class="search-snippet">${highlightText(chat.searchMatch.snippet, currentSearchTerm)}</div>`;
-                } else {
-                    // Show the regular first message, with highlighting if searching
-                    previewContent = currentSearchTerm ? 
-                        `<div class="chat-preview">${highlightText(chat.firstMessage, currentSearchTerm)}</div>` :
-                        `<div class="chat-preview">${escapeHtml(chat.firstMessage)}</div>`;
-                }
-                
-                return `
-                    <div class="chat-item" onclick="showChatDetails('${chat.id}')">
-                        <div class="chat-header">
-                            <div style="width: 100%;">
-                                <div class="chat-heading">${chat.summary ? escapeHtml(chat.summary) : '<span class="no-summary">No summary available</span>'}</div>
-                                <div class="chat-id">
-                                    ID: ${chat.id}
-                                    <button class="copy-icon" onclick="event.stopPropagation(); copyResumeCommand('${chat.id}', '${escapeHtml(chat.cwd).replace(/'/g, "\\'")}', this)" title="Copy resume command">📋</button>
-                                </div>
-                            </div>
-                        </div>
-                        ${previewContent}
-                        <div class="chat-stats">
-                            ${chat.messageCount} messages • ${formatRelativeTime(chat.endTime)} • ${escapeHtml(chat.project)}
-                        </div>
-                    </div>
-                `;
-            }).join('');
-        }
-        
-        function showChatDetails(chatId) {
-            const chat = allChats.find(c => c.id === chatId);
-            if (!chat) return;
-            
-            document.getElementById('modal-title').textContent = chat.project;
-            document.getElementById('modal-chat-id').innerHTML = `
-                <div>
-                    <div>Session: ${chat.id} 
-                        <button class="copy-icon" onclick="event.stopPropagation(); copyResumeCommand('${chat.id}', '${escapeHtml(chat.cwd).replace(/'/g, "\\'")}', this)" title="Copy resume command">📋</button>
-                    </div>
-                    <div class="modal-search-bar">
-                        <input type="text" class="modal-search-input" id="modal-search" placeholder="Search in this chat..." value="${escapeHtml(currentSearchTerm)}">
-                        <button class="search-nav-btn" onclick="navigateMatch('prev')" title="Previous match (Shift+Enter)">↑</button>
-                        <button class="search-nav-btn" onclick="navigateMatch('next')" title="Next match (Enter)">↓</button>
-                        <span class="match-counter" id="match-counter"></span>
-                    </div>
-                </div>
-            `;
-            
-            const modalBody = document.getElementById('modal-body');
-            modalBody.innerHTML = `
-                <div style="margin-bottom: 20px; padding: 15px; background: #f5f5f5; border-radius: 6px;">
-                    <strong>Working Directory:</strong> ${escapeHtml(chat.cwd)}<br>
-                    <strong>Duration:</strong> ${formatDuration(chat.startTime, chat.endTime)}<br>
-                    <strong>Total Messages:</strong> ${chat.messageCount}<br>
-                    <strong>Last Active:</strong> ${formatRelativeTime(chat.endTime)}
-                </div>
-                ${chat.messages.map(msg => {
-                    if (msg.message && msg.message.content) {
-                        const role = msg.message.role;
-                        let content = '';
-                        
-                        if (typeof msg.message.content === 'string') {
-                            content = msg.message.content;
-                        } else if (Array.isArray(msg.message.content)) {
-                            content = msg.message.content
-                                .map(c => c.text || '')
-                                .join('');
-                        }
-                        
-                        return `
-                            <div class="message ${role}">
-                                <div class="message-role">${role.toUpperCase()}</div>
-                                <div class="message-content">${escapeHtml(content)}</div>
-                                <div class="message-time">${formatRelativeTime(msg.timestamp)}</div>
-                            </div>
-                        `;
-                    }
-                    return '';
-                }).join('')}
-            `;
-            
-            document.getElementById('chat-modal').classList.add('active');
-            
-            // Set up modal search
-            const modalSearchInput = document.getElementById('modal-search');
-            modalSearchInput.addEventListener('input', () => searchInModal(chat));
-            modalSearchInput.addEventListener('keydown', (e) => {
-                if (e.key === 'Enter') {
-                    e.preventDefault();
-                    if (e.shiftKey) {
-                        navigateMatch('prev');
-                    } else {
-                        navigateMatch('next');
-                    }
-                }
-            });
-            
-            // Auto-search if there's a current search term
-            if (currentSearchTerm) {
-                searchInModal(chat);
-                // Auto-scroll to first match after DOM updates
-                if (modalSearchMatches.length > 0) {
-                    // Use requestAnimationFrame to ensure DOM is ready
-                    requestAnimationFrame(() => {
-                        navigateMatch('next');
-                    });
-                }
-            }
-        }
-        
-        function closeModal() {
-            document.getElementById('chat-modal').classList.remove('active');
-        }
-        
-        function formatDate(dateStr) {
-            if (!dateStr || dateStr === 'Unknown') return 'Unknown';
-            const date = new Date(dateStr);
-            return date.toLocaleDateString() + ' ' + date.toLocaleTimeString();
-        }
-        
-        function formatRelativeTime(dateStr) {
-            if (!dateStr || dateStr === 'Unknown') return 'Unknown';
-            
-            const date = new Date(dateStr);
-            const now = new Date();
-            const diffMs = now - date;
-            const diffSecs = Math.floor(diffMs / 1000);
-            const diffMins = Math.floor(diffSecs / 60);
-            const diffHours = Math.floor(diffMins / 60);
-            const diffDays = Math.floor(diffHours / 24);
-            const diffWeeks = Math.floor(diffDays / 7);
-            const diffMonths = Math.floor(diffDays / 30);
-            const diffYears = Math.floor(diffDays / 365);
-            
-            if (diffSecs < 60) return 'just now';
-            if (diffMins === 1) return '1 minute ago';
-            if (diffMins < 60) return diffMins + ' minutes ago';
-            if (diffHours === 1) return '1 hour ago';
-            if (diffHours < 24) return diffHours + ' hours ago';
-            if (diffDays === 1) return 'yesterday';
-            if (diffDays < 7) return diffDays + ' days ago';
-            if (diffWeeks === 1) return '1 week ago';
-            if (diffWeeks < 4) return diffWeeks + ' weeks ago';
-            if (diffMonths === 1) return '1 month ago';
-            if (diffMonths < 12) return diffMonths + ' months ago';
-            if (diffYears === 1) return '1 year ago';
-            return diffYears + ' years ago';
-        }
-        
-        function formatDuration(start, end) {
-            if (!start || !end || start === 'Unknown' || end === 'Unknown') return 'Unknown duration';
-            const duration = new Date(end) - new Date(start);
-            const hours = Math.floor(duration / 3600000);
-            const minutes = Math.floor((duration % 3600000) / 60000);
-            if (hours > 0) return hours + 'h ' + minutes + 'm';
-            return minutes + 'm';
-        }
-        
-        function escapeHtml(text) {
-            const div = document.createElement('div');
-            div.textContent = text || '';
-            return div.innerHTML;
-        }
-        
-        function copyResumeCommand(sessionId, cwd, button) {
-            const command = `cd "${cwd}" && claude --resume ${sessionId}`;
-            
-            const copySuccess = () => {
-                button.classList.add('copied');
-                button.innerHTML = '✓';
-                
-                // Show notification
-                showNotification('✅ Command copied! Paste it in your terminal to continue this chat.');
-                
-                setTimeout(() => {
-                    button.classList.remove('copied');
-                    button.innerHTML = '📋';
-                }, 2000);
-            };
-            
-            navigator.clipboard.writeText(command).then(copySuccess).catch(err => {
-                // Fallback for older browsers
-                const textarea = document.createElement('textarea');
-                textarea.value = command;
-                textarea.style.position = 'fixed';
-                textarea.style.opacity = '0';
-                document.body.appendChild(textarea);
-                textarea.select();
-                document.execCommand('copy');
-                document.body.removeChild(textarea);
-                copySuccess();
-            });
-        }
-        
-        function showNotification(message) {
-            // Remove any existing notification
-            const existing = document.querySelector('.notification');
-            if (existing) existing.remove();
-            
-            const notification = document.createElement('div');
-            notification.className = 'notification';
-            notification.textContent = message;
-            document.body.appendChild(notification);
-            
-            setTimeout(() => {
-                notification.classList.add('hiding');
-                setTimeout(() => notification.remove(), 300);
-            }, 3500);
-        }
-        
-        // Function to search within the modal
-        function searchInModal(chat) {
-            const searchTerm = document.getElementById('modal-search').value.toLowerCase();
-            modalSearchMatches = [];
-            currentMatchIndex = -1;
-            
-            if (!searchTerm) {
-                // Clear highlights
-                updateModalContent(chat, '');
-                document.getElementById('match-counter').textContent = '';
-                return;
-            }
-            
-            // Update content with highlights FIRST
-            updateModalContent(chat, searchTerm);
-            
-            // THEN find all matches in the newly created DOM
-            const messages = document.querySelectorAll('.message');
-            messages.forEach((msgElement, index) => {
-                const marks = msgElement.querySelectorAll('mark');
-                if (marks.length > 0) {
-                    modalSearchMatches.push({
-                        element: msgElement,
-                        marks: marks,
-                        index: index
-                    });
-                }
-            });
-            
-            updateMatchCounter();
-        }
-        
-        // Function to update modal content with highlights
-        function updateModalContent(chat, searchTerm) {
-            const modalBody = document.getElementById('modal-body');
-            modalBody.innerHTML = `
-                <div style="margin-bottom: 20px; padding: 15px; background: #f5f5f5; border-radius: 6px;">
-                    <strong>Working Directory:</strong> ${escapeHtml(chat.cwd)}<br>
-                    <strong>Duration:</strong> ${formatDuration(chat.startTime, chat.endTime)}<br>
-                    <strong>Total Messages:</strong> ${chat.messageCount}<br>
-                    <strong>Last Active:</strong> ${formatRelativeTime(chat.endTime)}
-                </div>
-                ${chat.messages.map((msg, idx) => {
-                    if (msg.message && msg.message.content) {
-                        const role = msg.message.role;
-                        let content = '';
-                        
-                        if (typeof msg.message.content === 'string') {
-                            content = msg.message.content;
-                        } else if (Array.isArray(msg.message.content)) {
-                            content = msg.message.content
-                                .map(c => c.text || '')
-                                .join('');
-                        }
-                        
-                        // Highlight search term if present
-                        const highlightedContent = searchTerm ? 
-                            highlightText(content, searchTerm) : 
-                            escapeHtml(content);
-                        
-                        return `
-                            <div class="message ${role}" data-message-index="${idx}">
-                                <div class="message-role">${role.toUpperCase()}</div>
-                                <div class="message-content">${highlightedContent}</div>
-                                <div class="message-time">${formatRelativeTime(msg.timestamp)}</div>
-                            </div>
-                        `;
-                    }
-                    return '';
-                }).join('')}
-            `;
-        }
-        
-        // Function to navigate between matches
-        function navigateMatch(direction) {
-            if (modalSearchMatches.length === 0) return;
-            
-            // Remove current highlight
-            const currentMarks = document.querySelectorAll('mark.current');
-            currentMarks.forEach(mark => mark.classList.remove('current'));
-            
-            if (direction === 'next') {
-                currentMatchIndex = (currentMatchIndex + 1) % modalSearchMatches.length;
-            } else {
-                currentMatchIndex = currentMatchIndex - 1;
-                if (currentMatchIndex < 0) currentMatchIndex = modalSearchMatches.length - 1;
-            }
-            
-            // Scroll to and highlight current match
-            const match = modalSearchMatches[currentMatchIndex];
-            if (match.marks && match.marks.length > 0) {
-                match.marks[0].classList.add('current');
-                match.marks[0].scrollIntoView({ behavior: 'smooth', block: 'center' });
-            }
-            
-            updateMatchCounter();
-        }
-        
-        // Function to update match counter
-        function updateMatchCounter() {
-            const counter = document.getElementById('match-counter');
-            if (modalSearchMatches.length > 0) {
-                counter.textContent = `${currentMatchIndex + 1} of ${modalSearchMatches.length}`;
-            } else if (document.getElementById('modal-search').value) {
-                counter.textContent = 'No matches';
-            } else {
-                counter.textContent = '';
-            }
-        }
-        
-        // Allow closing modal with Escape key
-        document.addEventListener('keydown', (e) => {
-            if (e.key === 'Escape') closeModal();
-        });
-        
-        // Click outside modal to close
-        document.getElementById('chat-modal').addEventListener('click', (e) => {
-            if (e.target.id === 'chat-modal') closeModal();
-        });
-    </script>
-</body>
-</html>'''
-        
+    def daemon_lost(self, remote, error):
+        """Index the chat files locally from now on, and ask the client to retry this request"""
+        with ChatHistoryHandler.fallback_lock:
+            # Concurrent requests may all see the daemon go; only the first replaces it
+            if ChatHistoryHandler.index is remote:
+                print(f"Lost the claude-resume daemon at {remote.client.path} ({error}); "
+                      f"indexing chat files in {CLAUDE_PROJECTS_DIR} in the background...")
+                index = ChatIndex(CLAUDE_PROJECTS_DIR, os.getcwd())
+                index.start_warmup()
+                ChatHistoryHandler.index = index
+                remote.close()
+        if self._status is None:
+            self.send_json({'error': 'The claude-resume daemon stopped; the server is indexing chat files itself, '
+                                     'retry shortly'}, 503, {'Retry-After': '1'})
+    
+    def send_json(self, data, status=200, headers=None):
+        """Send a JSON response"""
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def serve_ready(self):
+        """Report whether the initial index build has finished"""
+        index = self.get_index()
+        ready = index.ready.is_set()
+        self.send_json({'ready': ready, 'generation': index.generation}, 200 if ready else 503)
+    
+    def serve_chat(self, chat_id):
+        """Serve a single chat, including its transcript"""
+        index = self.get_index()
+        index.wait_ready()
+        chat = index.get_chat(chat_id)
+        if chat is None:
+            self.send_json({'error': f"Chat {chat_id} not found"}, 404)
+            return
+        self.send_json({'chat': chat, 'indexId': index.index_id, 'generation': index.generation})
+    
+    def serve_related(self, chat_id):
+        """Serve chats whose transcripts are similar to this one (MinHash/LSH)"""
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        try:
+            limit = int_param(query, 'limit', 10)
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        index = self.get_index()
+        index.wait_ready()
+        if index.get_chat(chat_id) is None:
+            self.send_json({'error': f"Chat {chat_id} not found"}, 404)
+            return
+        related = [dict(chat_metadata(chat), similarity=round(score, 3)) for chat, score in index.related(chat_id, limit)]
+        self.send_json({'id': chat_id, 'related': related, 'generation': index.generation})
+    
+    def serve_suggest(self):
+        """Serve completions for ?prefix= from the indexed vocabulary; answers from what is indexed so far"""
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        prefix = query.get('prefix', [''])[0]
+        try:
+            limit = int_param(query, 'limit', DEFAULT_SUGGESTIONS)
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        index = self.get_index()
+        self.send_json({'prefix': prefix, 'suggestions': index.suggest(prefix, limit), 'generation': index.generation})
+    
+    def serve_duplicates(self):
+        """Serve clusters of near-duplicate chats, newest first within each cluster"""
+        index = self.get_index()
+        index.wait_ready()
+        self.send_json({'clusters': index.duplicate_clusters(), 'indexId': index.index_id, 'generation': index.generation})
+    
+    def serve_search(self):
+        """Serve chats matching ?q= (mode=ranked|fuzzy by BM25 relevance, or mode=regex by hit count)"""
+        trace = RequestTrace(self.path)
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        q = query.get('q', [''])[0]
+        mode = query.get('mode', ['ranked'])[0]
+        project = query.get('project', [None])[0]
+        cursor = query.get('cursor', [None])[0]
+        
+        index = self.get_index()
+        try:
+            limit = int_param(query, 'limit', 50)
+            offset = int_param(query, 'offset', 0)
+            budget_ms = int_param(query, 'budget', DEFAULT_BUDGET_MS)
+            snippets = int_param(query, 'snippets', MAX_SNIPPETS)
+            with trace.phase('warmup'):
+                index.wait_ready()
+            with trace.phase('search'):
+                response = index.search(q, mode, project, limit, offset, cursor, budget_ms, snippets)
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        
+        found = response.pop('snippets')
+        response.update({
+            'query': q,
+            'mode': mode,
+            'results': [dict(chat_metadata(chat), score=round(score, 4),
+                             **found.get(chat['id'], {'hits': 0, 'snippets': []}))
+                        for chat, score in response['results']],
+            'offset': offset,
+            'indexId': index.index_id,
+            'generation': index.generation
+        })
+        self.send_json(response, headers={'Server-Timing': trace.server_timing()})
+        
+        if self.trace_requests:
+            trace.log()
+    
+    def serve_facets(self):
+        """Serve per-project aggregates maintained by the index"""
+        self.send_json(self.get_index().facet_summary())
+    
+    def serve_progress(self):
+        """Report indexing progress"""
+        self.send_json(self.get_index().progress())
+    
+    def serve_metrics(self):
+        """Serve metrics in the Prometheus text exposition format"""
+        body = metrics.REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header('Content-type', metrics.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def serve_html(self):
+        """Serve the main HTML interface"""
+        content = (STATIC_DIR / 'index.html').read_bytes()
         self.send_response(200)
         self.send_header('Content-type', 'text/html')
         self.end_headers()
-        self.wfile.write(html_content.encode())
+        self.wfile.write(content)
     
     def serve_chats(self):
         """Serve chat data as JSON"""
+        trace = RequestTrace(self.path)
         try:
-            chats = []
-            projects = set()
-            
-            # Find all JSONL files in projects directory
-            for project_dir in CLAUDE_PROJECTS_DIR.iterdir():
-                if project_dir.is_dir():
-                    # Extract project name from directory name
-                    # Directory format: -Users-username-Projects-project-name
-                    dir_name = project_dir.name
-                    
-                    # Remove leading dash if present
-                    if dir_name.startswith('-'):
-                        dir_name = dir_name[1:]
-                    
-                    # Split by -Projects- to get the project part
-                    if 'Projects-' in dir_name:
-                        # Everything after 'Projects-' is the project name
-                        project_name = dir_name.split('Projects-', 1)[-1]
-                    else:
-                        # Fallback: take everything after the username
-                        parts = dir_name.split('-')
-                        if len(parts) > 2 and parts[0] == 'Users':
-                            project_name = '-'.join(parts[2:])
-                        else:
-                            project_name = dir_name
-                    
-                    for jsonl_file in project_dir.glob('*.jsonl'):
-                        try:
-                            with open(jsonl_file, 'r', encoding='utf-8') as f:
-                                lines = f.readlines()
-                                if not lines:
-                                    continue
-                                
-                                messages = []
-                                for line in lines:
-                                    try:
-                                        msg = json.loads(line.strip())
-                                        messages.append(msg)
-                                    except json.JSONDecodeError:
-                                        continue
-                                
-                                if messages:
-                                    # Try to extract summary BEFORE filtering
-                                    summary = extract_summary(messages)
-                                    
-                                    # Filter out empty messages
-                                    messages = filter_messages(messages)
-                                    if not messages:
-                                        continue
-                                    
-                                    first_msg = messages[0]
-                                    last_msg = messages[-1]
-                                    
-                                    # Try to find first sensible message (user or assistant)
-                                    first_user_msg = ''
-                                    for msg in messages[:20]:  # Look at first 20 messages
-                                        if msg.get('message'):
-                                            role = msg['message'].get('role', '')
-                                            content = msg['message'].get('content', '')
-                                            if role in ['user', 'assistant'] and content:
-                                                cleaned_content = clean_message_content(content)
-                                                if cleaned_content and len(cleaned_content) > 5:  # Lower threshold for technical messages
-                                                    first_user_msg = cleaned_content
-                                                    break
-                                    
-                                    # If still no sensible message found, default to empty
-                                    if not first_user_msg:
-                                        first_user_msg = 'No message content'
-                                    
-                                    cwd = first_msg.get('cwd', 'Unknown')
-                                    
-                                    chat_data = {
-                                        'id': first_msg.get('sessionId', jsonl_file.stem),
-                                        'fileName': jsonl_file.name,
-                                        'project': project_name,
-                                        'startTime': first_msg.get('timestamp', 'Unknown'),
-                                        'endTime': last_msg.get('timestamp', 'Unknown'),
-                                        'messageCount': len(messages),
-                                        'firstMessage': first_user_msg or 'No user message',
-                                        'summary': summary,
-                                        'messages': messages,
-                                        'cwd': cwd
-                                    }
-                                    
-                                    # Get current directory context
-                                    current_dir = os.getcwd()
-                                    
-                                    # Only add chat if it matches current directory context
-                                    if should_show_chat(chat_data, current_dir):
-                                        projects.add(project_name)
-                                        chats.append(chat_data)
-                        except Exception as e:
-                            print(f"Error processing {jsonl_file}: {e}")
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            sort = query.get('sort', ['start'])[0]
+            if sort not in SORT_KEYS:
+                self.send_json({'error': f"Unknown sort '{sort}', expected one of {sorted(SORT_KEYS)}"}, 400)
+                return
+            try:
+                offset = int_param(query, 'offset', 0)
+                limit = int_param(query, 'limit', None)
+                since = int_param(query, 'since', None)
+            except ValueError as e:
+                self.send_json({'error': str(e)}, 400)
+                return
+            
+            index = self.get_index()
+            # Let an in-flight warm-up finish instead of starting a second cold scan
+            with trace.phase('warmup'):
+                index.wait_ready()
+            # Later pages are served from the snapshot the first page refreshed
+            if offset == 0:
+                index.refresh(trace)
+            # List pages are metadata only; transcripts are fetched per chat from /api/chats/:id.
+            # A daemon-backed index sends just the requested page over its socket.
+            chats, total, projects = index.chat_page(sort, offset, 0 if since is not None else limit)
             
             response_data = {
-                'chats': chats,
-                'projects': list(projects)
+                'projects': list(projects),
+                'indexId': index.index_id,
+                'generation': index.generation,
+                'offset': offset
             }
             
+            # Delta sync: only chats changed (and ids removed) after the client's generation
+            if since is not None:
+                changed, response_data['removed'] = index.changes_since(since, sort, transcripts=False)
+                total = len(changed)
+                chats = changed[offset:offset + limit] if limit is not None else changed[offset:]
+            
+            response_data['total'] = total
+            response_data['chats'] = chats
+            
+            with trace.phase('dumps'):
+                body = json.dumps(response_data).encode()
+            
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
+            self.send_header('Server-Timing', trace.server_timing())
             self.end_headers()
-            self.wfile.write(json.dumps(response_data).encode())
+            self.wfile.write(body)
+            
+            if self.trace_requests:
+                trace.log()
             
         except Exception as e:
+            if isinstance(e, OSError) and isinstance(self._index, RemoteIndex):
+                raise
             self.send_response(500)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
@@ -797,6 +321,8 @@ class ChatHistoryHandler(SimpleHTTPRequestHandler):
 
 def open_browser(host, port):
     """Open the browser after a short delay"""
+    # Imported here: with --no-browser it is never needed
+    import webbrowser
     time.sleep(1)
     webbrowser.open(f'http://{host}:{port}')
 
@@ -809,6 +335,7 @@ def main():
     # Get configuration from environment or defaults
     HOST = os.environ.get('CLAUDE_RESUME_HOST', 'localhost')
     NO_BROWSER = os.environ.get('CLAUDE_RESUME_NO_BROWSER', '0') == '1'
+    ChatHistoryHandler.trace_requests = os.environ.get('CLAUDE_RESUME_TRACE', '0') == '1'
     
     # Try to use specified port or find an available one
     requested_port = int(os.environ.get('CLAUDE_RESUME_PORT', 8888))
@@ -819,12 +346,20 @@ def main():
         PORT = find_free_port(requested_port + 1)
         print(f"Port {requested_port} is busy, using port {PORT} instead")
     
-    # Count available chats
-    jsonl_files = list(CLAUDE_PROJECTS_DIR.glob('*/*.jsonl'))
-    print(f"Found {len(jsonl_files)} chat files in {CLAUDE_PROJECTS_DIR}")
+    # Use a running daemon's resident index if there is one, so nothing has to be re-scanned
+    client = None if os.environ.get('CLAUDE_RESUME_NO_DAEMON', '0') == '1' else connect_daemon()
+    if client is not None:
+        ChatHistoryHandler.index = RemoteIndex(client, os.getcwd())
+        print(f"Using the index of the claude-resume daemon at {client.path}")
+    else:
+        # Start indexing in the background so the first page load is warm
+        ChatHistoryHandler.index = ChatIndex(CLAUDE_PROJECTS_DIR, os.getcwd())
+        ChatHistoryHandler.index.start_warmup()
+        print(f"Indexing chat files in {CLAUDE_PROJECTS_DIR} in the background...")
     
     # Start the server
-    server = HTTPServer((HOST, PORT), ChatHistoryHandler)
+    server = ThreadingHTTPServer((HOST, PORT), ChatHistoryHandler)
+    server.daemon_threads = True
     print(f"\nStarting Claude Chat History Viewer...")
     print(f"Server running at http://{HOST}:{PORT}")
     print("Press Ctrl+C to stop the server\n")
@@ -840,6 +375,8 @@ def main():
     except KeyboardInterrupt:
         print("\nServer stopped")
         server.server_close()
+    finally:
+        ChatHistoryHandler.index.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,156 @@
+"""
+Near-duplicate detection for chat sessions
+MinHash signatures over word shingles, bucketed with locality-sensitive hashing
+"""
+import zlib
+
+from .search import tokenize
+
+# Signature length; one-permutation MinHash splits a single hash into this many bins
+NUM_BINS = 64
+BIN_BITS = 6
+
+# LSH banding: sessions sharing any band of ROWS values become candidates.
+# 32 bands of 2 rows catch ~97% of pairs at Jaccard similarity 0.33, and a
+# quarter of pairs at 0.1, so related sessions are found without a full scan.
+BANDS = 32
+ROWS = 2
+
+SHINGLE_SIZE = 3
+
+# Only the opening words of a session are sketched, bounding ingestion cost for huge
+# transcripts; resumed and retried sessions share their opening anyway
+MAX_SHINGLE_TOKENS = 5000
+
+# Estimated Jaccard similarity above which sessions are listed as related, or collapsed as duplicates
+RELATED_THRESHOLD = 0.3
+DUPLICATE_THRESHOLD = 0.8
+
+
+def shingles(text):
+    """Hashes of the word n-grams at the start of a text"""
+    tokens = tokenize(text[:MAX_SHINGLE_TOKENS * 16])[:MAX_SHINGLE_TOKENS]
+    if len(tokens) < SHINGLE_SIZE:
+        grams = [' '.join(tokens)] if tokens else []
+    else:
+        grams = map(' '.join, zip(*(tokens[i:] for i in range(SHINGLE_SIZE))))
+    return set(map(zlib.crc32, map(str.encode, grams)))
+
+
+def minhash(text):
+    """MinHash signature of a text as a tuple of NUM_BINS ints, or None if it has no words
+
+    Uses one-permutation hashing: each shingle hash picks a bin with its low bits
+    and competes for that bin's minimum with the rest, so a signature costs one
+    pass instead of one per permutation. Empty bins borrow from the next filled
+    one (rotation densification) so that short texts still compare sensibly.
+    """
+    hashes = shingles(text)
+    if not hashes:
+        return None
+    signature = [None] * NUM_BINS
+    mask = NUM_BINS - 1
+    for h in hashes:
+        b = h & mask
+        value = h >> BIN_BITS
+        if signature[b] is None or value < signature[b]:
+            signature[b] = value
+    if None in signature:
+        for b in range(NUM_BINS):
+            if signature[b] is None:
+                distance = 1
+                while signature[(b + distance) % NUM_BINS] is None:
+                    distance += 1
+                # Offset borrowed values so they only match bins borrowed from the same distance
+                signature[b] = signature[(b + distance) % NUM_BINS] + (distance << 32)
+    return tuple(signature)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(x == y for x, y in zip(a, b)) / NUM_BINS
+
+
+class SimilarityIndex:
+    """MinHash signatures in LSH buckets, for related-session lookups and duplicate clusters"""
+
+    def __init__(self):
+        self.signatures = {}
+        # (band, band values) -> doc ids
+        self.buckets = {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _bands(self, signature):
+        return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+    def add(self, doc_id, signature):
+        if doc_id in self.signatures:
+            self.remove(doc_id)
+        if signature is None:
+            return
+        self.signatures[doc_id] = signature
+        for key in self._bands(signature):
+            self.buckets.setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        signature = self.signatures.pop(doc_id, None)
+        if signature is None:
+            return
+        for key in self._bands(signature):
+            docs = self.buckets[key]
+            docs.discard(doc_id)
+            if not docs:
+                del self.buckets[key]
+
+    def related(self, doc_id, limit=10, threshold=RELATED_THRESHOLD):
+        """[(other id, similarity)] for documents sharing an LSH bucket, most similar first"""
+        signature = self.signatures.get(doc_id)
+        if signature is None:
+            return []
+        candidates = set()
+        for key in self._bands(signature):
+            candidates.update(self.buckets[key])
+        candidates.discard(doc_id)
+        scored = [(other, similarity(signature, self.signatures[other])) for other in candidates]
+        scored = [item for item in scored if item[1] >= threshold]
+        scored.sort(key=lambda item: -item[1])
+        return scored[:limit]
+
+    def clusters(self, threshold=DUPLICATE_THRESHOLD):
+        """Groups of near-duplicate doc ids (each a list of two or more)
+
+        Within each bucket, members are compared against one representative
+        only and linked with union-find, which keeps the work linear in bucket
+        sizes; near-copies reliably share several bands, so links missed in one
+        bucket are usually made in another.
+        """
+        parent = {}
+
+        def find(doc_id):
+            root = doc_id
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while doc_id != root:
+                parent[doc_id], doc_id = root, parent.get(doc_id, doc_id)
+            return root
+
+        for docs in self.buckets.values():
+            if len(docs) < 2:
+                continue
+            docs = iter(docs)
+            first = next(docs)
+            signature = self.signatures[first]
+            for other in docs:
+                if similarity(signature, self.signatures[other]) >= threshold:
+                    parent.setdefault(first, first)
+                    parent.setdefault(other, other)
+                    a, b = find(first), find(other)
+                    if a != b:
+                        parent[b] = a
+
+        groups = {}
+        for doc_id in parent:
+            groups.setdefault(find(doc_id), []).append(doc_id)
+        return [members for members in groups.values() if len(members) > 1]
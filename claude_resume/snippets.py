@@ -0,0 +1,82 @@
+"""
+Search result snippets for Claude Resume
+Finds every match of a query in a chat once, on the server, and returns the densest
+windows of text with match offsets so the page can highlight without re-searching
+"""
+import re
+
+# Characters of context kept either side of a match, and the longest a snippet may grow
+SNIPPET_CONTEXT = 60
+MAX_SNIPPET_CHARS = 400
+
+# Snippets returned per chat, and matches counted before a scan stops
+MAX_SNIPPETS = 3
+MAX_HITS = 1000
+
+# Snippet windows are cut around the first this many matches; later ones are only counted
+WINDOW_HITS = 50
+
+
+def terms_pattern(terms, phrases=()):
+    """Compiled case-insensitive pattern matching whole query terms or phrases, or None
+
+    phrases are compiled patterns (see query.phrase_pattern); longer alternatives
+    come first so a phrase wins over its own first word.
+    """
+    alternatives = [phrase.pattern for phrase in phrases]
+    alternatives += [re.escape(term) for term in sorted(set(terms), key=len, reverse=True)]
+    if not alternatives:
+        return None
+    return re.compile(r'(?<!\w)(?:' + '|'.join(alternatives) + r')(?!\w)', re.IGNORECASE)
+
+
+def build_snippets(sources, pattern, limit=MAX_SNIPPETS, max_hits=MAX_HITS):
+    """Return (hits, snippets) for a pattern over sources [(label, text)]
+
+    Each snippet is {'source': label, 'offset': start in the source text,
+    'text': window, 'more': True if the source continues past the window,
+    'matches': [[start, end], ...] relative to the window}. Snippets are ordered
+    by how many matches they hold, then by position.
+    """
+    hits = 0
+    windows = []
+    for label, text in sources:
+        if not text:
+            continue
+        if hits >= WINDOW_HITS:
+            # Enough material for snippets; just count the rest, skipping empty matches.
+            # findall() would return a pattern's groups, which may be empty for a real match
+            hits += sum(1 for match in pattern.finditer(text) if match.end() > match.start())
+            if hits >= max_hits:
+                hits = max_hits
+                break
+            continue
+        window = None
+        for match in pattern.finditer(text):
+            start, end = match.span()
+            if start == end:
+                continue
+            hits += 1
+            if window and start - SNIPPET_CONTEXT <= window['end'] and end + SNIPPET_CONTEXT - window['start'] <= MAX_SNIPPET_CHARS:
+                window['spans'].append((start, end))
+                window['end'] = min(len(text), end + SNIPPET_CONTEXT)
+            else:
+                window = {'source': label, 'text': text, 'start': max(0, start - SNIPPET_CONTEXT),
+                          'end': min(len(text), end + SNIPPET_CONTEXT), 'spans': [(start, end)]}
+                windows.append(window)
+            if hits >= max_hits:
+                break
+        if hits >= max_hits:
+            break
+
+    windows.sort(key=lambda w: -len(w['spans']))
+    snippets = []
+    for w in windows[:limit]:
+        snippets.append({
+            'source': w['source'],
+            'offset': w['start'],
+            'text': w['text'][w['start']:w['end']],
+            'more': w['end'] < len(w['text']),
+            'matches': [[start - w['start'], end - w['start']] for start, end in w['spans']],
+        })
+    return hits, snippets
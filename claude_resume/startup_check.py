@@ -0,0 +1,65 @@
+"""
+Start-up budget for the command line
+Imports what each kind of command needs in a fresh interpreter under `python -X importtime`,
+and fails if that takes longer than budgeted or pulls in the web server's modules.
+Run with: python -m claude_resume.startup_check
+"""
+import compileall
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+# Modules each kind of command imports, and the most those imports may take in milliseconds
+BUDGETS = {
+    'claude-resume --help': (('claude_resume.cli',), 35),
+    'claude-resume list/search/index': (('claude_resume.cli', 'claude_resume.store', 'claude_resume.daemon'), 50),
+}
+
+# Modules only the server needs; importing any of them outside it is a regression
+SERVER_ONLY_MODULES = ('claude_resume.server', 'http.server', 'socketserver', 'webbrowser', 'multiprocessing')
+
+# Each measurement is the best of this many runs, to ride out a busy machine
+RUNS = 5
+
+# "import time: <self us> | <cumulative us> | <two spaces per nesting level><module>"
+IMPORT_TIME_RE = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def measure(modules):
+    """Return (milliseconds spent importing modules, every module imported) in a fresh interpreter"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {', '.join(modules)}"],
+                            cwd=Path(__file__).parent.parent, capture_output=True, text=True, check=True)
+    micros = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = match.groups()
+        imported.add(name)
+        # Top-level lines from the package cover everything it imports, each module counted once
+        if not indent and (name == 'claude_resume' or name.startswith('claude_resume.')):
+            micros += int(cumulative)
+    return micros / 1000, imported
+
+
+def main():
+    # Installed packages import from cached bytecode; compile it first so that compiling
+    # changed sources is not counted (PYTHONDONTWRITEBYTECODE would otherwise skip it)
+    compileall.compile_dir(Path(__file__).parent, quiet=1)
+    failed = False
+    for label, (modules, budget_ms) in BUDGETS.items():
+        runs = [measure(modules) for _ in range(RUNS)]
+        best_ms = min(ms for ms, _ in runs)
+        unwanted = sorted(set(SERVER_ONLY_MODULES).intersection(*(imported for _, imported in runs)))
+        ok = best_ms <= budget_ms and not unwanted
+        failed = failed or not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {label}: {best_ms:.1f} ms of imports (budget {budget_ms} ms)")
+        if unwanted:
+            print(f"     imports server-only modules: {', '.join(unwanted)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
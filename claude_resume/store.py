@@ -0,0 +1,440 @@
+"""
+On-disk snapshots of the chat index
+Lets the command line, and later runs of the server, start from the last build instead of
+re-parsing every chat file; only files that changed since the snapshot are parsed again
+"""
+import gc
+import marshal
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+from . import metrics
+from .index import ChatIndex, CLAUDE_PROJECTS_DIR, new_index_id, parse_chat_file
+from .tracing import RequestTrace
+
+# Bumped whenever the layout of a snapshot or of the structures in it changes;
+# snapshots in another format (or written by another Python version, whose marshal
+# format may differ) are ignored and rebuilt
+SNAPSHOT_FORMAT = 2
+MAGIC = b'CRIDX'
+HEADER_SIZE = struct.Struct('<Q')
+
+# Optional sections of a snapshot; chat entries are always loaded. A read-only search can
+# leave related-session and completion data on disk, and a listing needs no transcripts
+SECTIONS = ('texts', 'search', 'filters', 'similarity', 'suggest')
+SEARCH_SECTIONS = ('texts', 'search', 'filters')
+
+# Up to this many changed chat files are re-parsed in memory on top of a partially loaded
+# snapshot; beyond that the whole snapshot is loaded, refreshed and written back
+MAX_UNSAVED_CHANGES = 20
+
+# Errors that mean a snapshot cannot be used and has to be rebuilt
+SNAPSHOT_ERRORS = (OSError, EOFError, ValueError, TypeError, KeyError)
+
+# Chat fields compared between a snapshot and a fresh parse by verify_snapshot
+VERIFIED_FIELDS = ('id', 'fileName', 'project', 'startTime', 'endTime', 'messageCount',
+                   'firstMessage', 'summary', 'tools', 'cwd')
+
+
+def default_path():
+    """Snapshot location: $CLAUDE_RESUME_INDEX, or claude-resume/index.bin in the user cache directory"""
+    if os.environ.get('CLAUDE_RESUME_INDEX'):
+        return Path(os.environ['CLAUDE_RESUME_INDEX']).expanduser()
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_dir) / 'claude-resume' / 'index.bin'
+
+
+def _public_state(obj):
+    return {name: value for name, value in vars(obj).items() if not name.startswith('_')}
+
+
+def save_index(index, path, build=None):
+    """Write a snapshot of an index atomically, with stats about the build that produced it
+
+    build is {'seconds', 'files', 'bytes'} for the files parsed by that build.
+    """
+    path = Path(path)
+    with index._lock:
+        entries = {}
+        texts = {}
+        for key, entry in index.entries.items():
+            entry = dict(entry)
+            chat = entry['chat']
+            if chat is not None:
+                # Transcripts go in their own section, one blob per chat, so loading
+                # a snapshot does not have to decode them until they are used
+                texts[key] = index.encoded_texts.get(key) or marshal.dumps((chat['messages'], entry['toolText']))
+                entry['chat'] = {name: value for name, value in chat.items() if name != 'messages'}
+            # Only needed while an entry is being added; the derived indexes have their own copies
+            entry['toolText'] = entry['signature'] = None
+            entry['fileNames'] = ()
+            entries[key] = entry
+        index.suggest_index._sync()
+        sections = {
+            'entries': {'entries': entries, 'ids': index.ids, 'shadowed': index.shadowed, 'removed': index.removed,
+                        'facets': index.facets,
+                        'generation': index.generation, 'indexId': index.index_id},
+            'texts': texts,
+            'search': _public_state(index.search_index),
+            'filters': _public_state(index.filter_index),
+            'similarity': _public_state(index.similarity_index),
+            'suggest': {'counts': index.suggest_index.counts, 'terms': index.suggest_index.terms,
+                        'extras': {doc_id: extras for doc_id, (_, extras) in index.suggest_index.doc_terms.items()}},
+        }
+        blobs = {name: marshal.dumps(value) for name, value in sections.items()}
+        files = {key: (entry['mtime'], entry['size']) for key, entry in index.entries.items()}
+        sessions = sum(1 for entry in index.entries.values() if entry['chat'])
+
+    layout = {}
+    offset = 0
+    for name, blob in blobs.items():
+        layout[name] = (offset, len(blob))
+        offset += len(blob)
+    header = marshal.dumps({
+        'format': SNAPSHOT_FORMAT,
+        'python': tuple(sys.version_info[:2]),
+        'projectsDir': str(index.projects_dir),
+        'savedAt': time.time(),
+        'files': files,
+        'stats': {'files': len(files), 'bytes': sum(size for _, size in files.values()), 'sessions': sessions},
+        'build': build,
+        'sections': layout,
+    })
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + HEADER_SIZE.pack(len(header)) + header)
+        for blob in blobs.values():
+            f.write(blob)
+    os.replace(tmp, path)
+
+
+def read_header(path):
+    """A snapshot's header (with 'dataOffset' added), or None if it is missing, damaged or in another format"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (size,) = HEADER_SIZE.unpack(f.read(HEADER_SIZE.size))
+            header = marshal.loads(f.read(size))
+    except (OSError, EOFError, ValueError, TypeError, struct.error):
+        return None
+    if header.get('format') != SNAPSHOT_FORMAT or tuple(header.get('python', ())) != tuple(sys.version_info[:2]):
+        return None
+    header['dataOffset'] = len(MAGIC) + HEADER_SIZE.size + size
+    return header
+
+
+def read_section(path, header, name):
+    """Decode one section of a snapshot"""
+    offset, length = header['sections'][name]
+    with open(path, 'rb') as f:
+        f.seek(header['dataOffset'] + offset)
+        data = f.read(length)
+    if len(data) != length:
+        raise ValueError(f"Snapshot {path} is truncated in section '{name}'")
+    return marshal.loads(data)
+
+
+def load_index(path, header, sections=SECTIONS):
+    """Rebuild a ChatIndex from a snapshot, with only the given sections filled in
+
+    An index loaded without every section must not be saved back.
+    """
+    index = ChatIndex(header['projectsDir'])
+    # Decoding creates many small containers at once; collecting during it only costs time
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        state = read_section(path, header, 'entries')
+        index.entries = state['entries']
+        index.ids = state['ids']
+        index.shadowed = state['shadowed']
+        index.removed = state['removed']
+        index.facets = state['facets']
+        index.generation = state['generation']
+        index.index_id = state['indexId']
+        if 'texts' in sections:
+            index.encoded_texts = read_section(path, header, 'texts')
+        if 'search' in sections or 'suggest' in sections:
+            vars(index.search_index).update(read_section(path, header, 'search'))
+        if 'filters' in sections:
+            vars(index.filter_index).update(read_section(path, header, 'filters'))
+        if 'similarity' in sections:
+            vars(index.similarity_index).update(read_section(path, header, 'similarity'))
+        if 'suggest' in sections:
+            suggest = read_section(path, header, 'suggest')
+            index.suggest_index.counts = suggest['counts']
+            index.suggest_index.terms = suggest['terms']
+            # Word sets are shared with the search index rather than stored twice
+            index.suggest_index.doc_terms = {doc_id: (index.search_index.doc_terms[doc_id], extras)
+                                             for doc_id, extras in suggest['extras'].items()}
+    finally:
+        if gc_enabled:
+            # The snapshot lives as long as the index; keep later collections from re-scanning it
+            gc.freeze()
+            gc.enable()
+    index.ready.set()
+    return index
+
+
+def file_table(projects_dir):
+    """{path: (mtime ns, size)} for the chat files currently on disk
+
+    Walks the same files as index.find_chat_files, with scandir rather than
+    Path objects since this check runs before every command.
+    """
+    files = {}
+    with os.scandir(projects_dir) as projects:
+        for project in projects:
+            if not project.is_dir():
+                continue
+            with os.scandir(project.path) as chat_files:
+                for chat_file in chat_files:
+                    if not chat_file.name.endswith('.jsonl'):
+                        continue
+                    try:
+                        stat = chat_file.stat()
+                    except OSError:
+                        continue
+                    files[chat_file.path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def build_index(index, path, loaded=False):
+    """Refresh an index against the files on disk, save it, and return its build stats
+
+    An index loaded from the snapshot at path is only saved back if the refresh
+    changed it, so the snapshot keeps the stats of the build that did the work.
+    """
+    files = metrics.FILES_PARSED.get()
+    parsed = metrics.BYTES_PARSED.get()
+    start = time.perf_counter()
+    changed = index.refresh()
+    build = {'seconds': time.perf_counter() - start,
+             'files': metrics.FILES_PARSED.get() - files,
+             'bytes': metrics.BYTES_PARSED.get() - parsed}
+    if changed or not loaded:
+        save_index(index, path, build)
+    return build
+
+
+def _usable_header(path, projects_dir):
+    """A snapshot's header if it can be loaded for projects_dir, else None"""
+    header = read_header(path)
+    if header is None or header['projectsDir'] != str(projects_dir):
+        return None
+    return header
+
+
+def _refresh_snapshot(path, header, projects_dir):
+    """Load the whole snapshot (or start an empty index if it is missing or unreadable), refresh and save it
+
+    Returns (index, build stats).
+    """
+    if header is not None:
+        try:
+            index = load_index(path, header)
+            return index, build_index(index, path, loaded=True)
+        except SNAPSHOT_ERRORS as e:
+            print(f"Ignoring unreadable index snapshot {path}: {e}", file=sys.stderr)
+    print(f"Building the chat index in {path}...", file=sys.stderr)
+    index = ChatIndex(projects_dir)
+    return index, build_index(index, path)
+
+
+def open_index(path=None, projects_dir=None, sections=SECTIONS):
+    """An up-to-date index of every chat, from the snapshot where possible
+
+    Only the requested sections are loaded, and a few changed files are
+    re-parsed on top of them in memory. When more files changed, the whole
+    snapshot (or, without a usable one, an empty index) is refreshed and
+    saved back.
+    """
+    path = Path(path or default_path())
+    projects_dir = Path(projects_dir or CLAUDE_PROJECTS_DIR)
+    header = _usable_header(path, projects_dir)
+    if header is not None:
+        try:
+            files = file_table(projects_dir)
+            changed = set(files.items()) ^ set(header['files'].items())
+            # A modified file appears twice, as its old and its new (mtime, size)
+            if len({key for key, _ in changed}) <= MAX_UNSAVED_CHANGES:
+                index = load_index(path, header, sections)
+                if changed:
+                    index.refresh()
+                return index
+        except SNAPSHOT_ERRORS as e:
+            print(f"Ignoring unreadable index snapshot {path}: {e}", file=sys.stderr)
+            header = None
+    index, _ = _refresh_snapshot(path, header, projects_dir)
+    return index
+
+
+def update_snapshot(path=None, projects_dir=None, rebuild=False):
+    """Bring a snapshot up to date, or with rebuild start it over, and return its build stats"""
+    path = Path(path or default_path())
+    projects_dir = Path(projects_dir or CLAUDE_PROJECTS_DIR)
+    header = None if rebuild else _usable_header(path, projects_dir)
+    _, build = _refresh_snapshot(path, header, projects_dir)
+    return build
+
+
+def snapshot_stats(path=None, projects_dir=None):
+    """What a snapshot holds and how it was built, from its header alone, or None without one
+
+    Returns {'path', 'size', 'savedAt', 'files', 'bytes', 'sessions', 'build',
+    'sections' {name: bytes}, 'changed'}; changed counts chat files added,
+    modified or deleted on disk since the snapshot was saved.
+    """
+    path = Path(path or default_path())
+    header = read_header(path)
+    if header is None:
+        return None
+    try:
+        files = file_table(projects_dir or header['projectsDir'])
+    except OSError:
+        files = {}
+    changed = set(files.items()) ^ set(header['files'].items())
+    return dict(header['stats'], path=str(path), size=path.stat().st_size, savedAt=header['savedAt'],
+                projectsDir=header['projectsDir'], build=header['build'],
+                sections={name: length for name, (_, length) in header['sections'].items()},
+                changed=len({key for key, _ in changed}))
+
+
+def _check_consistency(index, header, texts):
+    """Problems found cross-checking the structures of a loaded snapshot"""
+    problems = []
+    entries = index.entries
+    files = {key: (entry['mtime'], entry['size']) for key, entry in entries.items()}
+    if files != header['files']:
+        problems.append("file table in the header does not match the stored entries")
+    if set(texts) != {key for key, entry in entries.items() if entry['chat']}:
+        problems.append("transcripts are missing for some chats, or stored for chats that do not exist")
+    visible = {}
+    for key, entry in entries.items():
+        if entry['visible']:
+            visible.setdefault(entry['chat']['id'], set()).add(key)
+    for chat_id, key in index.ids.items():
+        if key not in visible.get(chat_id, ()):
+            problems.append(f"session {chat_id} points at {key}, which does not hold it")
+    if set(index.ids) != set(visible):
+        problems.append(f"{len(set(visible) ^ set(index.ids))} sessions are missing from the id table, or stale in it")
+    shadowed = {chat_id: keys - {index.ids.get(chat_id)} for chat_id, keys in visible.items() if len(keys) > 1}
+    if index.shadowed != shadowed:
+        problems.append("files holding the same session as another are not all recorded as its other copies")
+    ids = set(index.ids)
+    for name, docs in (('search', index.search_index.lengths), ('similarity', index.similarity_index.signatures),
+                       ('completion', index.suggest_index.doc_terms)):
+        if set(docs) != ids:
+            problems.append(f"{name} index covers {len(set(docs) ^ ids)} sessions it should not, or misses them")
+    if not set(index.filter_index.start_ts) <= ids or not set(index.filter_index.end_ts) <= ids:
+        problems.append("filter index holds sessions that are not in the id table")
+    sessions = sum(facet['sessions'] for facet in index.facets.values())
+    if sessions != len(ids):
+        problems.append(f"project facets count {sessions} sessions, but {len(ids)} are listed")
+    return problems
+
+
+def _check_file(key, entry, encoded):
+    """Problem found re-parsing one chat file and comparing it with its stored entry, or None"""
+    try:
+        chat = parse_chat_file(Path(key), entry['project'], RequestTrace())
+    except Exception as e:
+        return f"{key}: cannot be parsed: {e}"
+    stored = entry['chat']
+    if chat is None or stored is None:
+        return None if chat is stored else f"{key}: {'no longer' if chat is None else 'now'} holds a usable chat"
+    tool_text = chat.pop('toolText')
+    differing = [name for name in VERIFIED_FIELDS if chat.get(name) != stored.get(name)]
+    messages, stored_tool_text = marshal.loads(encoded)
+    if messages != chat['messages']:
+        differing.append('messages')
+    if stored_tool_text != tool_text:
+        differing.append('tool text')
+    return f"{key}: stored {', '.join(differing)} differ from the file" if differing else None
+
+
+def verify_snapshot(path=None, projects_dir=None, deep=True):
+    """Check a snapshot's integrity, on its own and against the chat files on disk
+
+    Returns {'problems', 'new', 'modified', 'missing', 'checked'}. problems
+    lists damage: sections that do not decode, structures that disagree with
+    each other, and (with deep) stored chats that differ from a fresh parse of
+    an unchanged file. The file lists only mean the snapshot is out of date.
+    """
+    path = Path(path or default_path())
+    report = {'problems': [], 'new': [], 'modified': [], 'missing': [], 'checked': 0}
+    header = read_header(path)
+    if header is None:
+        report['problems'].append(f"{path} is missing, damaged, or written by another version")
+        return report
+    try:
+        index = load_index(path, header)
+        texts = read_section(path, header, 'texts')
+    except SNAPSHOT_ERRORS as e:
+        report['problems'].append(f"{path} cannot be decoded: {e}")
+        return report
+    report['problems'].extend(_check_consistency(index, header, texts))
+
+    try:
+        files = file_table(projects_dir or header['projectsDir'])
+    except OSError as e:
+        report['problems'].append(f"cannot read the projects directory: {e}")
+        return report
+    stored = header['files']
+    report['new'] = sorted(set(files) - set(stored))
+    report['missing'] = sorted(set(stored) - set(files))
+    report['modified'] = sorted(key for key in set(files) & set(stored) if files[key] != stored[key])
+    if deep:
+        # Files that changed since the snapshot are expected to differ; only unchanged ones are compared
+        for key in sorted(set(files) & set(stored)):
+            if files[key] != stored[key] or key not in index.entries:
+                continue
+            problem = _check_file(key, index.entries[key], texts.get(key))
+            report['checked'] += 1
+            if problem:
+                report['problems'].append(problem)
+    return report
+
+
+def _stray_temp_files(path):
+    """Temporary snapshot files left behind by writers that no longer run"""
+    stray = []
+    for tmp in path.parent.glob(f'{path.name}.*.tmp'):
+        try:
+            os.kill(int(tmp.suffixes[-2][1:]), 0)
+        except (ValueError, IndexError, ProcessLookupError):
+            stray.append(tmp)
+        except PermissionError:
+            # The pid belongs to another user's live process
+            continue
+    return stray
+
+
+def vacuum_snapshot(path=None):
+    """Rewrite a snapshot without accumulated garbage, and delete leftover temporary files
+
+    Removal tombstones are dropped, under a new index id so clients syncing
+    deltas start over, and so are completion terms no chat uses any more.
+    Returns (size before, size after, temporary files deleted) in bytes.
+    """
+    path = Path(path or default_path())
+    header = read_header(path)
+    if header is None:
+        raise ValueError(f"No usable index snapshot at {path}")
+    before = path.stat().st_size
+    index = load_index(path, header)
+    index.removed = {}
+    index.index_id = new_index_id()
+    index.suggest_index.compact()
+    save_index(index, path, header['build'])
+    stray = _stray_temp_files(path)
+    for tmp in stray:
+        before += tmp.stat().st_size
+        tmp.unlink()
+    return before, path.stat().st_size, len(stray)
@@ -0,0 +1,125 @@
+"""
+Search-box autocompletion for Claude Resume
+A sorted array of vocabulary terms (words, identifiers and file names) with document
+frequencies, kept up to date as chats are indexed and answered with a binary search
+"""
+import bisect
+import heapq
+import re
+
+# File names as they appear in tool arguments and prompts: a name of two or more characters
+# with an extension, not directly preceded or followed by more of a word (so "e.g." does not qualify)
+FILE_NAME_RE = re.compile(r'(?<![\w.-])[\w-]{2,}(?:\.[\w-]+)*\.[A-Za-z][A-Za-z0-9]{0,7}(?![\w-]|\.\w)')
+
+# Only this much of a chat's text is scanned for file names
+MAX_FILE_NAME_CHARS = 200000
+
+# New terms are merged into the sorted array in place while there are few of them;
+# beyond this many the array is re-sorted in one go
+MERGE_THRESHOLD = 256
+
+# Suggestions returned when the caller does not ask for a number
+DEFAULT_SUGGESTIONS = 10
+
+# Prefixes up to this long match large slices of the vocabulary, so their answers are
+# remembered until the next document is added or removed
+MEMO_PREFIX_LENGTH = 2
+
+
+def file_names(text):
+    """Lowercase file names mentioned in a text"""
+    return {name.lower() for name in FILE_NAME_RE.findall(text[:MAX_FILE_NAME_CHARS])} if text else set()
+
+
+class SuggestIndex:
+    """Vocabulary terms in sorted order with the number of chats using each"""
+
+    def __init__(self):
+        # term -> number of documents containing it
+        self.counts = {}
+        # doc_id -> (words, extra terms) it contributed; words is shared with the search index, not copied
+        self.doc_terms = {}
+        # Sorted terms, possibly including some whose count dropped to zero, plus terms
+        # not merged in yet; both are reconciled on the next lookup
+        self.terms = []
+        self._pending = set()
+        self._dead = 0
+        # (prefix, limit) -> suggestions for short prefixes
+        self._memo = {}
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, doc_id, words, extras=()):
+        """Count a document's terms: its word set plus extras such as file names"""
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+        self._memo = {}
+        extras = {term for term in extras if term not in words}
+        self.doc_terms[doc_id] = (words, extras)
+        for terms in (words, extras):
+            for term in terms:
+                count = self.counts.get(term)
+                if count is None:
+                    self._pending.add(term)
+                self.counts[term] = (count or 0) + 1
+
+    def remove(self, doc_id):
+        """Uncount a document's terms"""
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._memo = {}
+        for group in terms:
+            for term in group:
+                count = self.counts[term] - 1
+                if count:
+                    self.counts[term] = count
+                    continue
+                del self.counts[term]
+                if term in self._pending:
+                    self._pending.discard(term)
+                else:
+                    self._dead += 1
+
+    def _sync(self):
+        """Fold pending terms into the sorted array, and drop dead ones once they pile up"""
+        if self._dead > len(self.terms) // 4:
+            self.terms = [term for term in self.terms if term in self.counts]
+            self._dead = 0
+        if not self._pending:
+            return
+        # A term removed and added back may still be in the array
+        if len(self._pending) <= MERGE_THRESHOLD:
+            for term in self._pending:
+                i = bisect.bisect_left(self.terms, term)
+                if i == len(self.terms) or self.terms[i] != term:
+                    self.terms.insert(i, term)
+        else:
+            self.terms = sorted(set(self.terms).union(self._pending))
+        self._pending = set()
+
+    def compact(self):
+        """Drop every dead term from the sorted array, however few there are"""
+        # The dead-term count is not kept in snapshots, so a loaded array may hold more than it says
+        self.terms = [term for term in self.terms if term in self.counts]
+        self._dead = 0
+        self._sync()
+
+    def suggest(self, prefix, limit=DEFAULT_SUGGESTIONS):
+        """[(term, count)] for terms starting with prefix, most widely used first"""
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+        if (prefix, limit) in self._memo:
+            return self._memo[prefix, limit]
+        self._sync()
+        start = bisect.bisect_left(self.terms, prefix)
+        # Every string starting with prefix sorts below prefix + the highest code point
+        stop = bisect.bisect_left(self.terms, prefix + '\U0010ffff', start)
+        counts = self.counts
+        matches = ((term, counts[term]) for term in self.terms[start:stop] if term in counts)
+        suggestions = heapq.nlargest(limit, matches, key=lambda item: (item[1], -len(item[0])))
+        if len(prefix) <= MEMO_PREFIX_LENGTH:
+            self._memo[prefix, limit] = suggestions
+        return suggestions
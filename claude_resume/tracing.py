@@ -0,0 +1,58 @@
+"""
+Lightweight per-request phase tracing for Claude Resume
+Phase durations are reported as a Server-Timing header and, in --trace mode, logged
+"""
+import time
+from contextlib import contextmanager
+
+
+class RequestTrace:
+    """Accumulates wall time per phase, plus per-file timings, for one request"""
+
+    def __init__(self, label=''):
+        self.label = label
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.files = []
+
+    def add(self, name, seconds):
+        """Add elapsed seconds to a phase"""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block of code as part of a phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def record_file(self, path, seconds, size=0):
+        """Remember how long a single file took to process"""
+        self.files.append((seconds, str(path), size))
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        """Format phases as a Server-Timing header value (durations in ms)"""
+        entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.phases.items()]
+        entries.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(entries)
+
+    def slowest_files(self, count=5):
+        return sorted(self.files, reverse=True)[:count]
+
+    def log(self, count=5):
+        """Print the phase breakdown and the slowest files"""
+        total = self.elapsed()
+        print(f"[trace] {self.label} {total * 1000:.1f}ms")
+        for name, seconds in self.phases.items():
+            share = (seconds / total * 100) if total else 0
+            print(f"[trace]   {name:<12} {seconds * 1000:8.1f}ms {share:5.1f}%")
+        slowest = self.slowest_files(count)
+        if slowest:
+            print("[trace]   slowest files:")
+            for seconds, path, size in slowest:
+                print(f"[trace]     {seconds * 1000:8.1f}ms {size:>10} bytes  {path}")
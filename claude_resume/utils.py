@@ -3,8 +3,33 @@ Utility functions for Claude Resume
 """
 import os
 import re
+from datetime import datetime
 from pathlib import Path
 
+# Block-type flags for normalized messages
+BLOCK_TEXT = 1
+BLOCK_TOOL_USE = 2
+BLOCK_TOOL_RESULT = 4
+BLOCK_THINKING = 8
+BLOCK_IMAGE = 16
+
+# Tool text is indexed for search but capped, per block and per chat, so large
+# command outputs cannot dominate the index
+TOOL_BLOCK_CHARS = 2000
+TOOL_FIELD_CHARS = 100000
+
+BLOCK_FLAGS = {
+    'text': BLOCK_TEXT,
+    'tool_use': BLOCK_TOOL_USE,
+    'tool_result': BLOCK_TOOL_RESULT,
+    'thinking': BLOCK_THINKING,
+    'image': BLOCK_IMAGE,
+}
+
+def chat_metadata(chat):
+    """Return a chat without its transcript, for list and search payloads"""
+    return {key: value for key, value in chat.items() if key != 'messages'}
+
 def clean_message_content(content):
     """Clean message content by removing caveat text and getting first sensible content"""
     if not content:
@@ -160,4 +185,89 @@ def extract_summary(messages):
                 summary = ' '.join(summary.split())[:200]
                 return summary
     
-    return None
\ No newline at end of file
+    return None
+
+def extract_tool_names(messages):
+    """Return the sorted names of the tools invoked via tool_use blocks"""
+    names = set()
+    for msg in messages:
+        content = (msg.get('message') or {}).get('content')
+        if isinstance(content, list):
+            for c in content:
+                if isinstance(c, dict) and c.get('type') == 'tool_use' and c.get('name'):
+                    names.add(c['name'])
+    return sorted(names)
+
+def tool_input_text(value):
+    """Flatten a tool_use input (usually a dict of arguments) to its string values"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, list):
+        return '\n'.join(text for text in map(tool_input_text, value) if text)
+    return '' if value is None else str(value)
+
+def extract_tool_text(messages):
+    """Return {'tool_use': text, 'tool_result': text} from tool blocks, capped to TOOL_*_CHARS"""
+    parts = {'tool_use': [], 'tool_result': []}
+    sizes = {'tool_use': 0, 'tool_result': 0}
+    for msg in messages:
+        content = (msg.get('message') or {}).get('content')
+        if not isinstance(content, list):
+            continue
+        for c in content:
+            if not isinstance(c, dict) or c.get('type') not in parts:
+                continue
+            if c['type'] == 'tool_use':
+                text = ' '.join(filter(None, [c.get('name'), tool_input_text(c.get('input'))]))
+            else:
+                text = flatten_content(c.get('content'))
+            field = c['type']
+            text = text[:min(TOOL_BLOCK_CHARS, TOOL_FIELD_CHARS - sizes[field])]
+            if text:
+                parts[field].append(text)
+                sizes[field] += len(text)
+    return {field: '\n'.join(texts) for field, texts in parts.items()}
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp into integer epoch milliseconds, or None"""
+    if not value or not isinstance(value, str) or value == 'Unknown':
+        return None
+    try:
+        # fromisoformat() only accepts a trailing Z from Python 3.11
+        if value.endswith('Z'):
+            value = value[:-1] + '+00:00'
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
+    except ValueError:
+        return None
+
+def flatten_content(content):
+    """Flatten message content (string or list of blocks) to plain text"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return '\n'.join(c.get('text', '') for c in content if isinstance(c, dict) and c.get('text'))
+    return ''
+
+def content_flags(content):
+    """Return a bitmask of the block types present in message content"""
+    if isinstance(content, str):
+        return BLOCK_TEXT if content else 0
+    flags = 0
+    if isinstance(content, list):
+        for c in content:
+            if isinstance(c, dict):
+                flags |= BLOCK_FLAGS.get(c.get('type'), 0)
+    return flags
+
+def normalize_message(msg):
+    """Reduce a raw JSONL message to a compact record for the API"""
+    message_data = msg.get('message') or {}
+    content = message_data.get('content', '')
+    return {
+        'role': message_data.get('role', ''),
+        'ts': parse_timestamp(msg.get('timestamp')),
+        'text': flatten_content(content),
+        'flags': content_flags(content),
+    }
@@ -0,0 +1,35 @@
+"""
+Shared fixtures: chat files laid out the way Claude Code writes them
+"""
+import json
+
+import pytest
+
+
+def chat_lines(session_id, texts, day=1, cwd='/work/app'):
+    """JSONL records of a session alternating user and assistant turns, one minute apart"""
+    lines = []
+    for i, text in enumerate(texts):
+        role = 'user' if i % 2 == 0 else 'assistant'
+        lines.append(json.dumps({'type': role, 'sessionId': session_id, 'cwd': cwd,
+                                 'timestamp': f'2025-01-{day:02d}T00:{i:02d}:00Z',
+                                 'message': {'role': role, 'content': text}}))
+    return '\n'.join(lines) + '\n'
+
+
+@pytest.fixture
+def projects_dir(tmp_path):
+    path = tmp_path / 'projects'
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def write_chat(projects_dir):
+    """write_chat(name, session_id, texts, day=1, project='-work-app', cwd='/work/app') -> path of the file"""
+    def write(name, session_id, texts, day=1, project='-work-app', cwd='/work/app'):
+        path = projects_dir / project / f'{name}.jsonl'
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(chat_lines(session_id, texts, day, cwd), encoding='utf-8')
+        return path
+    return write
@@ -0,0 +1,65 @@
+"""
+The per-generation LRU of search result sets
+"""
+from claude_resume import metrics
+from claude_resume.cache import QueryCache
+
+
+def lookups():
+    return {result: metrics.QUERY_CACHE_LOOKUPS.get(result=result) for result in ('hit', 'miss')}
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = QueryCache(size=2)
+    cache.put(1, 'a', 'A')
+    cache.put(1, 'b', 'B')
+    # Reading a marks it as recently used, so b goes first
+    assert cache.get(1, 'a') == 'A'
+    cache.put(1, 'c', 'C')
+    assert len(cache) == 2
+    assert (cache.get(1, 'a'), cache.get(1, 'b'), cache.get(1, 'c')) == ('A', None, 'C')
+
+
+def test_a_newer_generation_drops_everything():
+    cache = QueryCache()
+    cache.put(1, 'a', 'A')
+    assert cache.get(2, 'a') is None
+    assert len(cache) == 0
+    cache.put(2, 'b', 'B')
+    assert cache.get(2, 'b') == 'B'
+
+
+def test_an_older_generation_misses_without_evicting():
+    cache = QueryCache()
+    cache.put(2, 'a', 'A')
+    assert cache.get(1, 'a') is None
+    cache.put(1, 'b', 'B')
+    assert cache.find(1, lambda key, value: True) is None
+    assert (cache.generation, len(cache), cache.get(2, 'a'), cache.get(2, 'b')) == (2, 1, 'A', None)
+
+
+def test_lookups_are_counted_unless_told_not_to():
+    cache = QueryCache()
+    cache.put(1, 'a', 'A')
+    before = lookups()
+    cache.get(1, 'a')
+    cache.get(1, 'b')
+    assert lookups() == {'hit': before['hit'] + 1, 'miss': before['miss'] + 1}
+    cache.get(1, 'a', record=False)
+    cache.get(1, 'b', record=False)
+    assert lookups() == {'hit': before['hit'] + 1, 'miss': before['miss'] + 1}
+
+
+def test_find_prefers_the_most_recently_used_match():
+    cache = QueryCache(size=3)
+    cache.put(1, 'a1', 1)
+    cache.put(1, 'a2', 2)
+    cache.put(1, 'b', 3)
+    assert cache.find(1, lambda key, value: key.startswith('a')) == ('a2', 2)
+    assert cache.get(1, 'a1') == 1
+    assert cache.find(1, lambda key, value: key.startswith('a')) == ('a1', 1)
+    assert cache.find(1, lambda key, value: value > 5) is None
+    # A found entry counts as used
+    cache.find(1, lambda key, value: key == 'b')
+    cache.put(1, 'c', 4)
+    assert cache.get(1, 'a2') is None and cache.get(1, 'b') == 3
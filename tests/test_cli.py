@@ -0,0 +1,106 @@
+"""
+Command-line argument handling and the headless subcommands
+"""
+import argparse
+import json
+import sys
+
+import pytest
+
+from claude_resume import cli
+from claude_resume.index import ChatIndex
+
+
+def run_main(monkeypatch, *argv):
+    monkeypatch.setattr(sys, 'argv', ['claude-resume', *argv])
+    return cli.main()
+
+
+@pytest.mark.parametrize('option, value', [('--limit', '-1'), ('-n', '-5'), ('--snippets', '-1'), ('--limit', 'ten')])
+def test_counts_must_be_non_negative(monkeypatch, capsys, option, value):
+    with pytest.raises(SystemExit) as exit_info:
+        run_main(monkeypatch, 'search', 'parser', option, value)
+    assert exit_info.value.code == 2
+    assert f"must be a non-negative integer, got '{value}'" in capsys.readouterr().err
+
+
+def test_non_negative_int():
+    assert [cli.non_negative_int(value) for value in ('0', '7', ' 12 ')] == [0, 7, 12]
+
+
+def test_parse_since_relative_ages(monkeypatch):
+    now = 1_700_000_000
+    monkeypatch.setattr(cli.time, 'time', lambda: now)
+    assert cli.parse_since('90m') == (now - 90 * 60) * 1000
+    assert cli.parse_since(' 12h ') == (now - 12 * 3600) * 1000
+    assert cli.parse_since('7d') == (now - 7 * 86400) * 1000
+    assert cli.parse_since('2w') == (now - 14 * 86400) * 1000
+    assert cli.parse_since('0d') == now * 1000
+
+
+def test_parse_since_absolute_dates():
+    assert cli.parse_since('2025-01-03') == 1735862400000
+    assert cli.parse_since('2025-01-03T12:00:00Z') == 1735862400000 + 12 * 3600 * 1000
+
+
+@pytest.mark.parametrize('value', ['', '7', '7y', '-7d', 'yesterday', '2025-13-01'])
+def test_parse_since_rejects_anything_else(value):
+    with pytest.raises(argparse.ArgumentTypeError, match='expected an age like 7d or an ISO date'):
+        cli.parse_since(value)
+
+
+class Recorder:
+    """Stands in for stdout, keeping each write separately"""
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, text):
+        self.writes.append(text)
+
+    def flush(self):
+        pass
+
+
+@pytest.fixture
+def listed(projects_dir, write_chat, monkeypatch):
+    """Five sessions for run_list to read, s0 the oldest"""
+    for i in range(5):
+        write_chat(f's{i}', f's{i}', [f'question {i}', f'answer {i}'], day=i + 1)
+    index = ChatIndex(projects_dir)
+    index.refresh()
+    monkeypatch.setattr(cli, 'attach', lambda args, sections: index)
+    yield index
+    index.close()
+
+
+def run_list(monkeypatch, since=None, as_json=False):
+    """(exit code, writes to stdout) of run_list"""
+    stdout = Recorder()
+    with monkeypatch.context() as patch:
+        patch.setattr(sys, 'stdout', stdout)
+        code = cli.run_list(argparse.Namespace(since=since, here=False, json=as_json))
+    return code, stdout.writes
+
+
+def test_list_writes_in_batches(listed, monkeypatch):
+    monkeypatch.setattr(cli, 'LIST_BATCH_SIZE', 2)
+    code, writes = run_list(monkeypatch)
+    assert code == 0
+    assert [text.count('\n') for text in writes] == [2, 2, 1]
+    lines = ''.join(writes).splitlines()
+    assert [line.split('\t')[0] for line in lines] == ['s4', 's3', 's2', 's1', 's0']
+    assert lines[0].split('\t') == ['s4', 'work-app', '2025-01-05T00:01:00Z', 'question 4', '/work/app']
+
+
+def test_list_json_and_since(listed, monkeypatch):
+    code, writes = run_list(monkeypatch, since=cli.parse_since('2025-01-04'), as_json=True)
+    assert code == 0
+    chats = [json.loads(line) for line in ''.join(writes).splitlines()]
+    assert [chat['id'] for chat in chats] == ['s4', 's3']
+    assert chats[0]['resumeCommand'] == cli.resume_command(chats[0])
+    assert 'messages' not in chats[0]
+
+
+def test_list_with_nothing_to_show_fails(listed, monkeypatch):
+    assert run_list(monkeypatch, since=cli.parse_since('2026-01-01')) == (1, [])
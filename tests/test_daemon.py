@@ -0,0 +1,106 @@
+"""
+Daemon framing, request handling, and a client talking to a daemon over a real socket
+"""
+import io
+import signal
+import threading
+
+import pytest
+
+from claude_resume import daemon as daemon_module
+from claude_resume.daemon import (Daemon, DaemonError, RemoteIndex, connect, read_frame, write_frame)
+from claude_resume.index import ChatIndex
+
+
+def test_frames_round_trip():
+    stream = io.BytesIO()
+    messages = [{'op': 'status'}, {'result': ['ünïcode', 1, None]}, {}]
+    for message in messages:
+        write_frame(stream, message)
+    stream.seek(0)
+    assert [read_frame(stream) for _ in messages] == messages
+    assert read_frame(stream) is None
+
+
+def test_truncated_and_oversized_frames(monkeypatch):
+    stream = io.BytesIO()
+    write_frame(stream, {'op': 'status'})
+    data = stream.getvalue()
+    for cut in (2, len(data) - 1):
+        with pytest.raises(ConnectionError):
+            read_frame(io.BytesIO(data[:cut]))
+    monkeypatch.setattr(daemon_module, 'MAX_FRAME_BYTES', 8)
+    with pytest.raises(ConnectionError, match='limit'):
+        read_frame(io.BytesIO(data))
+
+
+@pytest.fixture
+def index(projects_dir, write_chat):
+    for i in range(5):
+        write_chat(f's{i}', f's{i}', [f'question {i} about sockets', f'answer {i}'], day=i + 1)
+    index = ChatIndex(projects_dir)
+    index.refresh()
+    yield index
+    index.close()
+
+
+def replies(daemon, op, **args):
+    return list(daemon.handle({'op': op, 'args': args}))
+
+
+def test_handle_streams_and_pages(index, tmp_path, monkeypatch):
+    monkeypatch.setattr(daemon_module, 'STREAM_BATCH_SIZE', 2)
+    daemon = Daemon(index, tmp_path / 'index.bin')
+
+    frames = replies(daemon, 'chats', sort='start', transcripts=False)
+    assert [frame.get('more', False) for frame in frames] == [True, True, True, False]
+    assert [chat['id'] for frame in frames[:-1] for chat in frame['result']] == ['s4', 's3', 's2', 's1', 's0']
+    assert frames[-1]['result'] == {'projects': ['work-app'], 'removed': None}
+    assert frames[-1]['generation'] == index.generation
+
+    (frame,) = replies(daemon, 'page', offset=3, limit=5)
+    assert [chat['id'] for chat in frame['result']['chats']] == ['s1', 's0']
+    assert frame['result']['total'] == 5 and 'messages' not in frame['result']['chats'][0]
+
+    (frame,) = replies(daemon, 'search', query='sockets', limit=2)
+    assert frame['result']['total'] == 5 and len(frame['result']['results']) == 2
+    assert all('messages' not in chat for chat, _ in frame['result']['results'])
+
+    with pytest.raises(ValueError, match='Unknown request'):
+        replies(daemon, 'explode')
+
+
+def test_remote_index_over_a_socket(index, projects_dir, tmp_path, monkeypatch):
+    # serve() installs a SIGTERM handler, which only the main thread may do
+    monkeypatch.setattr(signal, 'signal', lambda *args: None)
+    socket_path = tmp_path / 'd.sock'
+    local = ChatIndex(projects_dir)
+    local.refresh()
+    daemon = Daemon(index, tmp_path / 'index.bin', watch_interval=60)
+    thread = threading.Thread(target=daemon.serve, args=(socket_path,), daemon=True)
+    thread.start()
+    try:
+        client = None
+        for _ in range(100):
+            client = connect(socket_path)
+            if client is not None:
+                break
+            threading.Event().wait(0.05)
+        assert client is not None
+        remote = RemoteIndex(client)
+        assert remote.chats(transcripts=False)[0] == local.chats(transcripts=False)[0]
+        assert remote.chat_page('start', 1, 2)[:2] == local.chat_page('start', 1, 2)[:2]
+        assert remote.get_chat('s2') == local.get_chat('s2')
+        assert remote.search('sockets')['total'] == 5
+        assert remote.generation == index.generation and remote.index_id == index.index_id
+        with pytest.raises(DaemonError, match='Unknown request'):
+            client.call('explode')
+        client.call('stop')
+        thread.join(5)
+        assert not thread.is_alive()
+        assert not socket_path.exists()
+        assert connect(socket_path) is None
+    finally:
+        local.close()
+        if thread.is_alive():
+            daemon.server.shutdown()
@@ -0,0 +1,75 @@
+"""
+Export checkpoints: an interrupted export resumes where it stopped and writes every session once
+"""
+import json
+
+import pytest
+
+from claude_resume import export as export_module
+from claude_resume.export import append_checkpoint, load_checkpoint, run_export, select_sessions
+from claude_resume.index import ChatIndex
+
+SELECTION = {'query': None, 'project': None, 'since': None}
+
+
+def test_checkpoint_lines(tmp_path):
+    path = tmp_path / 'out.jsonl.checkpoint'
+    assert load_checkpoint(path, SELECTION) is None
+    append_checkpoint(path, SELECTION, 'jsonl', {'offset': 10}, ['a', 'b'])
+    append_checkpoint(path, SELECTION, 'jsonl', {'offset': 25}, ['c'])
+    assert load_checkpoint(path, SELECTION) == {'done': {'a', 'b', 'c'}, 'offset': 25}
+
+    # A save cut short leaves a partial line, which is dropped before the next append
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"offset": 40, "do')
+    assert load_checkpoint(path, SELECTION) == {'done': {'a', 'b', 'c'}, 'offset': 25}
+    append_checkpoint(path, SELECTION, 'jsonl', {'offset': 40}, ['d'])
+    assert load_checkpoint(path, SELECTION)['done'] == {'a', 'b', 'c', 'd'}
+
+    with pytest.raises(ValueError, match='different export'):
+        load_checkpoint(path, dict(SELECTION, project='api'))
+
+
+@pytest.fixture
+def sessions(projects_dir, write_chat):
+    for i in range(7):
+        write_chat(f's{i}', f's{i}', [f'question {i}', f'answer {i}'], day=i + 1)
+    index = ChatIndex(projects_dir)
+    index.refresh()
+    yield select_sessions(index)
+    index.close()
+
+
+def test_interrupted_export_resumes(sessions, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_module, 'CHECKPOINT_EVERY', 2)
+    output = tmp_path / 'out.jsonl'
+    checkpoint = tmp_path / 'out.jsonl.checkpoint'
+
+    def interrupt(done, total):
+        if done == 5:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        run_export(sessions, 'jsonl', str(output), SELECTION, progress=interrupt)
+    assert len(load_checkpoint(checkpoint, SELECTION)['done']) == 5
+    # Output written after the last save is discarded on resume
+    with open(output, 'a', encoding='utf-8') as f:
+        f.write('{"id": "half-writ')
+
+    with pytest.raises(ValueError):
+        run_export(sessions, 'jsonl', str(output), dict(SELECTION, project='api'))
+
+    stats = run_export(sessions, 'jsonl', str(output), SELECTION)
+    assert (stats['sessions'], stats['skipped'], stats['errors']) == (2, 5, [])
+    assert not checkpoint.exists()
+    ids = [json.loads(line)['id'] for line in output.read_text(encoding='utf-8').splitlines()]
+    assert ids == [f's{i}' for i in range(7)]
+
+
+def test_restart_starts_over(sessions, tmp_path):
+    output = tmp_path / 'out.jsonl'
+    append_checkpoint(tmp_path / 'out.jsonl.checkpoint', SELECTION, 'jsonl', {'offset': 0}, [sessions[0][0]])
+    output.write_text('', encoding='utf-8')
+    stats = run_export(sessions, 'jsonl', str(output), SELECTION, restart=True)
+    assert (stats['sessions'], stats['skipped']) == (7, 0)
+    assert len(output.read_text(encoding='utf-8').splitlines()) == 7
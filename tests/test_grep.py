@@ -0,0 +1,80 @@
+"""
+The regex scanner: pattern checks, cursors, resumable scans and the time budget
+"""
+import time
+
+import pytest
+
+from claude_resume.grep import (RegexScanner, compile_pattern, decode_cursor, encode_cursor, literal_text,
+                                scan_chunk)
+
+
+@pytest.fixture(scope='module')
+def scanner():
+    scanner = RegexScanner(workers=1)
+    yield scanner
+    scanner.close()
+
+
+def docs(count=10):
+    return [(f'c{i}', f'line one\nerror code {i}\n' if i % 2 == 0 else 'nothing here\n') for i in range(count)]
+
+
+def test_patterns_and_literals():
+    assert compile_pattern('Error').search('an ERROR')
+    for pattern in ('', '(', 'a' * 501):
+        with pytest.raises(ValueError):
+            compile_pattern(pattern)
+    assert literal_text('Timeout Error') == 'timeout error'
+    assert literal_text('time.out') is None
+    assert literal_text('café') is None
+
+
+def test_cursors():
+    assert decode_cursor(encode_cursor(7, 42), 7, 50) == 42
+    assert decode_cursor(encode_cursor(7, 50), 7, 50) == 50
+    with pytest.raises(ValueError, match='stale'):
+        decode_cursor(encode_cursor(7, 42), 8, 50)
+    for cursor in ('', 'abc', '7', '7.x', '7.1.2', '7.-3', '7.51'):
+        with pytest.raises(ValueError, match='Malformed'):
+            decode_cursor(cursor, 7, 50)
+
+
+def test_scan_chunk_stops_at_the_deadline():
+    chunk = [(i, chat_id, text) for i, (chat_id, text) in enumerate(docs(4))]
+    matches, stopped_at = scan_chunk(r'^error', chunk, time.time() + 60)
+    assert [(position, chat_id, hits) for position, chat_id, hits, _ in matches] == [(0, 'c0', 1), (2, 'c2', 1)]
+    assert stopped_at is None
+    assert scan_chunk(r'^error', chunk, time.time() - 1) == ([], 0)
+
+
+def test_scan_resumes_where_it_stopped(scanner):
+    all_docs = docs()
+    matches, next_position, timed_out = scanner.scan(r'code \d', all_docs, limit=2)
+    assert [chat_id for _, chat_id, _, _ in matches] == ['c0', 'c2']
+    assert (next_position, timed_out) == (3, False)
+
+    found = [chat_id for _, chat_id, _, _ in matches]
+    while next_position is not None:
+        matches, next_position, timed_out = scanner.scan(r'code \d', all_docs, start=next_position, limit=2)
+        assert not timed_out
+        found.extend(chat_id for _, chat_id, _, _ in matches)
+    assert found == ['c0', 'c2', 'c4', 'c6', 'c8']
+
+    matches, next_position, _ = scanner.scan(r'code', all_docs, skip=lambda position: position < 6)
+    assert [chat_id for _, chat_id, _, _ in matches] == ['c6', 'c8'] and next_position is None
+
+
+def test_the_last_match_leaves_no_cursor(scanner):
+    matches, next_position, timed_out = scanner.scan('code', docs(9), start=7, limit=1)
+    assert [chat_id for _, chat_id, _, _ in matches] == ['c8']
+    assert next_position is None and not timed_out
+
+
+def test_a_stuck_pattern_is_abandoned(scanner):
+    started = time.monotonic()
+    matches, next_position, timed_out = scanner.scan(r'(a+)+$', [('x', 'a' * 40 + 'b')], budget_ms=200)
+    assert (matches, next_position, timed_out) == ([], None, True)
+    assert time.monotonic() - started < 5
+    # The killed pool is replaced for the next query
+    assert scanner.scan('b', [('x', 'a' * 40 + 'b')])[0][0][1] == 'x'
@@ -0,0 +1,166 @@
+"""
+ChatIndex refreshes: entries, tombstones, derived indexes and facets stay in step
+"""
+import os
+import shutil
+
+import pytest
+
+from claude_resume import metrics
+from claude_resume.index import ChatIndex
+from claude_resume.store import _check_consistency, load_index, read_header, read_section, save_index
+
+
+@pytest.fixture
+def index(projects_dir):
+    index = ChatIndex(projects_dir)
+    yield index
+    index.close()
+
+
+def assert_consistent(index):
+    """Every listed session is in each derived index exactly once, and nothing else is"""
+    ids = set(index.ids)
+    assert set(index.search_index.lengths) == ids
+    assert set(index.similarity_index.signatures) == ids
+    assert set(index.suggest_index.doc_terms) == ids
+    assert set(index.filter_index.start_ts) == ids
+    assert len(index.filter_index.starts) == len(ids)
+    assert sum(len(chat_ids) for chat_ids in index.filter_index.projects.values()) == len(ids)
+    assert sum(facet['sessions'] for facet in index.facets.values()) == len(ids)
+    assert {chat['id'] for chat in index.chats()[0]} == ids
+    for chat_id, keys in index.shadowed.items():
+        assert keys and index.ids[chat_id] not in keys
+        assert all(index.entries[key]['chat']['id'] == chat_id for key in keys)
+    assert not ids & set(index.removed)
+
+
+def test_refresh_adds_changes_and_removes(index, write_chat):
+    write_chat('a', 'a', ['deploy the parser', 'parser deployed'], day=1)
+    b = write_chat('b', 'b', ['fix the cache', 'cache fixed'], day=2)
+    assert index.refresh()
+    assert set(index.ids) == {'a', 'b'}
+    generation = index.generation
+    assert not index.refresh()
+    assert index.generation == generation
+
+    write_chat('a', 'a', ['deploy the tokenizer', 'tokenizer deployed'], day=3)
+    os.remove(b)
+    assert index.refresh()
+    assert index.generation == generation + 1
+    assert set(index.ids) == {'a'}
+    assert index.removed == {'b': index.generation}
+    chats, removed = index.changes_since(generation)
+    assert [chat['id'] for chat in chats] == ['a'] and removed == ['b']
+    assert index.search('tokenizer')['total'] == 1
+    assert index.search('parser')['total'] == 0
+    assert_consistent(index)
+
+
+def test_scoped_calls_only_see_their_directory(index, write_chat):
+    write_chat('a', 'a', ['api work', 'done'], cwd='/work/api')
+    write_chat('b', 'b', ['web work', 'done'], cwd='/work/web')
+    index.refresh()
+    assert [chat['id'] for chat in index.chats(scope='/work/api')[0]] == ['a']
+    assert index.get_chat('b', scope='/work/api') is None
+    assert index.facet_summary(scope='/work/web')['totals']['sessions'] == 1
+    assert [chat['id'] for chat, _ in index.search('work', scope='/work/web')['results']] == ['b']
+
+
+def test_warmup_reports_progress_then_ready(index, write_chat):
+    for i in range(3):
+        write_chat(f's{i}', f's{i}', [f'question {i}', f'answer {i}'], day=i + 1)
+    assert not index.wait_ready(0)
+    progress = index.progress()
+    assert not progress['ready'] and progress['sessions'] == 0
+    index.start_warmup().join(10)
+    assert index.wait_ready(0)
+    progress = index.progress()
+    assert progress['ready'] and progress['sessions'] == 3
+    assert progress['filesDone'] == progress['filesTotal'] == 3
+    assert progress['generation'] == index.generation and progress['elapsed'] >= 0
+
+
+def test_copy_of_a_session_is_listed_once(index, write_chat, projects_dir):
+    for i in range(3):
+        write_chat(f's{i}', f's{i}', [f'topic {i} question', f'topic {i} answer'], day=i + 1)
+    index.refresh()
+    original = str(projects_dir / '-work-app' / 's0.jsonl')
+    copy = projects_dir / '-work-app' / 'copy.jsonl'
+    shutil.copy(original, copy)
+    index.refresh()
+    assert len(index.chats()[0]) == 3
+    assert index.facet_summary()['totals']['sessions'] == 3
+    assert index.progress()['sessions'] == 3
+    assert metrics.INDEX_SESSIONS.get() == 3 and metrics.INDEX_FILES.get() == 4
+    assert index.shadowed == {'s0': {str(copy)}}
+    assert_consistent(index)
+
+    os.remove(copy)
+    index.refresh()
+    assert index.get_chat('s0') is not None
+    assert 's0' not in index.removed
+    assert index.search('topic 0')['results'][0][0]['id'] == 's0'
+    assert index.shadowed == {}
+    assert_consistent(index)
+
+
+def test_newer_copy_takes_over_and_hands_back(index, write_chat, projects_dir):
+    original = write_chat('s0', 's0', ['first run', 'first answer'], day=1)
+    index.refresh()
+    resumed = write_chat('resumed', 's0', ['first run', 'first answer', 'resumed later'], day=5)
+    index.refresh()
+    assert index.ids['s0'] == str(resumed)
+    assert index.search('resumed')['total'] == 1
+    assert_consistent(index)
+
+    generation = index.generation
+    os.remove(resumed)
+    index.refresh()
+    assert index.ids['s0'] == str(original)
+    assert index.search('resumed')['total'] == 0
+    # Delta-sync clients replace their copy instead of deleting the session
+    chats, removed = index.changes_since(generation)
+    assert [chat['id'] for chat in chats] == ['s0'] and removed == []
+    assert_consistent(index)
+
+    os.remove(original)
+    index.refresh()
+    assert index.ids == {} and 's0' in index.removed
+    assert index.facets == {}
+    assert_consistent(index)
+
+
+def test_shadowed_copy_takes_over_after_a_snapshot_load(index, write_chat, projects_dir, tmp_path):
+    original = write_chat('s0', 's0', ['parser question', 'parser answer'], day=1)
+    index.refresh()
+    shutil.copy(original, projects_dir / '-work-app' / 'copy.jsonl')
+    index.refresh()
+    path = tmp_path / 'index.bin'
+    save_index(index, path)
+
+    os.remove(original)
+    loaded = load_index(path, read_header(path))
+    try:
+        assert loaded.shadowed == index.shadowed
+        loaded.refresh()
+        assert loaded.ids == {'s0': str(projects_dir / '-work-app' / 'copy.jsonl')}
+        assert loaded.removed == {} and loaded.shadowed == {}
+        assert loaded.search('parser')['results'][0][0]['id'] == 's0'
+        assert_consistent(loaded)
+        save_index(loaded, path)
+        header = read_header(path)
+        assert _check_consistency(load_index(path, header), header, read_section(path, header, 'texts')) == []
+    finally:
+        loaded.close()
+
+
+def test_chat_page_is_metadata_only(index, write_chat):
+    for i in range(5):
+        write_chat(f's{i}', f's{i}', [f'message {i}', 'reply'], day=i + 1)
+    index.refresh()
+    chats, total, projects = index.chat_page('start', 1, 2)
+    assert total == 5 and projects == {'work-app'}
+    assert [chat['id'] for chat in chats] == ['s3', 's2']
+    assert all('messages' not in chat for chat in chats)
+    assert 'messages' in index.get_chat('s3')
@@ -0,0 +1,93 @@
+"""
+Query parsing and the filter index clauses are resolved against
+"""
+import pytest
+
+from claude_resume.query import FilterIndex, intersect, parse_query, phrase_pattern, query_key
+from claude_resume.search import SearchIndex
+from claude_resume.utils import parse_timestamp
+
+
+def chat(chat_id, project, start, end, tools=(), cwd=None):
+    return {'id': chat_id, 'project': project, 'cwd': cwd or f'/work/{project}', 'tools': list(tools),
+            'startTs': parse_timestamp(start), 'endTs': parse_timestamp(end)}
+
+
+def test_parse_query_clauses():
+    parsed = parse_query('project:api tool:Bash role:user after:2025-06-01 "Connection  reset" '
+                         'see https://example.com/x timeout')
+    assert parsed['text'] == 'see https://example.com/x timeout'
+    assert parsed['phrases'] == [['connection', 'reset']]
+    assert parsed['projects'] == {'api'}
+    assert parsed['tools'] == ['bash']
+    assert parsed['fields'] == ('user',)
+    assert parsed['after'] == parse_timestamp('2025-06-01') and parsed['before'] is None
+    assert parse_query('in:summary in:tool_result project:"my app"')['fields'] == ('summary', 'tool_result')
+    assert parse_query('project:"my app"')['projects'] == {'my app'}
+    assert parse_query('""')['phrases'] == []
+
+
+def test_parse_query_rejects_bad_values():
+    for text in ('role:robot', 'in:title', 'after:yesterday', 'before:2025-13-01'):
+        with pytest.raises(ValueError):
+            parse_query(text)
+
+
+def test_query_key_ignores_order_case_and_repeats():
+    assert query_key(parse_query('Cache cache eviction tool:bash')) == query_key(parse_query('eviction tool:Bash cache'))
+    assert query_key(parse_query('cache')) != query_key(parse_query('cache role:user'))
+
+
+def test_phrase_pattern_spans_punctuation_but_not_words():
+    pattern = phrase_pattern(['connection', 'reset'])
+    assert pattern.search('Connection-reset by peer')
+    assert not pattern.search('connection was reset')
+    assert not pattern.search('connectionreset')
+
+
+@pytest.fixture
+def filters():
+    index = FilterIndex()
+    index.add(chat('a', 'api', '2025-05-01T00:00:00Z', '2025-05-03T00:00:00Z', tools=['Bash']))
+    index.add(chat('b', 'api', '2025-06-10T00:00:00Z', '2025-06-11T00:00:00Z', tools=['Read']))
+    index.add(chat('c', 'web', '2025-05-20T00:00:00Z', '2025-06-05T00:00:00Z', tools=['Bash', 'Read']))
+    index.add(chat('d', 'web', None, None))
+    return index
+
+
+def resolve(filters, text, search_index=None):
+    return intersect(filters.clauses(parse_query(text), search_index or SearchIndex()))
+
+
+def test_clauses_intersect(filters):
+    assert resolve(filters, 'plain words') is None
+    assert resolve(filters, 'project:api') == {'a', 'b'}
+    assert resolve(filters, 'project:api project:web') == {'a', 'b', 'c', 'd'}
+    assert resolve(filters, 'tool:bash') == {'a', 'c'}
+    assert resolve(filters, 'tool:bash project:web') == {'c'}
+    # after: keeps sessions still active at the date, before: those that started earlier
+    assert resolve(filters, 'after:2025-06-01T00:00:00Z') == {'b', 'c'}
+    assert resolve(filters, 'before:2025-06-01T00:00:00Z') == {'a', 'c'}
+    assert resolve(filters, 'after:2025-06-01T00:00:00Z before:2025-06-01T00:00:00Z') == {'c'}
+    assert resolve(filters, 'project:nope tool:bash') == set()
+
+
+def test_phrase_clauses_use_the_postings(filters):
+    search_index = SearchIndex()
+    search_index.add('a', {'user': 'connection reset'})
+    search_index.add('c', {'user': 'reset the connection'})
+    search_index.add('b', {'user': 'reset'})
+    assert resolve(filters, '"connection reset"', search_index) == {'a', 'c'}
+    assert resolve(filters, '"connection reset" tool:read', search_index) == {'c'}
+
+
+def test_remove_and_scope(filters):
+    removed = chat('c', 'web', '2025-05-20T00:00:00Z', '2025-06-05T00:00:00Z', tools=['Bash', 'Read'])
+    filters.remove(removed)
+    filters.remove(chat('d', 'web', None, None))
+    assert 'web' not in filters.projects and '/work/web' not in filters.cwds
+    assert filters.tools == {'bash': {'a'}, 'read': {'b'}}
+    assert [chat_id for _, chat_id in filters.starts] == ['a', 'b']
+    assert set(filters.end_ts) == {'a', 'b'}
+    assert filters.scope('/work/api') == {'a', 'b'}
+    assert filters.scope(None) == {'a', 'b'}
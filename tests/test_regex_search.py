@@ -0,0 +1,125 @@
+"""
+Regex search through the index: cursors over the visible chats, newest first
+"""
+import pytest
+
+from claude_resume import metrics
+from claude_resume.grep import encode_cursor
+from claude_resume.index import ChatIndex
+
+
+@pytest.fixture
+def index(projects_dir, write_chat):
+    # s0 is the oldest; even sessions mention an error code
+    for i in range(6):
+        texts = [f'run {i}', f'error E{i}0{i} raised' if i % 2 == 0 else 'all good']
+        write_chat(f's{i}', f's{i}', texts, day=i + 1)
+    index = ChatIndex(projects_dir)
+    index.refresh()
+    yield index
+    index.close()
+
+
+def ids(response):
+    return [chat['id'] for chat, _ in response['results']]
+
+
+def test_cursors_outside_the_documents_are_rejected(index):
+    for position in (-3, -1, 7):
+        with pytest.raises(ValueError, match='Malformed cursor'):
+            index.search(r'E\d+', 'regex', cursor=encode_cursor(index.generation, position))
+    with pytest.raises(ValueError, match='stale'):
+        index.search(r'E\d+', 'regex', cursor=encode_cursor(index.generation + 1, 0))
+    # A project filter shortens the list the positions count in
+    with pytest.raises(ValueError, match='Malformed cursor'):
+        index.search(r'E\d+', 'regex', project='nowhere', cursor=encode_cursor(index.generation, 1))
+
+    response = index.search(r'E\d+', 'regex', cursor=encode_cursor(index.generation, 6))
+    assert (ids(response), response['cursor'], response['scanned']) == ([], None, 0)
+
+
+def test_pages_report_what_they_scanned_and_the_total_once_complete(index):
+    pages = [index.search(r'E\d+', 'regex', limit=1)]
+    while pages[-1]['cursor']:
+        pages.append(index.search(r'E\d+', 'regex', limit=1, cursor=pages[-1]['cursor']))
+    assert [ids(page) for page in pages] == [['s4'], ['s2'], ['s0']]
+    assert [page['total'] for page in pages] == [None, None, 3]
+    assert [page['scanned'] for page in pages] == [2, 2, 2]
+
+    # The completed scan is cached, so the whole result set now comes with its total
+    response = index.search(r'E\d+', 'regex')
+    assert (ids(response), response['total'], response['scanned'], response['cursor']) == (['s4', 's2', 's0'], 3, 6, None)
+    response = index.search(r'E\d+', 'regex', cursor=encode_cursor(index.generation, 3))
+    assert (ids(response), response['total'], response['scanned']) == (['s2', 's0'], 3, 3)
+
+
+def test_cli_labels_a_partial_scan(index, monkeypatch, capsys):
+    from argparse import Namespace
+    from claude_resume import cli
+
+    monkeypatch.setattr(cli, 'attach', lambda args, sections: index)
+    args = Namespace(query=[r'E\d+'], mode='regex', project=None, limit=1, snippets=1, here=False, json=False)
+    assert cli.run_search(args) == 0
+    assert capsys.readouterr().out.splitlines()[-1] == '1+ matching sessions (more available)'
+    # Once the scan has been completed its total is known
+    response = index.search(r'E\d+', 'regex', snippets=1, cursor=encode_cursor(index.generation, 2))
+    assert response['cursor'] is None
+    assert cli.run_search(args) == 0
+    assert capsys.readouterr().out.splitlines()[-1] == '1 of 3 matching sessions'
+
+
+def lookups():
+    return {result: metrics.QUERY_CACHE_LOOKUPS.get(result=result) for result in ('hit', 'miss', 'refined')}
+
+
+def cold(projects_dir, *args, **kwargs):
+    index = ChatIndex(projects_dir)
+    index.refresh()
+    try:
+        return index.search(*args, **kwargs)
+    finally:
+        index.close()
+
+
+def test_a_cached_literal_narrows_a_longer_one(index, projects_dir):
+    index.search('error', 'regex')
+    before = lookups()
+    response = index.search('error e202', 'regex')
+    assert lookups() == dict(before, refined=before['refined'] + 1)
+    assert ids(response) == ['s2']
+    expected = cold(projects_dir, 'error e202', 'regex')
+    assert (response['results'], response['total'], response['scanned']) == \
+        (expected['results'], expected['total'], expected['scanned'])
+
+
+def test_a_partial_broader_scan_only_narrows_what_it_covered(index, projects_dir):
+    # The broader scan stops at s4, so s0 must still be scanned for
+    assert ids(index.search('error', 'regex', limit=1)) == ['s4']
+    before = lookups()
+    response = index.search('error E000', 'regex')
+    assert lookups()['refined'] == before['refined'] + 1
+    assert ids(response) == ['s0'] and response['cursor'] is None
+    assert response['results'] == cold(projects_dir, 'error E000', 'regex')['results']
+    # Both scans stay cached under their own keys
+    assert ids(index.search('error', 'regex', limit=5)) == ['s4', 's2', 's0']
+
+
+def test_a_partial_cached_scan_is_continued_to_fill_the_limit(index):
+    assert ids(index.search(r'E\d+', 'regex', limit=1)) == ['s4']
+    before = lookups()
+    response = index.search(r'E\d+', 'regex', limit=5)
+    assert lookups() == dict(before, hit=before['hit'] + 1)
+    assert (ids(response), response['cursor'], response['total'], response['scanned']) == (['s4', 's2', 's0'], None, 3, 6)
+    # The continuation was cached too
+    response = index.search(r'E\d+', 'regex', limit=2)
+    assert (ids(response), response['total']) == (['s4', 's2'], 3)
+
+
+def test_a_new_generation_misses(index, write_chat):
+    assert ids(index.search(r'E\d+', 'regex')) == ['s4', 's2', 's0']
+    write_chat('s6', 's6', ['error E606 raised'], day=7)
+    index.refresh()
+    before = lookups()
+    response = index.search(r'E\d+', 'regex')
+    assert lookups() == dict(before, miss=before['miss'] + 1)
+    assert (ids(response), response['total']) == (['s6', 's4', 's2', 's0'], 4)
@@ -0,0 +1,103 @@
+"""
+BM25F ranking over the inverted index, and fuzzy term lookup
+"""
+from claude_resume.search import SearchIndex, deletions, document_fields, edit_distance_within, max_edits, trigrams
+
+
+def fields(**kwargs):
+    return kwargs
+
+
+def test_remove_restores_the_previous_state():
+    index = SearchIndex()
+    index.add('a', fields(user='parser crash on startup', assistant='fixed the parser'))
+    snapshot = ({term: dict(docs) for term, docs in index.postings.items()}, list(index.field_totals))
+
+    index.add('b', fields(summary='Cache eviction', user='the cache grows', assistant='bash script'))
+    index.add('a', fields(user='parser crash on startup', assistant='fixed the parser'))
+    assert len(index) == 2
+    index.remove('b')
+    index.remove('missing')
+    assert (index.postings, index.field_totals) == snapshot
+
+    index.remove('a')
+    assert (index.postings, index.lengths, index.doc_terms) == ({}, {}, {})
+    assert index.field_totals == [0] * len(index.field_totals)
+    assert index.rank('parser') == []
+
+
+def test_weighted_fields_rank_higher():
+    index = SearchIndex()
+    index.add('summary', fields(summary='Database migration', assistant='done'))
+    index.add('assistant', fields(user='please help', assistant='the database migration ran'))
+    index.add('other', fields(user='unrelated question', assistant='unrelated answer'))
+    ranked = index.rank('database migration')
+    assert [doc_id for doc_id, _ in ranked] == ['summary', 'assistant']
+    assert ranked[0][1] > ranked[1][1] > 0
+    assert index.rank('database', fields=('assistant',))[0][0] == 'assistant'
+    assert index.rank('database', candidates={'assistant'}) == [('assistant', index.rank('database')[1][1])]
+    assert len(index.rank('database', limit=1)) == 1
+
+
+def test_rarer_terms_weigh_more():
+    index = SearchIndex()
+    for i in range(5):
+        index.add(f'common{i}', fields(user='deploy the service'))
+    index.add('rare', fields(user='deploy the kubernetes service'))
+    assert index.idf('kubernetes') > index.idf('deploy')
+    assert index.rank('deploy kubernetes')[0][0] == 'rare'
+
+
+def test_document_fields_split_by_role():
+    chat = {'summary': 'Fix login', 'firstMessage': 'login fails',
+            'messages': [{'role': 'user', 'text': 'login fails'}, {'role': 'assistant', 'text': 'try again'},
+                         {'role': 'user', 'text': 'still broken'}]}
+    assert document_fields(chat, {'tool_use': 'Bash ls'}) == {
+        'summary': 'Fix login', 'first': 'login fails', 'user': 'login fails\nstill broken',
+        'assistant': 'try again', 'tool_use': 'Bash ls', 'tool_result': ''}
+
+
+def test_edit_distance_and_budgets():
+    assert edit_distance_within('connection', 'conection', 2) == 1
+    assert edit_distance_within('kitten', 'sitting', 2) is None
+    assert edit_distance_within('kitten', 'sitting', 3) == 3
+    assert edit_distance_within('a', 'abcd', 2) is None
+    assert [max_edits(term) for term in ('ab', 'bash', 'connection')] == [0, 1, 2]
+    assert deletions('bsh') == {'bsh', 'sh', 'bh', 'bs'}
+    assert trigrams('ab') == {'^ab', 'ab$'}
+
+
+def test_fuzzy_terms():
+    index = SearchIndex()
+    index.add('a', fields(user='connection reset by peer', assistant='run it in bash'))
+    assert index.fuzzy_terms('conection') == {'connection': 1}
+    assert index.fuzzy_terms('conecton') == {'connection': 2}
+    # Short terms are found through their single-deletion variants
+    assert index.fuzzy_terms('bsh') == {'bash': 1}
+    assert index.fuzzy_terms('bas') == {'bash': 1}
+    assert index.fuzzy_terms('by') == {'by': 0}
+    assert index.fuzzy_terms('xy') == {}
+
+
+def test_rank_fuzzy_prefers_closer_variants():
+    index = SearchIndex()
+    index.add('exact', fields(user='timeout while reading'))
+    index.add('typo', fields(user='timout while reading'))
+    ranked, expansions = index.rank_fuzzy('timeout')
+    assert expansions == {'timeout': ['timeout', 'timout']}
+    assert [doc_id for doc_id, _ in ranked] == ['exact', 'typo']
+    assert index.rank('timeout') == [('exact', index.rank('timeout')[0][1])]
+
+
+def test_vocabulary_lookups_follow_removals():
+    index = SearchIndex()
+    index.add('a', fields(user='connection reset by peer'))
+    grams = {gram: set(terms) for gram, terms in index.grams.items()}
+    short_deletes = {variant: set(terms) for variant, terms in index.short_deletes.items()}
+    index.add('b', fields(user='connections bash'))
+    assert index.fuzzy_terms('conection') == {'connection': 1, 'connections': 2}
+    index.remove('b')
+    assert (index.grams, index.short_deletes) == (grams, short_deletes)
+    assert index.fuzzy_terms('bsh') == {}
+    index.remove('a')
+    assert (index.grams, index.short_deletes) == ({}, {})
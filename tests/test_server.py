@@ -0,0 +1,249 @@
+"""
+The viewer's HTTP handlers, served on a free port against a fixture index
+"""
+import json
+import signal
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from claude_resume import metrics
+from claude_resume import server as server_module
+from claude_resume.daemon import Daemon, DaemonClient, RemoteIndex, connect
+from claude_resume.index import ChatIndex
+from claude_resume.server import ChatHistoryHandler
+
+
+@pytest.fixture
+def index(projects_dir, write_chat):
+    for i in range(3):
+        write_chat(f's{i}', f's{i}', [f'the parser crashed on input {i}', f'fixed the parser bug {i}'], day=i + 1)
+    index = ChatIndex(projects_dir)
+    index.refresh()
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """serve(index) -> base URL of a server answering from that index"""
+    servers = []
+
+    def start(index):
+        monkeypatch.setattr(ChatHistoryHandler, 'index', index)
+        monkeypatch.setattr(ChatHistoryHandler, 'log_message', lambda self, *args: None)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), ChatHistoryHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def get(url):
+    """(status, headers, body) of a GET, without raising for error statuses"""
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def wait_for(condition, timeout=5):
+    """Poll until condition() holds; requests are counted just after their response is sent"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def get_json(url):
+    status, _, body = get(url)
+    return status, json.loads(body)
+
+
+def test_metrics_count_requests_by_endpoint_and_status(serve, index):
+    base = serve(index)
+    before = metrics.HTTP_REQUESTS.get(endpoint='/api/facets', method='GET', status=200)
+    assert get_json(base + '/api/facets')[0] == 200
+    missing = metrics.HTTP_REQUESTS.get(endpoint='other', method='GET', status=404)
+    assert get(base + '/nowhere')[0] == 404
+    wait_for(lambda: metrics.HTTP_REQUESTS.get(endpoint='other', method='GET', status=404) == missing + 1)
+    wait_for(lambda: metrics.HTTP_REQUESTS.get(endpoint='/api/facets', method='GET', status=200) == before + 1)
+
+    status, headers, body = get(base + '/metrics')
+    assert status == 200 and headers['Content-type'] == metrics.CONTENT_TYPE
+    text = body.decode()
+    assert '# TYPE claude_resume_http_requests_total counter' in text
+    assert 'claude_resume_http_requests_total{endpoint="other",method="GET",status="404"}' in text
+    assert 'claude_resume_http_request_duration_seconds_bucket{endpoint="/api/facets",le="+Inf"}' in text
+    assert 'claude_resume_index_sessions 3' in text
+
+
+def test_facets(serve, index, write_chat):
+    write_chat('api', 'api', ['api question', 'api answer', 'more'], day=9, project='-work-api', cwd='/work/api')
+    index.refresh()
+    status, facets = get_json(serve(index) + '/api/facets')
+    assert status == 200
+    assert facets['totals'] == {'sessions': 4, 'messages': 9, 'projects': 2}
+    assert facets['generation'] == index.generation and facets['indexId'] == index.index_id
+    api, app = facets['projects']
+    assert (api['name'], api['sessions'], api['messages']) == ('work-api', 1, 3)
+    assert api['cwds'] == [{'cwd': '/work/api', 'sessions': 1}]
+    assert (app['name'], app['sessions'], app['messages']) == ('work-app', 3, 6)
+    assert app['firstStart'] < app['lastEnd']
+
+
+def test_search(serve, index):
+    base = serve(index)
+    status, response = get_json(base + '/api/search?q=parser+crashed&limit=2')
+    assert status == 200
+    assert (response['query'], response['mode'], response['offset'], response['total']) == ('parser crashed', 'ranked', 0, 3)
+    assert response['generation'] == index.generation and response['indexId'] == index.index_id
+    assert len(response['results']) == 2
+    result = response['results'][0]
+    assert result['score'] > 0 and result['hits'] >= 1 and 'messages' not in result
+    assert {'id', 'project', 'summary', 'snippets'} <= set(result)
+
+    status, page = get_json(base + '/api/search?q=parser+crashed&limit=2&offset=2')
+    assert status == 200 and page['offset'] == 2 and len(page['results']) == 1
+    assert page['results'][0]['id'] not in {r['id'] for r in response['results']}
+
+
+@pytest.mark.parametrize('query', ['limit=-1', 'limit=ten', 'offset=1.5', 'budget=1e3', 'snippets=-3'])
+def test_search_rejects_bad_numbers(serve, index, query):
+    base = serve(index)
+    before = metrics.HTTP_REQUESTS.get(endpoint='/api/search', method='GET', status=400)
+    status, response = get_json(f'{base}/api/search?q=parser&{query}')
+    assert status == 400 and 'must be a non-negative integer' in response['error']
+    wait_for(lambda: metrics.HTTP_REQUESTS.get(endpoint='/api/search', method='GET', status=400) == before + 1)
+
+
+
+def test_fuzzy_search(serve, index):
+    base = serve(index)
+    status, response = get_json(base + '/api/search?q=parsr&mode=fuzzy')
+    assert status == 200 and response['mode'] == 'fuzzy'
+    assert response['expansions'] == {'parsr': ['parser']}
+    assert response['total'] == 3 and all(result['hits'] >= 1 for result in response['results'])
+    status, response = get_json(base + '/api/search?q=parser&mode=psychic')
+    assert status == 400 and 'Unknown search mode' in response['error']
+
+
+@pytest.mark.parametrize('position', [-3, 4])
+def test_regex_search_rejects_cursors_out_of_range(serve, index, position):
+    status, response = get_json(f'{serve(index)}/api/search?q=parser&mode=regex&cursor={index.generation}.{position}')
+    assert status == 400 and 'Malformed cursor' in response['error']
+
+
+def test_search_rejects_bad_clauses(serve, index):
+    base = serve(index)
+    status, response = get_json(base + '/api/search?q=role:robot')
+    assert status == 400 and 'Unknown role' in response['error']
+    status, response = get_json(base + '/api/search?q=parser+after:soon')
+    assert status == 400 and 'Invalid date' in response['error']
+    status, response = get_json(base + '/api/search?q=parser+project:work-app+role:user')
+    assert status == 200 and response['total'] == 3
+
+
+def test_related(serve, index, write_chat, projects_dir):
+    text = ' '.join(f'step {i} of the migration plan touches table {i}' for i in range(40))
+    write_chat('plan', 'plan', [text, 'ok'], day=7)
+    write_chat('plan-again', 'plan-again', [text + ' and one more', 'ok'], day=8)
+    index.refresh()
+    base = serve(index)
+    status, response = get_json(base + '/api/chats/plan/related')
+    assert status == 200 and response['id'] == 'plan'
+    (related,) = response['related']
+    assert related['id'] == 'plan-again' and 0.8 <= related['similarity'] <= 1 and 'messages' not in related
+    assert get_json(base + '/api/chats/plan/related?limit=0')[1]['related'] == []
+    status, response = get_json(base + '/api/duplicates')
+    assert status == 200 and response['clusters'] == [['plan-again', 'plan']]
+
+    status, response = get_json(base + '/api/chats/missing/related')
+    assert status == 404 and 'not found' in response['error']
+    status, response = get_json(base + '/api/chats/plan/related?limit=-1')
+    assert status == 400 and 'must be a non-negative integer' in response['error']
+
+
+def test_suggest(serve, index):
+    base = serve(index)
+    status, response = get_json(base + '/api/suggest?prefix=pa')
+    assert status == 200 and response['prefix'] == 'pa' and response['generation'] == index.generation
+    assert response['suggestions'] == [{'text': 'parser', 'count': 3, 'kind': 'term'}]
+    status, response = get_json(base + '/api/suggest?prefix=work')
+    assert response['suggestions'][0] == {'text': 'project:work-app', 'count': 3, 'kind': 'project'}
+    status, response = get_json(base + '/api/suggest?prefix=project:')
+    assert [s['kind'] for s in response['suggestions']] == ['project']
+    status, response = get_json(base + '/api/suggest?prefix=i&limit=1')
+    assert len(response['suggestions']) == 1
+    assert get_json(base + '/api/suggest')[1]['suggestions'] == []
+
+    status, response = get_json(base + '/api/suggest?prefix=pa&limit=many')
+    assert status == 400 and 'must be a non-negative integer' in response['error']
+
+
+def test_a_lost_daemon_is_replaced_by_a_local_index(serve, index, projects_dir, tmp_path, monkeypatch):
+    # serve() installs a SIGTERM handler, which only the main thread may do
+    monkeypatch.setattr(signal, 'signal', lambda *args: None)
+    # The local index is scoped to the working directory; from home it shows every chat
+    monkeypatch.chdir(Path.home())
+    monkeypatch.setattr(server_module, 'CLAUDE_PROJECTS_DIR', projects_dir)
+    socket_path = tmp_path / 'd.sock'
+    daemon = Daemon(index, tmp_path / 'index.bin', watch_interval=60)
+    thread = threading.Thread(target=daemon.serve, args=(socket_path,), daemon=True)
+    thread.start()
+    wait_for(lambda: connect(socket_path) is not None)
+    remote = RemoteIndex(connect(socket_path))
+    base = serve(remote)
+    try:
+        assert get_json(base + '/api/search?q=parser')[1]['total'] == 3
+        remote.client.call('stop')
+        thread.join(5)
+        assert not thread.is_alive()
+
+        status, headers, body = get(base + '/api/chats/s1')
+        assert status == 503 and headers['Retry-After'] == '1'
+        assert 'daemon stopped' in json.loads(body)['error']
+        local = ChatHistoryHandler.index
+        assert isinstance(local, ChatIndex)
+        assert local.wait_ready(10)
+
+        assert get_json(base + '/api/chats/s1')[1]['chat']['id'] == 's1'
+        status, response = get_json(base + '/api/chats/s1/related')
+        assert status == 200 and response['id'] == 's1'
+        assert get_json(base + '/api/facets')[1]['totals']['sessions'] == 3
+        assert get_json(base + '/api/search?q=parser')[1]['total'] == 3
+        assert get_json(base + '/api/suggest?prefix=pa')[1]['suggestions'][0]['text'] == 'parser'
+        assert get_json(base + '/api/chats?limit=1')[1]['total'] == 3
+    finally:
+        if thread.is_alive():
+            daemon.server.shutdown()
+        if ChatHistoryHandler.index is not remote:
+            ChatHistoryHandler.index.close()
+
+
+@pytest.mark.parametrize('path', ['/api/chats', '/api/chats/s0', '/api/chats/s0/related', '/api/search?q=parser',
+                                  '/api/suggest?prefix=pa', '/api/facets', '/api/duplicates'])
+def test_every_endpoint_survives_a_missing_daemon(serve, projects_dir, tmp_path, monkeypatch, path):
+    monkeypatch.setattr(server_module, 'CLAUDE_PROJECTS_DIR', projects_dir)
+    # A client for a daemon that has already gone
+    remote = RemoteIndex(DaemonClient(tmp_path / 'gone.sock'))
+    base = serve(remote)
+    try:
+        status, response = get_json(base + path)
+        assert status == 503 and 'daemon stopped' in response['error']
+        assert isinstance(ChatHistoryHandler.index, ChatIndex)
+    finally:
+        if ChatHistoryHandler.index is not remote:
+            ChatHistoryHandler.index.close()
+
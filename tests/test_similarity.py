@@ -0,0 +1,62 @@
+"""
+MinHash signatures and the LSH index behind related sessions and duplicate clusters
+"""
+from claude_resume.similarity import NUM_BINS, SimilarityIndex, minhash, similarity
+
+WORDS = ('alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike november oscar papa '
+         'quebec romeo sierra tango uniform victor whiskey xray yankee zulu').split()
+
+
+def text(seed, count=400):
+    """Deterministic pseudo-random word sequence"""
+    words = []
+    state = seed
+    for _ in range(count):
+        state = (state * 1103515245 + 12345) % 2 ** 31
+        words.append(WORDS[state % len(WORDS)])
+    return ' '.join(words)
+
+
+def test_signatures():
+    base = text(1)
+    signature = minhash(base)
+    assert len(signature) == NUM_BINS
+    assert minhash(base) == signature
+    assert minhash('') is None and minhash('!!! ...') is None
+    assert minhash('two words') is not None
+    near = base + ' ' + text(2, 20)
+    assert similarity(signature, minhash(near)) >= 0.8
+    assert similarity(signature, minhash(text(3))) < 0.3
+
+
+def test_related_and_clusters():
+    index = SimilarityIndex()
+    base = text(1)
+    index.add('a', minhash(base))
+    index.add('a-copy', minhash(base + ' ' + text(2, 10)))
+    index.add('a-resumed', minhash(base + ' ' + text(4, 30)))
+    index.add('b', minhash(text(3)))
+    index.add('b-copy', minhash(text(3)))
+    index.add('empty', None)
+    assert len(index) == 5
+
+    related = index.related('a')
+    assert {doc_id for doc_id, _ in related} == {'a-copy', 'a-resumed'}
+    assert related == sorted(related, key=lambda item: -item[1])
+    assert index.related('empty') == [] and index.related('missing') == []
+    assert sorted(map(sorted, index.clusters())) == [['a', 'a-copy', 'a-resumed'], ['b', 'b-copy']]
+
+
+def test_remove_clears_buckets():
+    index = SimilarityIndex()
+    index.add('a', minhash(text(1)))
+    buckets = {key: set(docs) for key, docs in index.buckets.items()}
+    index.add('b', minhash(text(1)))
+    index.add('c', minhash(text(5)))
+    index.remove('b')
+    index.remove('c')
+    index.remove('missing')
+    assert index.buckets == buckets
+    index.add('a', minhash(text(6)))
+    index.remove('a')
+    assert index.buckets == {} and index.signatures == {}
@@ -0,0 +1,73 @@
+"""
+Snippet windows and the match offsets the page highlights from
+"""
+import re
+
+from claude_resume.query import phrase_pattern
+from claude_resume.snippets import (MAX_SNIPPET_CHARS, SNIPPET_CONTEXT, WINDOW_HITS, build_snippets,
+                                    terms_pattern)
+
+
+def highlighted(snippet):
+    return [snippet['text'][start:end] for start, end in snippet['matches']]
+
+
+def test_terms_pattern():
+    assert terms_pattern([]) is None
+    pattern = terms_pattern(['parse', 'parser', 'parse'])
+    # Longer terms win, and only whole words match
+    assert [m.group() for m in pattern.finditer('Parser parse parsed reparse')] == ['Parser', 'parse']
+    pattern = terms_pattern(['connection'], [phrase_pattern(['connection', 'reset'])])
+    assert [m.group() for m in pattern.finditer('connection reset, then connection lost')] == \
+        ['connection reset', 'connection']
+
+
+def test_matches_at_the_edges_of_the_text():
+    text = 'error at the start, some filler in the middle, and an error'
+    hits, (snippet,) = build_snippets([('0', text)], terms_pattern(['error']))
+    assert hits == 2
+    assert (snippet['source'], snippet['offset'], snippet['more']) == ('0', 0, False)
+    assert snippet['matches'] == [[0, 5], [len(text) - 5, len(text)]]
+    assert highlighted(snippet) == ['error', 'error']
+
+
+def test_windows_are_cropped_with_offsets_into_the_source():
+    filler = 'x' * 200
+    text = f'{filler} needle {filler}'
+    hits, (snippet,) = build_snippets([('summary', text)], terms_pattern(['needle']))
+    assert hits == 1
+    assert snippet['offset'] == 201 - SNIPPET_CONTEXT and snippet['more']
+    assert snippet['text'] == text[snippet['offset']:snippet['offset'] + len(snippet['text'])]
+    assert highlighted(snippet) == ['needle']
+    assert snippet['matches'] == [[SNIPPET_CONTEXT, SNIPPET_CONTEXT + 6]]
+
+
+def test_overlapping_terms_are_highlighted_once():
+    text = 'the parser failed to parse the parse tree'
+    hits, (snippet,) = build_snippets([('0', text)], terms_pattern(['parse', 'parser', 'parse tree']))
+    assert hits == 3
+    assert highlighted(snippet) == ['parser', 'parse', 'parse tree']
+    spans = snippet['matches']
+    assert all(end <= next_start for (_, end), (next_start, _) in zip(spans, spans[1:]))
+
+
+def test_densest_windows_first_and_capped_per_chat():
+    far = ' ' + 'y' * (MAX_SNIPPET_CHARS + 100) + ' '
+    sources = [('0', 'one hit'), ('1', 'hit hit hit'), ('2', 'hit' + far + 'hit hit'), ('3', 'hit')]
+    hits, snippets = build_snippets(sources, terms_pattern(['hit']), limit=2)
+    assert hits == 8
+    assert [(snippet['source'], len(snippet['matches'])) for snippet in snippets] == [('1', 3), ('2', 2)]
+    assert snippets[1]['offset'] > 0
+    assert build_snippets(sources, terms_pattern(['hit']), limit=0) == (8, [])
+
+
+def test_hits_past_the_window_budget_are_still_counted():
+    many = ' '.join(['err'] * WINDOW_HITS)
+    # A group that matches nothing must not hide the match it belongs to
+    pattern = re.compile(r'err(or)?')
+    hits, snippets = build_snippets([('0', many), ('1', 'err error err')], pattern)
+    assert hits == WINDOW_HITS + 3
+    assert all(snippet['source'] == '0' for snippet in snippets)
+    assert build_snippets([('0', many), ('1', 'err error err')], pattern, max_hits=WINDOW_HITS + 1)[0] == \
+        WINDOW_HITS + 1
+    assert build_snippets([('0', 'error')], re.compile(r'x*'))[0] == 0
@@ -0,0 +1,124 @@
+"""
+Index snapshots: save/load round trips, partial loads and the checks run on them
+"""
+import os
+import shutil
+
+import pytest
+
+from claude_resume.index import ChatIndex
+from claude_resume.store import (MAGIC, _check_consistency, load_index, open_index, read_header, read_section,
+                                 save_index, snapshot_stats, vacuum_snapshot, verify_snapshot)
+
+
+@pytest.fixture
+def built(projects_dir, write_chat, tmp_path):
+    """(index, snapshot path) for a few sessions, one of them held by two files, and one removed"""
+    for i in range(4):
+        write_chat(f's{i}', f's{i}', [f'question about parser {i}', f'answer with cache {i}'], day=i + 1)
+    gone = write_chat('gone', 'gone', ['short lived', 'gone soon'], day=9)
+    index = ChatIndex(projects_dir)
+    index.refresh()
+    shutil.copy(projects_dir / '-work-app' / 's1.jsonl', projects_dir / '-work-app' / 'copy.jsonl')
+    os.remove(gone)
+    index.refresh()
+    path = tmp_path / 'index.bin'
+    save_index(index, path, {'seconds': 0.1, 'files': 5, 'bytes': 100})
+    yield index, path
+    index.close()
+
+
+def test_round_trip_keeps_everything(built):
+    index, path = built
+    header = read_header(path)
+    loaded = load_index(path, header)
+    try:
+        assert loaded.ids == index.ids
+        assert loaded.shadowed == index.shadowed
+        assert loaded.removed == index.removed == {'gone': index.generation}
+        assert (loaded.generation, loaded.index_id) == (index.generation, index.index_id)
+        assert loaded.facet_summary()['projects'] == index.facet_summary()['projects']
+        for chat_id in index.ids:
+            assert loaded.get_chat(chat_id) == index.get_chat(chat_id)
+        for query in ('parser', 'cach', 'project:work-app answer'):
+            mode = 'fuzzy' if query == 'cach' else 'ranked'
+            assert loaded.search(query, mode)['results'] == index.search(query, mode)['results']
+        assert loaded.related('s0') == index.related('s0')
+        assert loaded.suggest('pars') == index.suggest('pars')
+        assert _check_consistency(loaded, header, read_section(path, header, 'texts')) == []
+    finally:
+        loaded.close()
+
+
+def test_partial_load_decodes_no_transcripts(built):
+    index, path = built
+    loaded = load_index(path, read_header(path), sections=())
+    assert loaded.encoded_texts == {}
+    chats, _ = loaded.chats('start', transcripts=False)
+    assert [chat['id'] for chat in chats] == [chat['id'] for chat in index.chats('start')[0]]
+    assert len(loaded.search_index) == 0
+
+
+def test_shadowed_copy_takes_over_after_a_load(built, projects_dir):
+    index, path = built
+    listed = index.ids['s1']
+    os.remove(listed)
+    loaded = load_index(path, read_header(path))
+    try:
+        loaded.refresh()
+        assert loaded.ids['s1'] != listed and 's1' not in loaded.removed
+        assert [chat['id'] for chat, _ in loaded.search('parser 1')['results']][0] == 's1'
+        assert 's1' in loaded.similarity_index.signatures
+        save_index(loaded, path)
+        header = read_header(path)
+        assert _check_consistency(load_index(path, header), header, read_section(path, header, 'texts')) == []
+    finally:
+        loaded.close()
+
+
+def test_open_index_patches_changes_without_saving(built, write_chat, projects_dir):
+    index, path = built
+    saved = path.stat().st_mtime_ns
+    write_chat('new', 'new', ['arrived later', 'yes'], day=10)
+    opened = open_index(path, projects_dir)
+    try:
+        assert 'new' in opened.ids
+        assert path.stat().st_mtime_ns == saved
+    finally:
+        opened.close()
+
+
+def test_unreadable_snapshots_are_ignored(tmp_path, projects_dir, write_chat):
+    path = tmp_path / 'index.bin'
+    path.write_bytes(MAGIC + b'garbage')
+    assert read_header(path) is None
+    write_chat('a', 'a', ['hello there', 'hi'])
+    index = open_index(path, projects_dir)
+    try:
+        assert set(index.ids) == {'a'}
+        assert read_header(path) is not None
+    finally:
+        index.close()
+
+
+def test_verify_and_stats(built, write_chat):
+    index, path = built
+    report = verify_snapshot(path)
+    assert report['problems'] == [] and report['checked'] == 5
+    write_chat('new', 'new', ['arrived later', 'yes'], day=10)
+    report = verify_snapshot(path, deep=False)
+    assert report['problems'] == [] and len(report['new']) == 1 and report['checked'] == 0
+    stats = snapshot_stats(path)
+    assert stats['sessions'] == 5 and stats['changed'] == 1 and stats['build']['files'] == 5
+
+
+def test_vacuum_drops_tombstones_under_a_new_id(built):
+    index, path = built
+    vacuum_snapshot(path)
+    loaded = load_index(path, read_header(path))
+    try:
+        assert loaded.removed == {}
+        assert loaded.index_id != index.index_id
+        assert loaded.ids == index.ids
+    finally:
+        loaded.close()
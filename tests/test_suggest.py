@@ -0,0 +1,80 @@
+"""
+Prefix completion over the sorted vocabulary array
+"""
+from claude_resume import suggest as suggest_module
+from claude_resume.suggest import SuggestIndex, file_names
+
+
+def built(*docs):
+    index = SuggestIndex()
+    for doc_id, words in enumerate(docs):
+        index.add(doc_id, set(words.split()))
+    return index
+
+
+def test_prefixes_at_the_ends_of_the_array():
+    index = built('apple apply banana', 'apple zebra', 'zebras')
+    assert index.suggest('a') == [('apple', 2), ('apply', 1)]
+    assert index.suggest('ap') == [('apple', 2), ('apply', 1)]
+    assert index.suggest('apple') == [('apple', 2)]
+    assert index.suggest('AA') == [] and index.suggest('0') == []
+    assert index.suggest('zebra') == [('zebra', 1), ('zebras', 1)]
+    assert index.suggest('zebrass') == [] and index.suggest('zz') == []
+    assert index.suggest('') == []
+    assert index.terms == ['apple', 'apply', 'banana', 'zebra', 'zebras']
+
+
+def test_counts_merge_and_rank():
+    index = built('deploy debug', 'deploy', 'deploy debug delta', 'dbg')
+    assert index.suggest('d') == [('deploy', 3), ('debug', 2), ('dbg', 1), ('delta', 1)]
+    # Equal counts prefer the shorter term
+    assert index.suggest('d', limit=3) == [('deploy', 3), ('debug', 2), ('dbg', 1)]
+    assert index.suggest('d', limit=1) == [('deploy', 3)]
+    assert index.suggest('d', limit=0) == []
+
+
+def test_a_reindexed_document_drops_its_old_terms():
+    index = built('parser parsing', 'parsing')
+    assert index.suggest('pa') == [('parsing', 2), ('parser', 1)]
+    # The memo for the short prefix must not survive the change
+    index.add(0, {'tokenizer', 'parsing'})
+    assert index.suggest('pa') == [('parsing', 2)]
+    assert index.suggest('parse') == []
+    assert 'parser' not in index.counts
+    index.remove(1)
+    index.remove(1)
+    assert index.suggest('pa') == [('parsing', 1)]
+    index.add(2, {'parser'})
+    assert index.suggest('pars') == [('parser', 1), ('parsing', 1)]
+    assert index.terms.count('parser') == 1
+
+
+def test_dead_terms_are_dropped_from_the_array():
+    index = built(*[f'term{i}' for i in range(20)])
+    index.suggest('t')
+    for doc_id in range(10):
+        index.remove(doc_id)
+    assert index.suggest('term1') == [('term10', 1), ('term11', 1), ('term12', 1), ('term13', 1), ('term14', 1),
+                                      ('term15', 1), ('term16', 1), ('term17', 1), ('term18', 1), ('term19', 1)]
+    assert index.terms == sorted(f'term{i}' for i in range(10, 20))
+    index.remove(10)
+    index.compact()
+    assert index.terms == sorted(f'term{i}' for i in range(11, 20))
+
+
+def test_bulk_additions_are_sorted_in_one_go(monkeypatch):
+    monkeypatch.setattr(suggest_module, 'MERGE_THRESHOLD', 2)
+    index = built('delta alpha', 'charlie bravo echo')
+    assert index.suggest('e') == [('echo', 1)]
+    assert index.terms == ['alpha', 'bravo', 'charlie', 'delta', 'echo']
+    index.add(2, {'beta'})
+    assert index.suggest('b') == [('beta', 1), ('bravo', 1)]
+
+
+def test_extras_and_file_names():
+    index = SuggestIndex()
+    index.add('a', {'readme', 'md'}, {'readme.md', 'readme'})
+    assert index.suggest('read') == [('readme', 1), ('readme.md', 1)]
+    assert file_names('edit src/server.py and README.md, e.g. not this; see pkg-1.2.tar.gz') == \
+        {'server.py', 'readme.md', 'pkg-1.2.tar.gz'}
+    assert file_names('') == set()
@@ -0,0 +1,104 @@
+"""
+Message normalization, timestamp parsing and tool text extraction at ingestion
+"""
+import json
+
+from claude_resume.index import parse_chat_file
+from claude_resume.tracing import RequestTrace
+from claude_resume.utils import (BLOCK_IMAGE, BLOCK_TEXT, BLOCK_THINKING, BLOCK_TOOL_RESULT, BLOCK_TOOL_USE,
+                                 TOOL_BLOCK_CHARS, TOOL_FIELD_CHARS, content_flags, extract_tool_names,
+                                 extract_tool_text, flatten_content, normalize_message, parse_timestamp)
+
+
+def test_string_content():
+    record = normalize_message({'timestamp': None, 'message': {'role': 'user', 'content': 'hello there'}})
+    assert record == {'role': 'user', 'ts': None, 'text': 'hello there', 'flags': BLOCK_TEXT}
+    assert content_flags('') == 0
+
+
+def test_list_content_keeps_text_and_flags_the_other_blocks():
+    content = [
+        {'type': 'thinking', 'thinking': 'hidden'},
+        {'type': 'text', 'text': 'first part'},
+        {'type': 'tool_use', 'name': 'Bash', 'input': {'command': 'ls'}},
+        {'type': 'text', 'text': ''},
+        {'type': 'image', 'source': {}},
+        'not a block',
+        {'type': 'text', 'text': 'second part'},
+    ]
+    record = normalize_message({'message': {'role': 'assistant', 'content': content}})
+    assert record['role'] == 'assistant'
+    assert record['text'] == 'first part\nsecond part'
+    assert record['flags'] == BLOCK_TEXT | BLOCK_TOOL_USE | BLOCK_THINKING | BLOCK_IMAGE
+    assert content_flags([{'type': 'tool_result', 'content': 'ok'}]) == BLOCK_TOOL_RESULT
+
+
+def test_missing_or_odd_content():
+    assert normalize_message({}) == {'role': '', 'ts': None, 'text': '', 'flags': 0}
+    assert normalize_message({'message': None})['text'] == ''
+    assert flatten_content(None) == '' and flatten_content(42) == ''
+    assert content_flags({'type': 'text'}) == 0
+
+
+def test_timestamps_parse_to_epoch_ms():
+    assert parse_timestamp('2025-01-01T00:00:00Z') == 1735689600000
+    assert parse_timestamp('2025-01-01T00:00:00+00:00') == 1735689600000
+    assert parse_timestamp('2025-01-01T02:00:00+02:00') == 1735689600000
+    assert parse_timestamp('2025-01-01T00:00:00.123Z') == 1735689600123
+    assert parse_timestamp('2025-01-01T00:00:00.123456Z') == 1735689600123
+
+
+def test_unusable_timestamps_are_none():
+    for value in (None, '', 'Unknown', 'yesterday', '2025-13-01T00:00:00Z', '2025-01-01T25:00:00Z', 1735689600):
+        assert parse_timestamp(value) is None
+    record = normalize_message({'timestamp': 'not a time', 'message': {'role': 'user', 'content': 'hi'}})
+    assert record['ts'] is None
+
+
+def tool_message(*blocks):
+    return {'message': {'role': 'assistant', 'content': list(blocks)}}
+
+
+def test_tool_text_by_field():
+    messages = [
+        tool_message({'type': 'text', 'text': 'let me look'},
+                     {'type': 'tool_use', 'name': 'Bash', 'input': {'command': 'ls -la', 'timeout': 5}},
+                     {'type': 'tool_use', 'name': 'Edit',
+                      'input': {'edits': [{'old': 'a', 'new': 'b'}], 'flag': None}}),
+        {'message': {'role': 'user', 'content': [
+            {'type': 'tool_result', 'content': 'total 0'},
+            {'type': 'tool_result', 'content': [{'type': 'text', 'text': 'file.txt'}, {'type': 'image'}]}]}},
+        {'message': {'role': 'user', 'content': 'plain text'}},
+    ]
+    assert extract_tool_names(messages) == ['Bash', 'Edit']
+    assert extract_tool_text(messages) == {'tool_use': 'Bash ls -la\n5\nEdit a\nb', 'tool_result': 'total 0\nfile.txt'}
+    assert extract_tool_text([]) == {'tool_use': '', 'tool_result': ''}
+
+
+def test_tool_text_is_capped_per_block_and_per_field():
+    big = 'x' * (TOOL_BLOCK_CHARS * 2)
+    text = extract_tool_text([tool_message({'type': 'tool_result', 'content': big})])['tool_result']
+    assert text == 'x' * TOOL_BLOCK_CHARS
+
+    count = TOOL_FIELD_CHARS // TOOL_BLOCK_CHARS + 5
+    results = [tool_message({'type': 'tool_result', 'content': big}) for _ in range(count)]
+    uses = [tool_message({'type': 'tool_use', 'name': 'Read', 'input': {'path': '/a'}})]
+    fields = extract_tool_text(results + uses)
+    # The cap counts text, not the newlines joining blocks
+    assert len(fields['tool_result'].replace('\n', '')) == TOOL_FIELD_CHARS
+    assert fields['tool_use'] == 'Read /a'
+
+
+def test_tool_extraction_has_its_own_trace_phase(tmp_path):
+    path = tmp_path / 'chat.jsonl'
+    records = [
+        {'sessionId': 's', 'timestamp': '2025-01-01T00:00:00Z',
+         'message': {'role': 'user', 'content': 'list the files'}},
+        dict(tool_message({'type': 'tool_use', 'name': 'Bash', 'input': {'command': 'ls'}}),
+             sessionId='s', timestamp='2025-01-01T00:01:00Z'),
+    ]
+    path.write_text('\n'.join(map(json.dumps, records)) + '\n', encoding='utf-8')
+    trace = RequestTrace()
+    chat = parse_chat_file(path, 'app', trace)
+    assert chat['tools'] == ['Bash'] and chat['toolText']['tool_use'] == 'Bash ls'
+    assert {'parse', 'summary', 'tools', 'filter'} <= set(trace.phases)